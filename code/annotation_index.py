@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Index of annotation and result items by audio path, for lookups without loading the files.
+
+Every item of the indexed JSON files (a list, {"annotation": [...]}, a
+single item, or NDJSON) gets a row (audio path, file, byte offset, byte length, variation
+set) in a SQLite file next to the data; fetching an item seeks to its
+bytes and parses only them. Files are stored relative to the index and
+re-indexed when their size or mtime changes, so the index follows edits
+and new files on the next build or lookup.
+
+Usage:
+  python annotation_index.py build
+  python annotation_index.py build ../data/d/*.json ../data/f/*.json egs/my_model/*/*.json
+  python annotation_index.py get Ses05F_impro01_F000.wav
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+
+DEFAULT_INDEX = '../data/annotation_index.sqlite'
+DEFAULT_FILES = ('../data/d/*.json', '../data/f/*.json', '../data/n/*.json')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    idx INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    variations TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_path ON items(path);
+CREATE INDEX IF NOT EXISTS items_by_name ON items(name);
+CREATE INDEX IF NOT EXISTS items_by_file ON items(file_id);
+"""
+
+
+def _skip_ws(text, pos):
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def _array_start(text):
+    """Position after the '[' of the item array: the top-level list, or the value of "annotation"; None otherwise."""
+    decoder = json.JSONDecoder()
+    pos = _skip_ws(text, 0)
+    if text.startswith('[', pos):
+        return pos + 1
+    if not text.startswith('{', pos):
+        return None
+    pos = _skip_ws(text, pos + 1)
+    while pos < len(text) and text[pos] == '"':
+        key, pos = decoder.raw_decode(text, pos)
+        pos = _skip_ws(text, pos)
+        if text[pos] != ':':
+            return None
+        pos = _skip_ws(text, pos + 1)
+        if key == 'annotation' and text.startswith('[', pos):
+            return pos + 1
+        _, pos = decoder.raw_decode(text, pos)
+        pos = _skip_ws(text, pos)
+        if text.startswith(',', pos):
+            pos = _skip_ws(text, pos + 1)
+    return None
+
+
+def item_spans(file):
+    """
+    (byte offset, byte length, item) of every item of a result or annotation file (a list,
+    {"annotation": [...]}, a single item object, or NDJSON), in order.
+    """
+    with open(file, 'rb') as f:
+        raw = f.read()
+    text = raw.decode('utf-8')
+    try:
+        start = _array_start(text)
+    except json.JSONDecodeError:
+        start = None
+    if start is None:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            item = None
+        if isinstance(item, dict):
+            # a single item object
+            begin = len(raw) - len(raw.lstrip())
+            yield begin, len(raw.rstrip()) - begin, item
+            return
+        offset = 0
+        for line in raw.splitlines(keepends=True):
+            if line.strip():
+                yield offset, len(line.rstrip(b'\r\n')), json.loads(line)
+            offset += len(line)
+        return
+
+    decoder = json.JSONDecoder()
+    ascii_only = len(raw) == len(text)
+    char_pos, byte_pos = 0, 0
+
+    def to_bytes(pos):
+        # character -> byte offset, walking forward only
+        nonlocal char_pos, byte_pos
+        if ascii_only:
+            return pos
+        byte_pos += len(text[char_pos:pos].encode('utf-8'))
+        char_pos = pos
+        return byte_pos
+
+    pos = _skip_ws(text, start)
+    while pos < len(text) and text[pos] != ']':
+        item, end = decoder.raw_decode(text, pos)
+        begin = to_bytes(pos)
+        yield begin, to_bytes(end) - begin, item
+        pos = _skip_ws(text, end)
+        if text.startswith(',', pos):
+            pos = _skip_ws(text, pos + 1)
+
+
+def variation_set(item):
+    variations = item.get('variation_responses') or item.get('instructions', {}).get('variations') or {}
+    return ','.join(variations) if isinstance(variations, dict) else ''
+
+
+class AnnotationIndex:
+    def __init__(self, path=DEFAULT_INDEX):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.root = os.path.dirname(os.path.abspath(path))
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _rel(self, file):
+        return os.path.relpath(os.path.abspath(file), self.root)
+
+    def _abs(self, rel):
+        return os.path.normpath(os.path.join(self.root, rel))
+
+    def _stale(self, rel, size, mtime_ns):
+        try:
+            st = os.stat(self._abs(rel))
+        except OSError:
+            return True
+        return (st.st_size, st.st_mtime_ns) != (size, mtime_ns)
+
+    def add_file(self, file):
+        """(Re-)index file unless it is unchanged since the last time; returns the items indexed, None if unchanged."""
+        rel = self._rel(file)
+        st = os.stat(file)
+        row = self.conn.execute('SELECT id, size, mtime_ns FROM files WHERE file = ?', (rel,)).fetchone()
+        if row and not self._stale(rel, row[1], row[2]):
+            return None
+        rows = [(item['path'], os.path.basename(item['path']), idx, offset, length, variation_set(item))
+                for idx, (offset, length, item) in enumerate(item_spans(file))
+                if isinstance(item, dict) and item.get('path')]
+        with self.conn:
+            if row:
+                self.conn.execute('DELETE FROM items WHERE file_id = ?', (row[0],))
+                self.conn.execute('DELETE FROM files WHERE id = ?', (row[0],))
+            file_id = self.conn.execute('INSERT INTO files (file, size, mtime_ns) VALUES (?, ?, ?)',
+                                        (rel, st.st_size, st.st_mtime_ns)).lastrowid
+            self.conn.executemany(
+                'INSERT INTO items (path, name, file_id, idx, offset, length, variations) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [(path, name, file_id, idx, offset, length, var) for path, name, idx, offset, length, var in rows])
+        return len(rows)
+
+    def prune(self):
+        """Drop the files that no longer exist."""
+        gone = [(fid,) for fid, rel in self.conn.execute('SELECT id, file FROM files') if not os.path.exists(self._abs(rel))]
+        with self.conn:
+            self.conn.executemany('DELETE FROM items WHERE file_id = ?', gone)
+            self.conn.executemany('DELETE FROM files WHERE id = ?', gone)
+        return len(gone)
+
+    def lookup(self, path):
+        """[(file, item index, offset, length, variation set)] of an audio path, or of a file name like 'x.wav'."""
+        column = 'path' if os.sep in path or '/' in path else 'name'
+        rows = self.conn.execute(
+            f"""SELECT f.file, f.size, f.mtime_ns, i.idx, i.offset, i.length, i.variations
+                FROM items i JOIN files f ON f.id = i.file_id WHERE i.{column} = ? ORDER BY f.file, i.idx""",
+            (path,)).fetchall()
+        stale = {rel for rel, size, mtime_ns, *_ in rows if self._stale(rel, size, mtime_ns)}
+        if stale:
+            for rel in stale:
+                if os.path.exists(self._abs(rel)):
+                    self.add_file(self._abs(rel))
+            self.prune()
+            return self.lookup(path)
+        return [(self._abs(rel), idx, offset, length, variations) for rel, _, _, idx, offset, length, variations in rows]
+
+    def fetch(self, path):
+        """[(file, item)] of every indexed item of an audio path, read by seeking to its bytes."""
+        out = []
+        for file, _, offset, length, _ in self.lookup(path):
+            with open(file, 'rb') as f:
+                f.seek(offset)
+                out.append((file, json.loads(f.read(length))))
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index of annotation and result items by audio path.')
+    parser.add_argument('--index', default=DEFAULT_INDEX, help='SQLite file')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('build', help='index (or re-index changed) files')
+    p.add_argument('files', nargs='*', help=f"JSON / NDJSON files (default: {' '.join(DEFAULT_FILES)})")
+    p = sub.add_parser('get', help='print every item of an audio path, across the indexed files')
+    p.add_argument('path', help="audio path as in the annotations, or just its file name")
+    args = parser.parse_args()
+
+    with AnnotationIndex(args.index) as index:
+        if args.cmd == 'build':
+            files = args.files or sorted(f for pattern in DEFAULT_FILES for f in glob.glob(pattern))
+            for file in files:
+                n = index.add_file(file)
+                print(f'{file}: {"unchanged" if n is None else f"{n} items"}', file=sys.stderr)
+            pruned = index.prune()
+            if pruned:
+                print(f'{pruned} files no longer exist, dropped', file=sys.stderr)
+        else:
+            found = index.fetch(args.path)
+            if not found:
+                sys.exit(f'{args.path} is not in {args.index}')
+            print(json.dumps([{'file': file, 'item': item} for file, item in found], indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
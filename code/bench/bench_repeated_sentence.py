@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Regression benchmark for scoring.gates.is_repeated_sentence.
+
+Checks the linear-time periodicity check against the original divisor-based
+implementation on random and degenerate looping responses (the kind some of
+the weaker models emit for ASR/AAC), then times both.
+
+Usage: PYTHONPATH=metric python bench/bench_repeated_sentence.py [--words 20000]
+"""
+import argparse
+import random
+import re
+import time
+
+from scoring.gates import is_repeated_sentence
+
+
+def reference_is_repeated_sentence(sentence: str) -> bool:
+    normalized = re.sub(r"[^\w\s]", " ", sentence).lower()
+    words = normalized.split()
+    n = len(words)
+    if n < 2:
+        return False
+    for size in range(1, n // 2 + 1):
+        if n % size == 0:
+            unit = words[:size]
+            if unit * (n // size) == words:
+                return True
+    return False
+
+
+VOCAB = ["the", "audio", "speaker", "is", "a", "man", "saying", "hello", "again", "and"]
+
+
+def looped(rng, unit_len, n_words):
+    unit = [rng.choice(VOCAB) for _ in range(unit_len)]
+    return [unit[i % unit_len] for i in range(n_words)]
+
+
+def cases(rng, n_words):
+    out = []
+    # exact loops, loops with a broken tail, and near-loops with one word changed
+    for unit_len in (1, 2, 3, 7, 12, 50):
+        words = looped(rng, unit_len, n_words - n_words % unit_len)
+        out.append(" ".join(words))
+        out.append(" ".join(words + words[:max(1, unit_len // 2)]))
+        broken = list(words)
+        broken[len(broken) // 2] = "zzz"
+        out.append(" ".join(broken))
+    # prime length responses have no proper divisor at all
+    out.append(" ".join(looped(rng, 1, 7919)))
+    # highly composite lengths with the loop broken by the very last word:
+    # the divisor scan compares almost the whole response once per divisor
+    for n in (5040, 55440, 720720):
+        words = ["again"] * (n - 1) + ["hello"]
+        out.append(" ".join(words))
+    # short random responses with punctuation and mixed case
+    for _ in range(2000):
+        k = rng.randint(0, 12)
+        words = [rng.choice(VOCAB + ["Hello,", "AGAIN."]) for _ in range(k)]
+        if k and rng.random() < 0.5:
+            words = words * rng.randint(2, 4)
+        out.append(" ".join(words))
+    return out
+
+
+def timed(fn, inputs):
+    start = time.perf_counter()
+    results = [fn(s) for s in inputs]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark is_repeated_sentence on degenerate looping outputs")
+    parser.add_argument("--words", type=int, default=20000, help="length of the long looping responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    inputs = cases(random.Random(args.seed), args.words)
+    new, t_new = timed(is_repeated_sentence, inputs)
+    old, t_old = timed(reference_is_repeated_sentence, inputs)
+
+    mismatches = [s[:80] for s, a, b in zip(inputs, new, old) if a != b]
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} mismatches, e.g. {mismatches[0]!r}")
+    print(f"{len(inputs)} responses agree ({sum(new)} repeated)")
+    print(f"linear:    {t_new * 1000:8.1f} ms")
+    print(f"reference: {t_old * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
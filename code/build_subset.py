@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Deterministic stratified subsets of ISA-Bench ("ISA-Bench-lite") for smoke runs.
+
+Items are put into strata by task, class label (emotion / gender) and the
+set of instruction variations they carry; every stratum keeps the same
+fraction of its items (at least --min_per_stratum), picked by a seeded hash
+of the audio path. The pick depends only on the path, the stratum and the
+fraction, so a result file selects exactly the items of the subset
+annotation it was made from, and a smaller fraction is always contained in
+a larger one.
+
+`check` scores the reference models' result files (egs/<model>/...) on
+subsets of several fractions and reports how well their IFR / RPS areas
+correlate with the full-benchmark areas from collect_all_metrics.json, so
+the smallest fraction that keeps the ranking can be picked.
+
+Usage:
+  python build_subset.py build --fraction 0.1
+  python build_subset.py check --fractions 0.05 0.1 0.2 --data_dir egs
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from calc_area import baseline_models, compute_area_scores
+from compare import DIMS, results_path
+from metric import TASK_SCORERS, scorer_script
+from scoring.results_io import load_results
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# tasks whose `text` is a class label, stratified on
+LABEL_TASKS = ('emotion_recognition', 'gender_recognition')
+
+
+def stratum(item):
+    """(task, label, variations) of an annotation or result item."""
+    task = item.get('task') or ''
+    label = str(item.get('text', '')).strip().lower() if task in LABEL_TASKS else ''
+    variations = item.get('variation_responses') or item.get('instructions', {}).get('variations') or {}
+    return task, label, ','.join(sorted(variations))
+
+
+def select(items, fraction, min_per_stratum=5, seed=0):
+    """Indices of the subset items, in input order."""
+    strata = {}
+    for idx, item in enumerate(items):
+        strata.setdefault(stratum(item), []).append(idx)
+    keep = []
+    for members in strata.values():
+        k = min(len(members), max(min_per_stratum, round(fraction * len(members))))
+        ranked = sorted(members, key=lambda i: hashlib.sha1(f"{seed}:{items[i].get('path')}".encode('utf-8')).hexdigest())
+        keep.extend(ranked[:k])
+    return sorted(keep)
+
+
+def build(annotations, output_dir, fraction, min_per_stratum=5, seed=0):
+    """Write the subset of every annotation file to output_dir/<dim>/<name> and return the manifest."""
+    manifest = {'fraction': fraction, 'min_per_stratum': min_per_stratum, 'seed': seed, 'files': {}}
+    for path in annotations:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        items = data['annotation'] if isinstance(data, dict) else data
+        keep = select(items, fraction, min_per_stratum, seed)
+        name = os.path.join(os.path.basename(os.path.dirname(path)), os.path.basename(path))
+        out = os.path.join(output_dir, name)
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump({'annotation': [items[i] for i in keep]}, f, indent=2, ensure_ascii=False)
+        sizes = {}
+        for item in items:
+            sizes.setdefault('|'.join(stratum(item)), [0, 0])[1] += 1
+        for i in keep:
+            sizes['|'.join(stratum(items[i]))][0] += 1
+        manifest['files'][name] = {'items': len(keep), 'of': len(items), 'strata': sizes}
+        print(f'{name}: {len(keep)} of {len(items)} items, {len(sizes)} strata', file=sys.stderr)
+    with open(os.path.join(output_dir, 'subset.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    return manifest
+
+
+def score_subset(job):
+    """(key, scorer output) of the subset (fraction) of one result file; (key, None) if the scorer failed."""
+    key, (dim, task, path, fraction, min_per_stratum, seed) = job
+    items = load_results(path)
+    subset = [items[i] for i in select(items, fraction, min_per_stratum, seed)]
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        p for p in (os.path.join(CODE_DIR, 'metric'), os.environ.get('PYTHONPATH')) if p))
+    with tempfile.TemporaryDirectory() as workdir:
+        sub_path = os.path.join(workdir, 'subset.ndjson')
+        with open(sub_path, 'w', encoding='utf-8') as f:
+            for item in subset:
+                f.write(json.dumps(item, ensure_ascii=False) + '\n')
+        proc = subprocess.run([sys.executable, os.path.join(CODE_DIR, scorer_script(dim, task)), sub_path],
+                              capture_output=True, text=True, env=env)
+    try:
+        if proc.returncode == 0:
+            return key, json.loads(proc.stdout)
+    except json.JSONDecodeError:
+        pass
+    _, model, dim, task = key
+    error = (proc.stderr.strip().splitlines() or ['no output'])[-1]
+    print(f'Skipping {model} {dim}/{task}, the scorer failed: {error}', file=sys.stderr)
+    return key, None
+
+
+def ranks(values):
+    """Ranks 1..n, ties get their average rank."""
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values, kind='mergesort')
+    out = np.empty(len(values))
+    out[order] = np.arange(1, len(values) + 1)
+    for v in np.unique(values):
+        tied = values == v
+        out[tied] = out[tied].mean()
+    return out
+
+
+def kendall_tau(x, y):
+    """Kendall's tau-b."""
+    concordant = discordant = ties_x = ties_y = 0
+    for i in range(len(x)):
+        for j in range(i + 1, len(x)):
+            dx, dy = np.sign(x[i] - x[j]), np.sign(y[i] - y[j])
+            if dx == 0 and dy == 0:
+                continue
+            if dx == 0:
+                ties_x += 1
+            elif dy == 0:
+                ties_y += 1
+            elif dx == dy:
+                concordant += 1
+            else:
+                discordant += 1
+    denom = np.sqrt((concordant + discordant + ties_x) * (concordant + discordant + ties_y))
+    return float((concordant - discordant) / denom) if denom else float('nan')
+
+
+def rounded(value, digits=4):
+    """value rounded, None (JSON null) where it is undefined (constant scores)."""
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def correlations(full, subset):
+    """
+    Pearson, Spearman and Kendall correlation of two {model: score} dicts over their common models;
+    None where the scores of either side are constant.
+    """
+    models = [m for m in full if m in subset]
+    x = np.array([full[m] for m in models], dtype=float)
+    y = np.array([subset[m] for m in models], dtype=float)
+    if len(models) < 3:
+        return {'models': len(models)}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pearson = float(np.corrcoef(x, y)[0, 1])
+        spearman = float(np.corrcoef(ranks(x), ranks(y))[0, 1])
+    return {
+        'models': len(models),
+        'pearson': rounded(pearson),
+        'spearman': rounded(spearman),
+        'kendall': rounded(kendall_tau(x, y)),
+        'max_abs_diff': round(float(np.max(np.abs(x - y))), 2),
+    }
+
+
+def check(data_dir, baseline_path, fractions, models=None, min_per_stratum=5, seed=0, jobs=1):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    models = [m for m in (models or baseline_models) if m in baseline and os.path.isdir(os.path.join(data_dir, m))]
+    if len(models) < 3:
+        raise ValueError(f'need result files of at least 3 models of {baseline_path} under {data_dir}, found {models}')
+
+    work = []
+    for fraction in fractions:
+        for model in models:
+            for dim in DIMS:
+                for task in (['only'] if dim == 'n' else sorted(TASK_SCORERS)):
+                    path = results_path(data_dir, model, dim, task)
+                    if os.path.exists(path):
+                        work.append(((fraction, model, dim, task), (dim, task, path, fraction, min_per_stratum, seed)))
+    if jobs > 1 and len(work) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            scored = dict(pool.map(score_subset, work))
+    else:
+        scored = dict(map(score_subset, work))
+    failed = sorted({key[1:] for key, res in scored.items() if res is None})
+    scored = {key: res for key, res in scored.items() if key[1:] not in failed}
+
+    # the d and f areas average over the scored tasks of the dimension: a model needs one of each
+    missing = {m: [dim for dim in ('d', 'f') if not any(key[1:3] == (m, dim) for key in scored)] for m in models}
+    incomplete = [m for m in models if missing[m]]
+    for model in incomplete:
+        print(f'Skipping {model}: no scored {" or ".join(missing[model])} task', file=sys.stderr)
+    models = [m for m in models if m not in incomplete]
+    if len(models) < 3:
+        raise ValueError(f'need scored d and f results of at least 3 models under {data_dir}, found {models}')
+    scored = {key: res for key, res in scored.items() if key[1] in models}
+
+    # the full-benchmark areas of the same models and (dim, task)s, so that both are normalized alike
+    scored_tasks = {(model, dim, task) for (_, model, dim, task) in scored}
+    full = compute_area_scores({m: {dim: {task: res for task, res in baseline[m].get(dim, {}).items()
+                                          if (m, dim, task) in scored_tasks}
+                                    for dim in DIMS}
+                                for m in models})
+    report = {'models': models, 'min_per_stratum': min_per_stratum, 'seed': seed,
+              'skipped': [{'model': m, 'dim': d, 'task': t} for m, d, t in failed],
+              'skipped_models': incomplete, 'fractions': {}}
+    for fraction in fractions:
+        entries = {m: {'d': {}, 'f': {}, 'n': {}} for m in models}
+        for (frac, model, dim, task), res in scored.items():
+            if frac == fraction:
+                entries[model][dim][task] = res
+        sub = compute_area_scores(entries)
+        report['fractions'][str(fraction)] = {
+            area: dict(correlations(full[area], sub[area]),
+                       full={m: full[area].get(m) for m in models}, subset={m: sub[area].get(m) for m in models})
+            for area in ('ifr_area', 'rps_area')
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stratified ISA-Bench subsets for smoke runs.')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('build', help='write the subset annotation files')
+    p.add_argument('annotations', nargs='*', help='annotation files (default: ../data/d/*.json and ../data/f/*.json)')
+    p.add_argument('--fraction', type=float, default=0.1, help='share of every stratum kept')
+    p.add_argument('--output_dir', default='../data/lite', help='subset files go to <output_dir>/<dim>/<name>')
+    p = sub.add_parser('check', help='correlate subset and full-benchmark areas of the reference models')
+    p.add_argument('--fractions', type=float, nargs='+', default=[0.05, 0.1, 0.2, 0.5])
+    p.add_argument('--data_dir', default='egs', help='where the model result folders are')
+    p.add_argument('--baseline', default='../data/collect_all_metrics.json', help='full-benchmark metrics of the models')
+    p.add_argument('--models', nargs='+', default=None, help='default: the reference models with results under --data_dir')
+    p.add_argument('--min_kendall', type=float, default=0.9, help='ranking agreement a fraction needs to be recommended')
+    p.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='result files scored in parallel')
+    p.add_argument('--output', help='also write the report JSON here')
+    for p in sub.choices.values():
+        p.add_argument('--min_per_stratum', type=int, default=5)
+        p.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.cmd == 'build':
+        annotations = args.annotations or sorted(glob.glob('../data/d/*.json') + glob.glob('../data/f/*.json'))
+        build(annotations, args.output_dir, args.fraction, args.min_per_stratum, args.seed)
+        print(f'Wrote {args.output_dir}', file=sys.stderr)
+        return
+
+    report = check(args.data_dir, args.baseline, sorted(args.fractions), args.models, args.min_per_stratum,
+                   args.seed, args.jobs)
+    keeps = [float(frac) for frac, res in report['fractions'].items()
+             if all((res[area].get('kendall') or -1) >= args.min_kendall for area in ('ifr_area', 'rps_area'))]
+    report['recommended_fraction'] = min(keeps) if keeps else None
+    output = json.dumps(report, indent=2, ensure_ascii=False, allow_nan=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,40 +1,52 @@
 import numpy as np
+import argparse
+import copy
+import hashlib
 import json
-import math
-from typing import Iterable, List
-import sys
-
-def radar_polygon_area(values: Iterable[float], normalize: bool = False, max_value: float = None) -> float:
-    vals: List[float] = list(values)
-    n = len(vals)
+import os
+import warnings
+from functools import lru_cache
+from typing import Iterable
+
+from results_db import ResultsDB
+
+@lru_cache(maxsize=None)
+def axis_trig(n: int):
+    # cos/sin of the n evenly spaced radar axes, computed once per axis count
+    theta = 2 * np.pi * np.arange(n) / n
+    return np.cos(theta), np.sin(theta)
+
+def radar_polygon_areas(matrix, normalize: bool = False, max_value: float = None) -> np.ndarray:
+    """Areas of many radar polygons at once: one row per model, one column per axis."""
+    vals = np.atleast_2d(np.asarray(matrix, dtype=float))
+    n = vals.shape[1]
     if n < 3:
-        return 0.0  
+        return np.zeros(len(vals))
 
     if normalize:
         if max_value is None:
-            m = max(vals)
+            m = vals.max(axis=1, keepdims=True)
         else:
-            m = max_value
-        if m == 0:
+            m = np.full((len(vals), 1), float(max_value))
+        if np.any(m == 0):
             raise ValueError("Max_value for normalizing = 0!")
-        vals = [v / m for v in vals]
+        vals = vals / m
 
-    pts = []
-    for i, r in enumerate(vals):
-        theta = 2 * math.pi * i / n
-        x = r * math.cos(theta)
-        y = r * math.sin(theta)
-        pts.append((x, y))
+    cos, sin = axis_trig(n)
+    x = vals * cos
+    y = vals * sin
+    # shoelace over (x_i, y_i) -> (x_{i+1}, y_{i+1}), closing the polygon with np.roll
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y, axis=1))
 
-    area = 0.5 * abs(sum(x0 * y1 - x1 * y0
-                         for (x0, y0), (x1, y1) in zip(pts, pts[1:] + [pts[0]])))
-    return area
+def radar_polygon_area(values: Iterable[float], normalize: bool = False, max_value: float = None) -> float:
+    return float(radar_polygon_areas([list(values)], normalize=normalize, max_value=max_value)[0])
 
 d_labels = ["default", "case", "robust", "semantic_equal", "alter_symbol"]
 t_labels = ["constrain", "case", "decoration", "json"]
 n_labels = ["2-task", "3-task"]
 
-models = ['desta2.5-audio', 'gemini-2.5-pro', 'qwen2.5_omni', 'gpt-4o-audio-preview', 'qwen2_audio', 'kimi-audio', 'phi4-multimodal-instruct', 'salmonn', 'wavllm']
+# the reference models of ISA-Bench, in data/collect_all_metrics.json
+baseline_models = ['desta2.5-audio', 'gemini-2.5-pro', 'qwen2.5_omni', 'gpt-4o-audio-preview', 'qwen2_audio', 'kimi-audio', 'phi4-multimodal-instruct', 'salmonn', 'wavllm']
 
 tasks = ['asr', 'gr', 'ser', 's2tt', 'aac']
 
@@ -57,7 +69,52 @@ task2metrics = {
     'aac': 'METEOR',
 }
 
-def calc_metrics(model_dict):
+def n_block(model_dict, label):
+    # '2-task' -> model_dict['n']['only']['single-stage']['2-TASK']
+    return model_dict.get('n', {}).get('only', {}).get('single-stage', {}).get(label.upper(), {})
+
+def collect_n_labels(data):
+    # the default 2/3-task axes plus any larger compositions found in the data
+    nums = {int(label.split('-')[0]) for label in n_labels}
+    for model_dict in data.values():
+        for key in model_dict.get('n', {}).get('only', {}).get('single-stage', {}):
+            if key.endswith('-TASK') and key.split('-')[0].isdigit():
+                nums.add(int(key.split('-')[0]))
+    return [f"{n}-task" for n in sorted(nums)]
+
+def lookup(d, *keys):
+    for key in keys:
+        if not isinstance(d, dict) or key not in d:
+            return np.nan
+        d = d[key]
+    return d
+
+def metric_matrix(data, model_names, axes):
+    """models x axes matrix of raw metrics; axes are key paths into a model dict, NaN where missing."""
+    return np.array([[lookup(data[model], *axis) for axis in axes] for model in model_names], dtype=float).reshape(len(model_names), len(axes))
+
+def normalize_axes(matrix, metric_ids):
+    """
+    Normalize every column (axis) of a models x axes matrix to [0, 1] over the models that have it:
+    val / max for 'higher' metrics, min / val for 'lower' ones (see metric_feats). NaN stays NaN.
+    """
+    vals = np.asarray(matrix, dtype=float)
+    higher = np.array([metric_feats[metric_id] == 'higher' for metric_id in metric_ids], dtype=bool)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN axes
+        maxval = np.nanmax(vals, axis=0) if vals.size else np.zeros(vals.shape[1])
+        minval = np.nanmin(vals, axis=0) if vals.size else np.zeros(vals.shape[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normed = np.where(higher, vals / (maxval + eps), minval / (vals + eps))
+    return np.round(normed, 2)
+
+def calc_metrics(model_dict, n_labels=n_labels):
+    """
+    Aggregate one model's collected metrics: adds the derived 'case' / 'robust' / 'semantic_equal' /
+    'decoration' entries, the per-dimension 'total' and the 'overall' IFR axes. Returns a new dict;
+    model_dict itself is left untouched.
+    """
+    model_dict = copy.deepcopy(model_dict)
 
     total_d = {
         'case': 0.0,
@@ -120,211 +177,285 @@ def calc_metrics(model_dict):
     total_t = {key: round(total_t[key] / t_norm[key], 2) for key in total_t.keys()}
     model_dict['f']['total'] = total_t
 
-    total_n = {
-        '2-task': 0.0,
-        '3-task': 0.0,
-    }
+    total_n = {label: 0.0 for label in n_labels}
 
     if 'only' in model_dict['n']:
-        val2task = 0.0
-        val3task = 0.0
-        for item in model_dict['n']['only']['single-stage']['2-TASK'].values():
-            val2task += item['ifr']
-        val2task /= len(model_dict['n']['only']['single-stage']['2-TASK'].values())
-
-        for item in model_dict['n']['only']['single-stage']['3-TASK'].values():
-            val3task += item['ifr']
-        val3task /= len(model_dict['n']['only']['single-stage']['3-TASK'].values())
-
-        total_n['2-task'] = round(val2task, 2)
-        total_n['3-task'] = round(val3task, 2)
+        for label in n_labels:
+            block = n_block(model_dict, label)
+            if block:
+                total_n[label] = round(sum(item['ifr'] for item in block.values()) / len(block), 2)
     model_dict['n']['total'] = total_n
 
     model_dict['overall'] = {f"D-{k}": total_d[k] for k in total_d.keys()}
     model_dict['overall'].update({f"F-{k}": total_t[k] for k in total_t.keys()})
     model_dict['overall'].update({f"N-{k}": total_n[k] for k in total_n.keys()})
+    return model_dict
+
+def pad_n_labels(aggregated, n_labels):
+    """A cached aggregate extended with 0.0 for N-task axes its model has no results for."""
+    missing = [label for label in n_labels if f"N-{label}" not in aggregated['overall']]
+    if not missing:
+        return aggregated
+    aggregated = dict(aggregated, overall=dict(aggregated['overall']))
+    aggregated['overall'].update({f"N-{label}": 0.0 for label in missing})
+    return aggregated
+
+# bump when calc_metrics changes, so stale baseline aggregates are not reused
+AGGREGATE_CACHE_VERSION = 1
+
+def load_baseline_aggregates(path, cache_dir=None):
+    """
+    Load the reference metrics (data/collect_all_metrics.json) together with their calc_metrics()
+    aggregates. The aggregates are cached in cache_dir (default: .cache/ next to path) under the file's
+    SHA-256 and AGGREGATE_CACHE_VERSION, so they are only recomputed when either changes.
+    Returns (metrics, aggregates), both keyed by model name.
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    data = json.loads(raw)
+
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), ".cache")
+    cache_path = os.path.join(cache_dir, f"aggregates-v{AGGREGATE_CACHE_VERSION}-{digest[:16]}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r") as f:
+            cached = json.load(f)
+        if cached.get("version") == AGGREGATE_CACHE_VERSION and cached.get("sha256") == digest:
+            return data, cached["models"]
+
+    labels_n = collect_n_labels(data)
+    aggregates = {model: calc_metrics(model_dict, labels_n) for model, model_dict in data.items()}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": AGGREGATE_CACHE_VERSION, "sha256": digest, "models": aggregates}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # read-only data dir: just go without the cache
+    return data, aggregates
 
 
-def norm_metrics(data):
-    # Normalize metrics to [0, 1] based on whether higher or lower is better
-    norm_data = {}
-
-    # d-dimension
-    norm_data['d'] = {}
-    for label in d_labels:
-        norm_data['d'][label] = {}
-        for task in tasks:
-            metric_id = task2metrics[task]
-            model2metrics = {model: data[model]['d'][task][label][metric_id] for model in data.keys() if 'd' in data[model] and task in data[model]['d'] and label in data[model]['d'][task] and metric_id in data[model]['d'][task][label]}
-            values = np.array(list(model2metrics.values()))
-            if metric_feats[metric_id] == 'higher':
-                maxval = np.max(values)
-                normed = {model: round(val / (maxval + eps), 2) for model, val in model2metrics.items()}
-            else:
-                minval = np.min(values)
-                normed = {model: round(minval / (val + eps), 2) for model, val in model2metrics.items()}
-            norm_data['d'][label][task] = normed
-    
-    # t-dimension
-    norm_data['f'] = {}
-    for label in t_labels:
-        norm_data['f'][label] = {}
-        for task in tasks:
-            if label == 'case' and task == 's2tt':
-                continue
-            metric_id = task2metrics[task]
-            model2metrics = {model: data[model]['f'][task][label][metric_id] for model in data.keys() if 'f' in data[model] and task in data[model]['f'] and label in data[model]['f'][task] and metric_id in data[model]['f'][task][label]}
-            values = np.array(list(model2metrics.values()))
-            # print(label, task)
-            if metric_feats[metric_id] == 'higher':
-                maxval = np.max(values)
-                normed = {model: round(val / (maxval + eps), 2) for model, val in model2metrics.items()}
-            else:
-                minval = np.min(values)
-                normed = {model: round(minval / (val + eps), 2) for model, val in model2metrics.items()}
-            norm_data['f'][label][task] = normed
-
-    # n-dimension
-    def metric_dict(model):
-        return data[model]['n']['only']['single-stage']['2-TASK']
-
-    def metric_dict_alt(model):
-        return data[model]['n']['only']['single-stage']['3-TASK']
-
-    norm_data['n'] = {}
-    for label in n_labels:
-        norm_data['n'][label] = {}
-        if label == '2-task':
-
-            asr_metrics = {model: metric_dict(model)['ASR']['wer'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '2-TASK' in data[model]['n']['only']['single-stage'] and 'ASR' in data[model]['n']['only']['single-stage']['2-TASK'] and 'wer' in data[model]['n']['only']['single-stage']['2-TASK']['ASR']}
-
-            ser_metrics = {model: metric_dict(model)['SER']['acc'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '2-TASK' in data[model]['n']['only']['single-stage'] and 'SER' in data[model]['n']['only']['single-stage']['2-TASK'] and 'acc' in data[model]['n']['only']['single-stage']['2-TASK']['SER']}
-
-            gr_metrics = {model: metric_dict(model)['GR']['acc'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '2-TASK' in data[model]['n']['only']['single-stage'] and 'GR' in data[model]['n']['only']['single-stage']['2-TASK'] and 'acc' in data[model]['n']['only']['single-stage']['2-TASK']['GR']}
-
-            asr_values = np.array(list(asr_metrics.values()))
-            ser_values = np.array(list(ser_metrics.values()))
-            gr_values = np.array(list(gr_metrics.values()))
-
-            asr_minval = np.min(asr_values)
-            ser_maxval = np.max(ser_values)
-            gr_maxval = np.max(gr_values)
-
-            normed_asr = {model: round(asr_minval / (val + eps), 2) for model, val in asr_metrics.items()}
-            normed_ser = {model: round(val / (ser_maxval + eps), 2) for model, val in ser_metrics.items()}
-            normed_gr = {model: round(val / (gr_maxval + eps), 2) for model, val in gr_metrics.items()}
-
-            normed = {model: round((normed_asr.get(model, 0) + normed_ser.get(model, 0) + normed_gr.get(model, 0)) / 3, 2) for model in set(list(normed_asr.keys()) + list(normed_ser.keys()) + list(normed_gr.keys()))}
-            norm_data['n'][label] = normed
-        else:
-
-            asr_metrics = {model: metric_dict_alt(model)['ASR']['wer'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '3-TASK' in data[model]['n']['only']['single-stage'] and 'ASR' in data[model]['n']['only']['single-stage']['3-TASK'] and 'wer' in data[model]['n']['only']['single-stage']['3-TASK']['ASR']}
-
-            ser_metrics = {model: metric_dict_alt(model)['SER']['acc'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '3-TASK' in data[model]['n']['only']['single-stage'] and 'SER' in data[model]['n']['only']['single-stage']['3-TASK'] and 'acc' in data[model]['n']['only']['single-stage']['3-TASK']['SER']}
-
-            gr_metrics = {model: metric_dict_alt(model)['GR']['acc'] for model in data.keys() if 'n' in data[model] and 'only' in data[model]['n'] and 'single-stage' in data[model]['n']['only'] and '3-TASK' in data[model]['n']['only']['single-stage'] and 'GR' in data[model]['n']['only']['single-stage']['3-TASK'] and 'acc' in data[model]['n']['only']['single-stage']['3-TASK']['GR']}
-
-            asr_values = np.array(list(asr_metrics.values()))
-            ser_values = np.array(list(ser_metrics.values()))
-            gr_values = np.array(list(gr_metrics.values()))
-
-            asr_minval = np.min(asr_values)
-            ser_maxval = np.max(ser_values)
-            gr_maxval = np.max(gr_values)
-
-            normed_asr = {model: round(asr_minval / (val + eps), 2) for model, val in asr_metrics.items()}
-            normed_ser = {model: round(val / (ser_maxval + eps), 2) for model, val in ser_metrics.items()}
-            normed_gr = {model: round(val / (gr_maxval + eps), 2) for model, val in gr_metrics.items()}
-
-            normed = {model: round((normed_asr.get(model, 0) + normed_ser.get(model, 0) + normed_gr.get(model, 0)) / 3, 2) for model in set(list(normed_asr.keys()) + list(normed_ser.keys()) + list(normed_gr.keys()))}
-            norm_data['n'][label] = normed
-
-    #  complete 
-    # for dim in ['d', 'f']:
-    #     for label in norm_data[dim].keys():
-    #         for task in norm_data[dim][label].keys():
-    #             for model in models:
-    #                 # print(dim, label, task, model)
-    #                 if not model in norm_data[dim][label][task]:
-    #                     norm_data[dim][label][task][model] = 0.0
-    for label in norm_data['n'].keys():
-        for model in models:
-            if not model in norm_data['n'][label]:
-                norm_data['n'][label][model] = 0.0
-
-    return norm_data
-
 def norm_area(areas):
     ref_area = areas['ref']
-    normed_areas = {key: round(val / ref_area * 100, 1) for key, val in areas.items() if key != 'ref'}
+    normed_areas = {key: round(float(val) / ref_area * 100, 1) for key, val in areas.items() if key != 'ref'}
     return normed_areas
 
-def calc_overall_normed(normed_data):
-    res = {}
+def calc_overall_normed(data, model_names, n_labels=n_labels):
+    """
+    Normalized (RPS) score of every model on every overall axis, as a len(model_names) x len(overall_labels)
+    matrix. Each (label, task) metric is normalized across all models in data; D/F axes average a model's
+    available tasks, N axes average all tasks of the composition with missing ones counted as 0.
+    """
+    all_models = list(data.keys())
+    rows = [all_models.index(model) for model in model_names]
+    cols = []
     for label in d_labels:
-        model2avg = {model: np.mean([normed_data['d'][label][task][model] for task in tasks if model in normed_data['d'][label][task]]) for model in models}
-        res[f"D-{label}"] = {k: round(w, 2) for k, w in model2avg.items()}
+        metric_ids = [task2metrics[task] for task in tasks]
+        mat = metric_matrix(data, all_models, [('d', task, label, task2metrics[task]) for task in tasks])
+        cols.append(nanmean_rows(normalize_axes(mat, metric_ids)))
     for label in t_labels:
-        model2avg = {model: np.mean([normed_data['f'][label][task][model] for task in tasks if task in normed_data['f'][label] and (model in normed_data['f'][label][task])]) for model in models}
-        res[f"F-{label}"] = {k: round(w, 2) for k, w in model2avg.items()}
+        label_tasks = [task for task in tasks if not (label == 'case' and task == 's2tt')]
+        metric_ids = [task2metrics[task] for task in label_tasks]
+        mat = metric_matrix(data, all_models, [('f', task, label, task2metrics[task]) for task in label_tasks])
+        cols.append(nanmean_rows(normalize_axes(mat, metric_ids)))
     for label in n_labels:
-        res[f"N-{label}"] = normed_data['n'][label]
-    return res
-
-# load data
-if len(sys.argv) < 2:
-    print("Usage: python calc_area.py <tested_model_name>")
-    sys.exit(1)
-test_model_key = sys.argv[1] 
-path = f"egs/{test_model_key}/output/{test_model_key}_collect_all_metrics.json"
-isa_orig_path = "../data/collect_all_metrics.json"
-
-with open(isa_orig_path, "r") as f:
-    data = json.load(f)
-
-with open(path, "r") as f:
-    test_data = json.load(f)
-data[test_model_key] = test_data[test_model_key]
-models.append(test_model_key)
-
-for model in data.keys():
-    calc_metrics(data[model])
-
-normed_data = norm_metrics(data)
-
-overall_labels = [f"D-{s}" for s in d_labels] + [f"F-{s}" for s in t_labels] + [f"N-{s}" for s in n_labels]
-
-data_dict = {}
-
-for model in models:
-    if 'overall' in data[model]:
-        data_dict[model] = [data[model]['overall'][label] for label in overall_labels]
-
-ref_dims = [100.0] * len(overall_labels)
-ref_area = radar_polygon_area(ref_dims, normalize=True, max_value=100)
-
-areas = {'ref': ref_area}
-
-for model in data_dict.keys():
-    areas[model] = radar_polygon_area(data_dict[model], normalize=True, max_value=100)
-
-print("Overall IFR Areas Score:")
-print(norm_area(areas))
+        block = ('n', 'only', 'single-stage', label.upper())
+        # the n scorer reports each task of a composition under its upper-case name, with the d/f metric
+        mat = metric_matrix(data, all_models, [block + (task.upper(), task2metrics[task]) for task in tasks])
+        present = ~np.all(np.isnan(mat), axis=0)
+        if not present.any():
+            cols.append(np.zeros(len(all_models)))
+            continue
+        normed = np.nan_to_num(normalize_axes(mat[:, present], np.array([task2metrics[task] for task in tasks])[present]), nan=0.0)
+        cols.append(np.round(normed.sum(axis=1) / present.sum(), 2))
+    return np.stack(cols, axis=1)[rows]
+
+def nanmean_rows(matrix):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # a model without any task of the label
+        return np.round(np.nanmean(matrix, axis=1), 2)
+
+def compute_area_scores(metrics_dict, models=None, aggregates=None) -> dict:
+    """
+    Score models on ISA-Bench from their collected metrics.
+
+    metrics_dict maps model name -> that model's collect_all_metrics entry (d/f/n results) and should hold
+    the baseline models as well, since every metric is normalized across all models in it. models selects
+    and orders the models to report (default: all of metrics_dict). aggregates may hold precomputed
+    calc_metrics() results (see load_baseline_aggregates), so that only the models missing from it are
+    aggregated here; the normalization across models is always redone. Neither input is modified.
+
+    Returns {"labels": [...], "overall": {model: {label: ifr}}, "ifr_area": {model: score},
+    "rps_area": {model: score}}, the areas being relative to a model scoring full marks on every axis.
+    """
+    models = list(metrics_dict.keys()) if models is None else list(models)
+    labels_n = collect_n_labels(metrics_dict)
+    aggregates = aggregates or {}
+
+    data = {}
+    for model, model_dict in metrics_dict.items():
+        if model in aggregates:
+            data[model] = pad_n_labels(aggregates[model], labels_n)
+        else:
+            data[model] = calc_metrics(model_dict, labels_n)
 
-normed_overall = calc_overall_normed(normed_data)
+    overall_labels = [f"D-{s}" for s in d_labels] + [f"F-{s}" for s in t_labels] + [f"N-{s}" for s in labels_n]
 
-data_dict = {}
+    ifr_models = [model for model in models if 'overall' in data[model]]
+    ifr_matrix = np.array([[data[model]['overall'][label] for label in overall_labels] for model in ifr_models])
 
-for model in models:
-    data_dict[model] = [normed_overall[label][model] for label in overall_labels]
+    areas = {'ref': radar_polygon_area([100.0] * len(overall_labels), normalize=True, max_value=100)}
+    areas.update(zip(ifr_models, radar_polygon_areas(ifr_matrix, normalize=True, max_value=100)))
+    ifr_area = norm_area(areas)
 
-ref_dims = [1.0] * len(overall_labels)
-ref_area = radar_polygon_area(ref_dims)
+    normed_overall = calc_overall_normed(data, models, labels_n)
 
-areas = {'ref': ref_area}
+    areas = {'ref': radar_polygon_area([1.0] * len(overall_labels))}
+    areas.update(zip(models, radar_polygon_areas(normed_overall)))
+    rps_area = norm_area(areas)
 
-for model in data_dict.keys():
-    areas[model] = radar_polygon_area(data_dict[model])
+    return {
+        "labels": overall_labels,
+        "overall": {model: data[model]['overall'] for model in ifr_models},
+        "ifr_area": ifr_area,
+        "rps_area": rps_area,
+    }
 
-print("Overall RPS Areas Score:")
-print(norm_area(areas))
\ No newline at end of file
+def load_bootstrap_samples(model_dict):
+    """
+    {(dim, task): {key: {metric: resampled values}}} of the results of model_dict (one collect_all_metrics
+    entry) that the scorers bootstrapped; the values are in the side files their 'bootstrap' entries name.
+    """
+    from scoring.bootstrap import load_samples   # metric/ on PYTHONPATH, as for the scorers
+    samples = {}
+    for dim, results in model_dict.items():
+        for task, result in results.items():
+            boot = result.get('diagnostics', {}).get('bootstrap') if isinstance(result, dict) else None
+            if boot and boot.get('samples_file'):
+                samples[(dim, task)] = load_samples(boot['samples_file'])
+    return samples
+
+def replicate_entry(model_dict, samples, b):
+    """
+    model_dict (one collect_all_metrics entry) with every metric in samples (see load_bootstrap_samples)
+    replaced by its b-th resample; the rest is shared with model_dict, which is not modified.
+    """
+    out = {dim: dict(results) for dim, results in model_dict.items()}
+    for (dim, task), by_key in samples.items():
+        new = out[dim][task] = dict(model_dict[dim][task])
+        del new['diagnostics']   # calc_metrics deep-copies its input; the diagnostics are not needed there
+        for key, by_metric in by_key.items():
+            # d/f: variation; n: "stage/K-TASK/TASK"
+            node = new
+            for part in key.split('/'):
+                node[part] = dict(node[part])
+                node = node[part]
+            for metric_id, values in by_metric.items():
+                node[metric_id] = float(values[b])
+    return out
+
+def bootstrap_area_scores(metrics_dict, model, aggregates=None, level=95.0) -> dict:
+    """
+    Percentile confidence intervals of model's IFR and RPS areas, propagated from the item resamples of
+    the scorers (run them with --bootstrap N --bootstrap_samples PATH, as metric.py --bootstrap does). Each
+    replicate re-scores model with compute_area_scores; the other models stay fixed. Returns
+    {"resamples", "ifr_area": [lo, hi], "rps_area": [lo, hi]}.
+    """
+    entry = metrics_dict[model]
+    samples = load_bootstrap_samples(entry)
+    if not samples:
+        raise ValueError(f"no bootstrap samples in the results of {model}; score them with metric.py --bootstrap N")
+    n_boot = min(len(values) for by_key in samples.values() for by_metric in by_key.values()
+                 for values in by_metric.values())
+
+    data = dict(metrics_dict)
+    ifr_area, rps_area = np.empty(n_boot), np.empty(n_boot)
+    for b in range(n_boot):
+        data[model] = replicate_entry(entry, samples, b)
+        scores = compute_area_scores(data, [model], aggregates)
+        ifr_area[b] = scores['ifr_area'].get(model, np.nan)
+        rps_area[b] = scores['rps_area'][model]
+
+    q = [(100.0 - level) / 2, 100.0 - (100.0 - level) / 2]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {
+            "resamples": n_boot,
+            "ifr_area": [round(float(v), 2) for v in np.nanpercentile(ifr_area, q)],
+            "rps_area": [round(float(v), 2) for v in np.nanpercentile(rps_area, q)],
+        }
+
+def load_from_db(db_path, test_model, baseline_path=None):
+    """
+    {model: collect_all_metrics entry} of the reference models and test_model from the results store
+    (results_db.py). The reference models are those of baseline_path, the same set (and so the same
+    normalization) as without the store; the ones the store does not have yet are imported first.
+    """
+    with ResultsDB(db_path) as db:
+        reference = baseline_models
+        if baseline_path and os.path.isfile(baseline_path):
+            with open(baseline_path, "r") as f:
+                baseline = json.load(f)
+            reference = list(baseline)
+            known = set(db.models())
+            for model in reference:
+                if model not in known:
+                    db.add_model(model, baseline[model], source=baseline_path)
+        return db.load_models(reference + [m for m in [test_model] if m not in reference])
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a tested model against the ISA-Bench reference models.")
+    parser.add_argument("test_model", help="tested model name")
+    parser.add_argument("--input", default=None,
+                        help="collected metrics of the tested model (default: egs/<model>/output/<model>_collect_all_metrics.json)")
+    parser.add_argument("--baseline", default="../data/collect_all_metrics.json", help="collected metrics of the reference models")
+    parser.add_argument("--cache_dir", default=None, help="where to keep the baseline aggregates (default: .cache/ next to --baseline)")
+    parser.add_argument("--no_cache", action="store_true", help="re-aggregate the reference models")
+    parser.add_argument("--db", default=None,
+                        help="read the tested and reference models from this results store instead of the JSON files")
+    parser.add_argument("--bootstrap", action="store_true",
+                        help="also print 95%% CIs of the tested model's areas (needs scorer outputs made with metric.py --bootstrap N)")
+    args = parser.parse_args(argv)
+
+    test_model_key = args.test_model
+    path = args.input or f"egs/{test_model_key}/output/{test_model_key}_collect_all_metrics.json"
+
+    if args.db:
+        if args.bootstrap:
+            parser.error("--bootstrap needs the scorer outputs, it cannot be used with --db")
+        data = load_from_db(args.db, test_model_key, args.baseline)
+        if test_model_key not in data:
+            parser.error(f"{test_model_key} is not in {args.db}")
+        aggregates = None
+    elif args.no_cache:
+        with open(args.baseline, "r") as f:
+            data = json.load(f)
+        aggregates = None
+    else:
+        data, aggregates = load_baseline_aggregates(args.baseline, args.cache_dir)
+
+    if not args.db:
+        with open(path, "r") as f:
+            test_data = json.load(f)
+        data[test_model_key] = test_data[test_model_key]
+    if aggregates and test_model_key in aggregates:
+        # a re-scored reference model: aggregate its new results instead
+        aggregates = {model: agg for model, agg in aggregates.items() if model != test_model_key}
+
+    scores = compute_area_scores(data, baseline_models + [test_model_key], aggregates)
+
+    print("Overall IFR Areas Score:")
+    print(scores["ifr_area"])
+
+    print("Overall RPS Areas Score:")
+    print(scores["rps_area"])
+
+    if args.bootstrap:
+        ci = bootstrap_area_scores(data, test_model_key, aggregates)
+        print(f"{test_model_key} 95% CI over {ci['resamples']} resamples:")
+        print(f"IFR Area: {ci['ifr_area']}")
+        print(f"RPS Area: {ci['rps_area']}")
+
+if __name__ == "__main__":
+    main()
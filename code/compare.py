@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Paired significance tests between two models' result files.
+
+Both result files of a (dimension, task) are scored with `--item_stats`, their
+items are aligned by `path`, and for every variation the difference A - B of
+IFR and the task metric gets a paired bootstrap CI / p-value and an
+approximate randomization p-value.
+
+Usage:
+  python compare.py --dim d --task asr A_asr_results.json B_asr_results.json
+  python compare.py --model_a desta2.5-audio --model_b my_model --jobs 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metric import TASK_SCORERS, scorer_script
+from scoring.bootstrap import DEFAULT_SEED, load_item_stats
+from scoring.paired import align, paired_tests
+
+DIMS = ['d', 'f', 'n']
+
+
+def results_path(data_dir, model, dim, task):
+    if dim == 'n':
+        return os.path.join(data_dir, model, 'n', f'{model}_n_results.json')
+    return os.path.join(data_dir, model, dim, f'{model}_{task}_results.json')
+
+
+def item_stats_of(dim, task, path, out):
+    subprocess.run([sys.executable, scorer_script(dim, task), path, '--item_stats', out],
+                   check=True, stdout=subprocess.DEVNULL)
+    return load_item_stats(out)
+
+
+def compare_pair(dim, task, path_a, path_b, resamples=10000, permutations=10000, seed=DEFAULT_SEED):
+    """Paired tests of one (dim, task): {"n_items", "only_a", "only_b", "variations": {var: {metric: ...}}}."""
+    with tempfile.TemporaryDirectory() as workdir:
+        keys_a, series_a = item_stats_of(dim, task, path_a, os.path.join(workdir, 'a.json'))
+        keys_b, series_b = item_stats_of(dim, task, path_b, os.path.join(workdir, 'b.json'))
+
+    # variations scored for both models, side by side so that one resampling serves all of them
+    series = {var: (names, metrics) for var, (metrics, names, _) in series_a.items()
+              if var in series_b and series_b[var][1] == names}
+    mat_a = np.hstack([series_a[var][2] for var in series]) if series else np.zeros((len(keys_a), 0))
+    mat_b = np.hstack([series_b[var][2] for var in series]) if series else np.zeros((len(keys_b), 0))
+    a, b, only_a, only_b = align(keys_a, mat_a, keys_b, mat_b)
+    return {
+        "n_items": len(a),
+        "only_a": only_a,
+        "only_b": only_b,
+        "variations": paired_tests(series, a, b, resamples, permutations, seed),
+    }
+
+
+def _run(job):
+    name, args = job
+    return name, compare_pair(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Paired bootstrap / approximate randomization tests between two models (A - B).')
+    parser.add_argument('results', nargs='*', help='result files of model A and model B (with --dim/--task)')
+    parser.add_argument('--dim', choices=DIMS, help='dimension of the two result files')
+    parser.add_argument('--task', choices=sorted(TASK_SCORERS), help='task of the two result files (d/f)')
+    parser.add_argument('--model_a', help='compare every dimension and task of egs/<model_a> ...')
+    parser.add_argument('--model_b', help='... with egs/<model_b>')
+    parser.add_argument('--data_dir', default='egs', help='where the model result folders are')
+    parser.add_argument('--resamples', type=int, default=10000, help='paired bootstrap resamples')
+    parser.add_argument('--permutations', type=int, default=10000, help='approximate randomization shuffles')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='(dim, task) pairs compared in parallel')
+    parser.add_argument('--output', help='also write the result JSON here')
+    args = parser.parse_args()
+
+    tests = (args.resamples, args.permutations, args.seed)
+    jobs = []
+    if args.model_a and args.model_b:
+        for dim in DIMS:
+            for task in (['only'] if dim == 'n' else sorted(TASK_SCORERS)):
+                path_a = results_path(args.data_dir, args.model_a, dim, task)
+                path_b = results_path(args.data_dir, args.model_b, dim, task)
+                if os.path.isfile(path_a) and os.path.isfile(path_b):
+                    jobs.append((f'{dim}/{task}', (dim, task, path_a, path_b) + tests))
+                else:
+                    print(f'Warning: skipping {dim}/{task}, results of both models are needed', file=sys.stderr)
+    elif len(args.results) == 2 and args.dim:
+        if args.dim in ['d', 'f'] and not args.task:
+            parser.error("--task is required when --dim is 'd' or 'f'.")
+        task = 'only' if args.dim == 'n' else args.task
+        jobs.append((f'{args.dim}/{task}', (args.dim, task, *args.results) + tests))
+    else:
+        parser.error('give two result files with --dim/--task, or --model_a and --model_b')
+
+    res = {}
+    if args.jobs > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            res.update(pool.map(_run, jobs))
+    else:
+        res.update(map(_run, jobs))
+
+    output = json.dumps(res, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+
+
+if __name__ == '__main__':
+    main()
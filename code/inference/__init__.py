@@ -0,0 +1,17 @@
+from .jobs import Job as Job
+from .jobs import flatten as flatten
+from .jobs import build_results as build_results
+from .jobs import load_annotation as load_annotation
+from .jobs import clip_batches as clip_batches
+from .jobs import prefix_groups as prefix_groups
+from .packed import read_packed as read_packed
+from .packed import write_packed as write_packed
+from .audio import AudioCache as AudioCache
+from .backends import Backend as Backend
+from .backends import CallableBackend as CallableBackend
+from .backends import OpenAIBackend as OpenAIBackend
+from .cache import ResponseCache as ResponseCache
+from .shards import ShardWriter as ShardWriter
+from .live import LiveScorer as LiveScorer
+from .runner import Progress as Progress
+from .runner import run as run
@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict
+
+
+class AudioCache:
+    """
+    Bounded LRU of decoded audio (waveform, features, base64 payload, ...) by path. get() decodes a
+    file at most once while it stays cached, also when several threads ask for it at the same time.
+    """
+
+    def __init__(self, decode: Callable[[str], Any], max_items: int = 32):
+        self.decode = decode
+        self.max_items = max(1, max_items)
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def _cached(self, path: str):
+        # caller holds self._lock
+        self._data.move_to_end(path)
+        self.hits += 1
+        return self._data[path]
+
+    def get(self, path: str):
+        with self._lock:
+            if path in self._data:
+                return self._cached(path)
+            loading = self._loading.setdefault(path, threading.Lock())
+        with loading:
+            with self._lock:
+                if path in self._data:    # decoded by the thread we waited for
+                    return self._cached(path)
+            value = self.decode(path)
+            with self._lock:
+                self.misses += 1
+                self._data[path] = value
+                while len(self._data) > self.max_items:
+                    self._data.popitem(last=False)
+                self._loading.pop(path, None)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        return {"decoded": self.misses, "audio_cache_hits": self.hits}
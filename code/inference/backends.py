@@ -0,0 +1,183 @@
+import asyncio
+import base64
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import urllib.request
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .audio import AudioCache
+from .jobs import Job, PrefixGroup, clips
+
+
+class Backend:
+    """A model: answers a batch of jobs with one response string each, in order."""
+
+    async def generate(self, batch: Sequence[Job]) -> List[str]:
+        raise NotImplementedError
+
+    async def generate_grouped(self, groups: Sequence[PrefixGroup]) -> List[List[str]]:
+        """
+        generate() for jobs grouped by shared (audio, instruction prefix), one response list per group.
+        Backends with prefix / KV caching override it; by default the groups are one batch.
+        """
+        out = iter(await self.generate([job for g in groups for job in g.jobs]))
+        return [[next(out) for _ in g.jobs] for g in groups]
+
+    async def aclose(self):
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+class CallableBackend(Backend):
+    """
+    A Python function, called per job as fn(audio, instruction) -> str, per batch as
+    fn([(audio, instruction), ...]) -> [str, ...] (batched=True), or per clip as
+    fn(audio, [instruction, ...]) -> [str, ...] (multi_prompt=True, to share the audio encoder over the
+    variations of a clip). With prefix_prompt=True, jobs grouped by shared instruction prefix
+    (generate_grouped) go as fn(audio, prefix, [rest of each instruction, ...]) -> [str, ...], so the
+    model can encode audio + prefix once. audio is the path, or decode(path) when a decoder is
+    given; decoded clips are kept in an LRU of cache_size. Plain functions run in worker threads,
+    coroutine functions are awaited.
+    """
+
+    def __init__(self, fn: Callable, batched: bool = False, multi_prompt: bool = False,
+                 decode: Optional[Callable[[str], object]] = None, cache_size: int = 32,
+                 prefix_prompt: bool = False):
+        self.fn = fn
+        self.batched = batched
+        self.multi_prompt = multi_prompt
+        self.prefix_prompt = prefix_prompt
+        self.audio = AudioCache(decode, cache_size) if decode else None
+
+    async def _call(self, *args):
+        if inspect.iscoroutinefunction(self.fn):
+            return await self.fn(*args)
+        return await asyncio.to_thread(self.fn, *args)
+
+    async def _audio(self, path: str):
+        return await asyncio.to_thread(self.audio.get, path) if self.audio else path
+
+    async def _clip(self, audio, clip: Sequence[Job]) -> List[str]:
+        out = list(await self._call(audio, [job.instruction for job in clip]))
+        if len(out) != len(clip):
+            raise ValueError(f"multi-prompt backend returned {len(out)} responses for {len(clip)} prompts")
+        return out
+
+    async def generate(self, batch: Sequence[Job]) -> List[str]:
+        groups = clips(batch)
+        audio = {clip[0].path: await self._audio(clip[0].path) for clip in groups}
+        if self.multi_prompt:
+            answered = {}
+            results = await asyncio.gather(*(self._clip(audio[clip[0].path], clip) for clip in groups))
+            for clip, responses in zip(groups, results):
+                answered.update(zip(clip, responses))
+            return [answered[job] for job in batch]
+        if self.batched:
+            out = list(await self._call([(audio[job.path], job.instruction) for job in batch]))
+            if len(out) != len(batch):
+                raise ValueError(f"batched backend returned {len(out)} responses for {len(batch)} jobs")
+            return out
+        return list(await asyncio.gather(*(self._call(audio[job.path], job.instruction) for job in batch)))
+
+    async def _group(self, group: PrefixGroup) -> List[str]:
+        n = len(group.prefix)
+        out = list(await self._call(await self._audio(group.jobs[0].path), group.prefix,
+                                    [job.instruction[n:] for job in group.jobs]))
+        if len(out) != len(group.jobs):
+            raise ValueError(f"prefix backend returned {len(out)} responses for {len(group.jobs)} prompts")
+        return out
+
+    async def generate_grouped(self, groups: Sequence[PrefixGroup]) -> List[List[str]]:
+        if not self.prefix_prompt:
+            return await super().generate_grouped(groups)
+        return list(await asyncio.gather(*(self._group(g) for g in groups)))
+
+    def stats(self) -> Dict[str, int]:
+        return self.audio.stats() if self.audio else {}
+
+
+def load_callable(spec: str) -> Callable:
+    """'package.module:function' or 'path/to/file.py:function'."""
+    module_name, _, attr = spec.rpartition(":")
+    if not module_name or not attr:
+        raise ValueError(f"expected module:function, got {spec!r}")
+    if module_name.endswith(".py") or os.sep in module_name:
+        mod_spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(module_name))[0], module_name)
+        module = importlib.util.module_from_spec(mod_spec)
+        mod_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(module_name)
+    return getattr(module, attr)
+
+
+AUDIO_FORMATS = {".wav": "wav", ".mp3": "mp3", ".flac": "flac", ".ogg": "ogg", ".m4a": "m4a"}
+
+
+class OpenAIBackend(Backend):
+    """
+    An OpenAI-compatible chat completions server (vLLM, a local stand-in, ...). Each job is one
+    request with the audio as base64 `input_audio` followed by the instruction text; the requests of
+    a batch are sent concurrently, at most max_requests at a time over all batches. The encoded audio
+    is built once per clip and kept in an LRU of cache_size clips.
+    """
+
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None, timeout: float = 300.0,
+                 max_tokens: int = 512, temperature: float = 0.0, cache_size: int = 32, max_requests: int = 8):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.audio = AudioCache(self.audio_content, cache_size)
+        self.requests = asyncio.Semaphore(max(1, max_requests))
+
+    def audio_content(self, path: str) -> dict:
+        with open(path, "rb") as f:
+            data = base64.b64encode(f.read()).decode("ascii")
+        fmt = AUDIO_FORMATS.get(os.path.splitext(path)[1].lower(), "wav")
+        return {"type": "input_audio", "input_audio": {"data": data, "format": fmt}}
+
+    def payload(self, job: Job, audio: dict) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": [audio,
+                                                      {"type": "text", "text": job.instruction}]}],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+        }
+
+    def _post(self, body: bytes) -> str:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        req = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            obj = json.loads(resp.read())
+        return obj["choices"][0]["message"]["content"] or ""
+
+    async def _one(self, job: Job) -> str:
+        audio = await asyncio.to_thread(self.audio.get, job.path)
+        body = json.dumps(self.payload(job, audio)).encode("utf-8")
+        async with self.requests:
+            return await asyncio.to_thread(self._post, body)
+
+    async def generate(self, batch: Sequence[Job]) -> List[str]:
+        return list(await asyncio.gather(*(self._one(job) for job in batch)))
+
+    async def _group(self, group: PrefixGroup) -> List[str]:
+        # the first request puts audio + prefix into the server's prefix cache (e.g. vLLM automatic
+        # prefix caching), the others of the group then reuse it
+        first = await self._one(group.jobs[0])
+        return [first] + list(await asyncio.gather(*(self._one(job) for job in group.jobs[1:])))
+
+    async def generate_grouped(self, groups: Sequence[PrefixGroup]) -> List[List[str]]:
+        return list(await asyncio.gather(*(self._group(g) for g in groups)))
+
+    def stats(self) -> Dict[str, int]:
+        return self.audio.stats()
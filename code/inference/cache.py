@@ -0,0 +1,73 @@
+import hashlib
+import os
+import sqlite3
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from .jobs import Job
+
+DEFAULT_CACHE = "../data/.cache/responses.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    model TEXT NOT NULL,
+    audio TEXT NOT NULL,
+    instruction TEXT NOT NULL,
+    response TEXT NOT NULL,
+    PRIMARY KEY (model, audio, instruction)
+);
+"""
+
+
+def file_digest(path: str) -> str:
+    """sha256 of an audio file; a file that cannot be read (the model gets the path only) is keyed by its path."""
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    except OSError:
+        return "path:" + path
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Responses of a model by (model, sha256 of the audio, instruction), in SQLite. Shared by all runs
+    (d, f, n files, reruns), so a job whose audio and instruction were answered before by the same
+    model is not sent again.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE, model: str = ""):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.model = model
+        self.hits = 0
+        self._digests: Dict[str, str] = {}
+
+    def digest(self, path: str) -> str:
+        if path not in self._digests:
+            self._digests[path] = file_digest(path)
+        return self._digests[path]
+
+    def get_many(self, jobs: Sequence[Job]) -> List[Tuple[Job, str]]:
+        """(job, cached response) of the jobs that have one."""
+        found = []
+        for job in jobs:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE model = ? AND audio = ? AND instruction = ?",
+                (self.model, self.digest(job.path), job.instruction)).fetchone()
+            if row is not None:
+                found.append((job, row[0]))
+        self.hits += len(found)
+        return found
+
+    def put_many(self, answered: Iterable[Tuple[Job, str]]):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO responses (model, audio, instruction, response) VALUES (?, ?, ?, ?)",
+                [(self.model, self.digest(job.path), job.instruction, response) for job, response in answered])
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,225 @@
+import copy
+import json
+import os
+import re
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .packed import PackedReader, is_packed
+
+# where the answered instructions of an annotation item go:
+#   "responses": d/f, a `variation_responses` tree next to the item (the compute_if_*.py input)
+#   "inline":    n, every instruction of `instructions.variations` is replaced by its response
+LAYOUTS = {"d": "responses", "f": "responses", "n": "inline"}
+
+# shortest instruction prefix worth sharing between the variations of a clip, in characters
+MIN_PREFIX = 16
+PREFIX_BOUNDARY = re.compile(r"[\s,;:.!?]")
+
+
+class Job(NamedTuple):
+    item: int                       # index of the item in the annotation list
+    path: str                       # audio file
+    variation: Tuple                # key path of the instruction in instructions.variations
+    instruction: str
+
+    @property
+    def key(self) -> str:
+        """Stable id of the job across runs (progress files)."""
+        return json.dumps([self.item, self.path, list(self.variation)], ensure_ascii=False)
+
+
+def load_annotation(path: str, start: int = 0, limit: Optional[int] = None) -> List[dict]:
+    """
+    Items of an annotation (or result) file: a list, {"annotation": [...]}, or a packed file (see
+    packed.py); only the items from start on, at most limit of them. Of a packed file only the
+    blocks holding those items are decoded.
+    """
+    if start < 0 or (limit is not None and limit < 0):
+        raise ValueError(f"start {start} and limit {limit} cannot be negative")
+    if is_packed(path):
+        with open(path, "rb") as f:
+            reader = PackedReader(f.read())
+        end = len(reader) if limit is None else min(len(reader), start + limit)
+        return [reader.item(i) for i in range(start, end)]
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data["annotation"] if isinstance(data, dict) else data
+    return items[start:] if limit is None else items[start:start + limit]
+
+
+def _instructions(node, prefix: Tuple = ()) -> Iterator[Tuple[Tuple, str]]:
+    """(key path, instruction) of every instruction in a variations tree, in document order."""
+    if isinstance(node, str):
+        yield prefix, node
+    elif isinstance(node, dict) and "inst" in node:
+        yield prefix, node["inst"]
+    elif isinstance(node, dict):
+        for k, v in node.items():
+            yield from _instructions(v, prefix + (k,))
+    elif isinstance(node, list):
+        for i, v in enumerate(node):
+            yield from _instructions(v, prefix + (i,))
+
+
+def flatten(items: Sequence[dict]) -> List[Job]:
+    """One job per (item, instruction variation)."""
+    return [Job(idx, item["path"], var, inst)
+            for idx, item in enumerate(items)
+            for var, inst in _instructions(item.get("instructions", {}).get("variations", {}))]
+
+
+def clips(jobs: Sequence[Job]) -> List[List[Job]]:
+    """Jobs grouped by audio file, files in order of first appearance, jobs of a file in their order."""
+    groups: Dict[str, List[Job]] = {}
+    for job in jobs:
+        groups.setdefault(job.path, []).append(job)
+    return list(groups.values())
+
+
+def clip_batches(jobs: Sequence[Job], batch_size: int = 1) -> List[List[Job]]:
+    """
+    Batches of whole clips: all jobs of an audio file go into the same batch, consecutive clips are
+    packed up to batch_size jobs; a clip with more jobs than that is a batch of its own.
+    """
+    out: List[List[Job]] = []
+    for clip in clips(jobs):
+        if out and len(out[-1]) + len(clip) <= batch_size:
+            out[-1].extend(clip)
+        else:
+            out.append(list(clip))
+    return out
+
+
+class PrefixGroup(NamedTuple):
+    prefix: str                     # common start of the instructions, "" for a job on its own
+    jobs: List[Job]                 # same audio file
+
+
+def common_prefix(texts: Sequence[str]) -> str:
+    """Longest common start of texts, cut back to a word boundary unless the texts are all equal."""
+    prefix = os.path.commonprefix(list(texts))
+    if all(len(t) == len(prefix) for t in texts):
+        return prefix
+    ends = [m.end() for m in PREFIX_BOUNDARY.finditer(prefix)]
+    return prefix[:ends[-1]] if ends else ""
+
+
+def prefix_groups(jobs: Sequence[Job], min_prefix: int = MIN_PREFIX) -> List[PrefixGroup]:
+    """
+    Jobs of each clip ordered by instruction and grouped by a shared instruction prefix of at least
+    min_prefix characters (f: `prefix`, `suffix`, `wrap`, `json` all start with the base
+    description and constraint), so a backend with prefix / KV caching encodes audio + prefix once.
+    """
+    out: List[PrefixGroup] = []
+    for clip in clips(jobs):
+        group: List[Job] = []
+        for job in sorted(clip, key=lambda j: j.instruction):
+            # sorted: the prefix shared with the group's first job is shared with all of it
+            if group and len(common_prefix([group[0].instruction, job.instruction])) >= min_prefix:
+                group.append(job)
+                continue
+            if group:
+                out.append(PrefixGroup(common_prefix([j.instruction for j in group]) if len(group) > 1 else "", group))
+            group = [job]
+        if group:
+            out.append(PrefixGroup(common_prefix([j.instruction for j in group]) if len(group) > 1 else "", group))
+    return out
+
+
+def prefix_hit_ratio(groups: Sequence[PrefixGroup]) -> float:
+    """Share of instruction characters a prefix cache does not have to encode again."""
+    total = sum(len(job.instruction) for g in groups for job in g.jobs)
+    shared = sum((len(g.jobs) - 1) * len(g.prefix) for g in groups)
+    return shared / total if total else 0.0
+
+
+def dedup(jobs: Sequence[Job]) -> Tuple[List[Job], Dict[Job, List[Job]]]:
+    """
+    One job per distinct (audio path, instruction), e.g. SER `default` and `lower_case` are often the
+    same string: (the jobs to send, {sent job: the identical jobs that get its response}).
+    """
+    first: Dict[Tuple[str, str], Job] = {}
+    copies: Dict[Job, List[Job]] = {}
+    for job in jobs:
+        rep = first.setdefault((job.path, job.instruction), job)
+        if rep is not job:
+            copies.setdefault(rep, []).append(job)
+    return list(first.values()), copies
+
+
+def _answer(node, prefix: Tuple, responses: Dict[Tuple, Optional[str]], depth: int = 0):
+    if isinstance(node, str):
+        return responses.get(prefix)
+    if isinstance(node, dict) and "inst" in node:
+        out = {k: v for k, v in node.items() if k != "inst"}
+        out["response"] = responses.get(prefix)
+        return out
+    if isinstance(node, dict):
+        out = {}
+        for k, v in node.items():
+            answered = _answer(v, prefix + (k,), responses, depth + 1)
+            # d sub-variations ("case": {"upper_case": [inst]}) hold one response string, not a list
+            if depth > 0 and isinstance(answered, list) and len(answered) == 1:
+                answered = answered[0]
+            out[k] = answered
+        return out
+    if isinstance(node, list):
+        return [_answer(v, prefix + (i,), responses, depth + 1) for i, v in enumerate(node)]
+    return node
+
+
+def _drop_missing(node):
+    """node without its unanswered instructions (None, or an f dict whose response is None); None if nothing is left."""
+    if isinstance(node, dict) and "response" in node:
+        return node if node["response"] is not None else None
+    if isinstance(node, dict):
+        out = {k: v for k, v in ((k, _drop_missing(v)) for k, v in node.items()) if v is not None}
+        return out or None
+    if isinstance(node, list):
+        out = [v for v in map(_drop_missing, node) if v is not None]
+        return out or None
+    return node
+
+
+def build_item(item: dict, responses: Dict[Tuple, Optional[str]], dim: str, drop_missing: bool = False) -> dict:
+    """
+    One result item from an annotation item and {variation key path: response}; with drop_missing,
+    instructions without a response are left out instead of answered with None.
+    """
+    instructions = item.get("instructions", {})
+    answered = _answer(instructions.get("variations", {}), (), responses)
+    if drop_missing:
+        answered = _drop_missing(answered) or {}
+    if LAYOUTS[dim] == "inline":
+        res = copy.deepcopy(item)
+        res["instructions"]["variations"] = answered
+    else:
+        res = {k: v for k, v in item.items() if k != "instructions"}
+        res["base"] = [instructions.get("base_description"), instructions.get("base_constrain")]
+        res["variation_responses"] = answered
+    return res
+
+
+def wrap_results(items: List[dict], dim: str, adaptive: Optional[dict] = None):
+    """
+    The result file content of items; with the summary of an adaptive run (some variations were
+    stopped early), {"annotation": items, "adaptive": ...} for every dim, so the scorers report it.
+    """
+    if adaptive:
+        return {"annotation": items, "adaptive": adaptive}
+    return {"annotation": items} if LAYOUTS[dim] == "inline" else items
+
+
+def build_results(items: Sequence[dict], responses: Dict[str, str], dim: str, drop_missing: bool = False,
+                  adaptive: Optional[dict] = None):
+    """
+    The result file content of a dimension from the annotation items and {job key: response}:
+    a list of items with `base` and `variation_responses` for d/f, {"annotation": items} with the
+    instructions answered in place for n. Jobs without a response are left as None, or left out
+    with drop_missing. adaptive: see wrap_results.
+    """
+    by_item: Dict[int, Dict[Tuple, Optional[str]]] = {}
+    for job in flatten(items):
+        by_item.setdefault(job.item, {})[job.variation] = responses.get(job.key)
+    return wrap_results([build_item(item, by_item.get(idx, {}), dim, drop_missing)
+                         for idx, item in enumerate(items)], dim, adaptive)
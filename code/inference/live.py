@@ -0,0 +1,201 @@
+import json
+import math
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import Counter
+from statistics import NormalDist
+from typing import Dict, List, Optional, Set, Tuple
+
+from metric import scorer_script
+from results_db import build_entry, n_rows, scorer_rows
+
+CODE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOUNDS = ("wilson", "hoeffding")
+
+
+def item_variations(item: dict) -> List[str]:
+    """Top-level variations (n: stages) a result item has responses for."""
+    return list(item.get("variation_responses") or item.get("instructions", {}).get("variations") or {})
+
+
+def ifr_interval(follow: float, n: float, confidence: float = 0.95, bound: str = "wilson") -> Tuple[float, float]:
+    """Confidence interval of an IFR (percent) from follow / n observations: Wilson score or Hoeffding."""
+    if n <= 0:
+        return 0.0, 100.0
+    p = follow / n
+    if bound == "hoeffding":
+        half = math.sqrt(math.log(2 / (1 - confidence)) / (2 * n))
+        lo, hi = p - half, p + half
+    else:
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        denom = 1 + z * z / n
+        center = (p + z * z / (2 * n)) / denom
+        half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+        lo, hi = center - half, center + half
+    return round(100.0 * max(0.0, lo), 2), round(100.0 * min(1.0, hi), 2)
+
+
+class LiveScorer:
+    """
+    Scores result items while the run is still answering. Finished items are put on a queue; a
+    background thread scores every `every` new items with the dimension's scorer script (on those
+    items only) and folds the output into running totals per (task, variation, metric): IFR exactly,
+    from the followed responses, the task metric as the response-weighted mean of the chunks (corpus
+    WER / BLEU of the whole file can differ slightly). The summary, in the scorer's own layout with
+    the response count `n` of every variation, is rewritten to `path` after each chunk.
+
+    With abort_ifr set, `aborted` turns true once min_items are scored and the IFR of
+    abort_variation is at most abort_ifr (a model that ignores the instruction format).
+
+    With stop_width set (adaptive sampling), a variation goes into `stopped` once it has min_n
+    items and its IFR interval at `confidence` (see interval) is at most stop_width points wide; the
+    runner sends no more of its jobs, and the summary gives every variation's interval. Meanwhile
+    the runner holds back new jobs while the scorer is lagging, so the stops can take effect.
+    """
+
+    def __init__(self, path: str, dim: str, task: Optional[str] = None, every: int = 100,
+                 abort_variation: str = "default", abort_ifr: Optional[float] = None, min_items: int = 200,
+                 stop_width: Optional[float] = None, confidence: float = 0.95, bound: str = "wilson",
+                 min_n: int = 30):
+        self.path = path
+        self.dim = dim
+        self.task = task
+        self.every = max(1, every)
+        self.abort_variation = abort_variation
+        self.abort_ifr = abort_ifr
+        self.min_items = min_items
+        self.stop_width = stop_width
+        self.confidence = confidence
+        self.bound = bound
+        self.min_n = min_n
+        self.stopped: Set[str] = set()
+        self.scored = 0
+        self.queued = 0
+        self.aborted = False
+        self.error: Optional[str] = None
+        self.sums: Dict[Tuple[str, str, str], List[float]] = {}     # (task, variation, metric) -> [sum value*n, n]
+        self.items: Counter = Counter()                              # variation -> items scored
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def put(self, item: dict):
+        self.queued += 1
+        self._queue.put(item)
+
+    def lagging(self) -> bool:
+        """More than a chunk of the items put is not scored yet (and the scorer is still running)."""
+        return self.error is None and self._thread.is_alive() and self.queued - self.scored > self.every
+
+    def _loop(self):
+        chunk: List[dict] = []
+        while True:
+            item = self._queue.get()
+            if item is not None:
+                chunk.append(item)
+            if chunk and (item is None or len(chunk) >= self.every):
+                self._score(chunk)
+                chunk = []
+            if item is None:
+                return
+
+    def _score(self, items: List[dict]):
+        if self.error:
+            return
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", encoding="utf-8", delete=False) as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            p for p in (os.path.join(CODE_DIR, "metric"), os.environ.get("PYTHONPATH")) if p))
+        try:
+            proc = subprocess.run([sys.executable, os.path.join(CODE_DIR, scorer_script(self.dim, self.task)), f.name],
+                                  capture_output=True, text=True, env=env)
+            res = json.loads(proc.stdout) if proc.returncode == 0 else None
+        except json.JSONDecodeError:
+            res = None
+        finally:
+            os.unlink(f.name)
+        if res is None:
+            self.error = (proc.stderr.strip().splitlines() or ["no output"])[-1]
+            print(f"Live scoring stopped, the scorer failed: {self.error}", file=sys.stderr)
+            return
+
+        rows = n_rows(res) if self.dim == "n" else scorer_rows(self.dim, self.task, res)
+        for _, task, var, metric, value, n in rows:
+            acc = self.sums.setdefault((task, var, metric), [0.0, 0])
+            weight = n if n is not None else len(items)
+            acc[0] += value * weight
+            acc[1] += weight
+        for item in items:
+            self.items.update(item_variations(item))
+        self.scored += len(items)
+
+        if self.stop_width is not None:
+            for var in self.variations():
+                lo, hi = self.interval(var)
+                if self.items[var] >= self.min_n and hi - lo <= self.stop_width:
+                    self.stopped.add(var)
+        ifr = self.ifr(self.abort_variation)
+        if self.abort_ifr is not None and self.scored >= self.min_items and ifr is not None and ifr <= self.abort_ifr:
+            self.aborted = True
+        self.write()
+
+    def variations(self) -> List[str]:
+        return list(dict.fromkeys(var for (_, var, metric) in self.sums if metric == "ifr" and var != "all"))
+
+    def counts(self, variation: str) -> Tuple[int, int]:
+        """(followed, responses) of a variation so far, over all its tasks (n: all tasks of the stage)."""
+        total = [acc for (_, var, metric), acc in self.sums.items() if var == variation and metric == "ifr"]
+        return round(sum(acc[0] for acc in total) / 100.0), sum(acc[1] for acc in total)
+
+    def ifr(self, variation: str) -> Optional[float]:
+        follow, n = self.counts(variation)
+        return 100.0 * follow / n if n else None
+
+    def interval(self, variation: str) -> Tuple[float, float]:
+        """
+        IFR interval of a variation with its items, not its responses, as the sample size: the
+        responses to one item (lower / upper case, the robust rewrites, ...) are correlated.
+        """
+        follow, n = self.counts(variation)
+        items = self.items[variation]
+        return ifr_interval(items * follow / n if n else 0.0, items, self.confidence, self.bound)
+
+    def adaptive(self) -> dict:
+        """The stopping rule and, per variation, its items, IFR interval and whether it was stopped."""
+        return {"bound": self.bound, "confidence": self.confidence, "width": self.stop_width, "min_n": self.min_n,
+                "stopped": sorted(self.stopped),
+                "variations": {var: {"items": self.items[var], "ci": list(self.interval(var)),
+                                     "stopped": var in self.stopped} for var in self.variations()}}
+
+    def summary(self) -> dict:
+        rows = []
+        for (task, var, metric), (value, n) in self.sums.items():
+            rows.append((self.dim, task, var, metric, round(value / n, 2) if n else 0.0, n))
+            if self.dim != "n" and metric == "ifr":
+                rows.append((self.dim, task, var, "n", n, None))
+        entry = build_entry(rows)
+        res = entry["n"].get("only", {}) if self.dim == "n" else entry[self.dim].get(self.task, {})
+        out = {"dim": self.dim, "task": self.task, "items": self.scored, "aborted": self.aborted,
+               "error": self.error, "results": res}
+        if self.stop_width is not None:
+            out["adaptive"] = self.adaptive()
+        return out
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def close(self):
+        """Score what is left on the queue and write the final summary."""
+        self._queue.put(None)
+        self._thread.join()
+        if self.scored:
+            self.write()
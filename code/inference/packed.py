@@ -0,0 +1,326 @@
+import json
+import struct
+import sys
+import zlib
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:  # optional: bodies are zlib-compressed without it
+    zstandard = None
+
+# packed annotation file:
+#   MAGIC, version byte, codec byte (CODECS)
+#   varint n_items, varint items per block, varint compressed size of the shared string table,
+#   then per block the varint compressed size of the block
+#   the compressed shared string table: the strings of more than one block
+#   per block, compressed: a string table of the strings only that block has, then the varint
+#   byte length of every record of the block, then the records
+# string table: varint count, varint byte length of the text, a little-endian uint32 character
+# length per string, then the strings as one UTF-8 text.
+# value: a tag byte, then for STR a string id, INT a zigzag varint, FLOAT 8 bytes (little-endian
+# double), LIST a varint count and the values, DICT a varint count and (key string id, value) pairs.
+# String ids count the shared strings first, then those of the block. Every string (keys,
+# instructions, constraints, paths) is stored once; a block is decompressed and decoded only when
+# one of its items is read.
+MAGIC = b"ISAP"
+VERSION = 2
+CODECS = {0: "zlib", 1: "zstd"}
+BLOCK_ITEMS = 64
+NULL, FALSE, TRUE, INT, FLOAT, STR, LIST, DICT = range(8)
+_DOUBLE = struct.Struct("<d")
+
+
+def is_packed(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _put_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _varint(buf: bytes, pos: int):
+    b = buf[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n, shift = b & 0x7F, 7
+    while True:
+        pos += 1
+        b = buf[pos]
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos + 1
+        shift += 7
+
+
+def _put_strings(out: bytearray, strings: Sequence[str]):
+    text = "".join(strings).encode("utf-8")
+    lengths = array("I", (len(s) for s in strings))
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    _put_varint(out, len(strings))
+    _put_varint(out, len(text))
+    out += lengths.tobytes()
+    out += text
+
+
+def _strings(buf: bytes, pos: int):
+    n, pos = _varint(buf, pos)
+    size, pos = _varint(buf, pos)
+    lengths = array("I")
+    lengths.frombytes(buf[pos:pos + 4 * n])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    pos += 4 * n
+    text = buf[pos:pos + size].decode("utf-8")
+    strings, start = [], 0
+    for length in lengths:
+        strings.append(text[start:start + length])
+        start += length
+    return strings, pos + size
+
+
+def _used_strings(v, out: Dict[str, None]):
+    """Add the strings of a value (keys included) to out, in document order."""
+    if isinstance(v, str):
+        out[v] = None
+    elif isinstance(v, (list, tuple)):
+        for x in v:
+            _used_strings(x, out)
+    elif isinstance(v, dict):
+        for k, x in v.items():
+            out[k] = None
+            _used_strings(x, out)
+
+
+class _Writer:
+    """Records of one block; strings get the id of shared, or of the block's own table (ids)."""
+
+    def __init__(self, shared: Dict[str, int]):
+        self.shared = shared
+        self.ids: Dict[str, int] = {}
+
+    def string(self, out: bytearray, s: str):
+        sid = self.shared.get(s)
+        if sid is None:
+            sid = self.ids.get(s)
+            if sid is None:
+                sid = self.ids[s] = len(self.shared) + len(self.ids)
+        _put_varint(out, sid)
+
+    def value(self, out: bytearray, v):
+        if v is None:
+            out.append(NULL)
+        elif v is True or v is False:
+            out.append(TRUE if v else FALSE)
+        elif isinstance(v, int):
+            out.append(INT)
+            _put_varint(out, (v << 1) if v >= 0 else ((-v << 1) - 1))
+        elif isinstance(v, float):
+            out.append(FLOAT)
+            out += _DOUBLE.pack(v)
+        elif isinstance(v, str):
+            out.append(STR)
+            self.string(out, v)
+        elif isinstance(v, (list, tuple)):
+            out.append(LIST)
+            _put_varint(out, len(v))
+            for x in v:
+                self.value(out, x)
+        elif isinstance(v, dict):
+            out.append(DICT)
+            _put_varint(out, len(v))
+            for k, x in v.items():
+                self.string(out, k)
+                self.value(out, x)
+        else:
+            raise TypeError(f"cannot pack {type(v).__name__}")
+
+
+def _compress(codec: str, data: bytes, level: Optional[int]) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("the zstd codec needs the zstandard package")
+        return zstandard.ZstdCompressor(level=level or 19).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, level or 9)
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def _decompressor(code: int) -> Callable[[bytes], bytes]:
+    if CODECS.get(code) == "zstd":
+        if zstandard is None:
+            raise RuntimeError("this file is zstd-compressed; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress
+    if CODECS.get(code) == "zlib":
+        return zlib.decompress
+    raise ValueError(f"unknown codec {code}")
+
+
+def pack(items: Sequence[dict], codec: Optional[str] = None, level: Optional[int] = None,
+         block_items: int = BLOCK_ITEMS) -> bytes:
+    """
+    Packed file content of annotation items; codec "zstd" (the default when zstandard is installed)
+    or "zlib". Items are compressed in blocks of block_items, the unit a reader decompresses.
+    """
+    codec = codec or ("zstd" if zstandard else "zlib")
+    block_items = max(1, block_items)
+    chunks = [items[start:start + block_items] for start in range(0, len(items), block_items)]
+    seen: Dict[str, int] = {}   # string -> first block using it, -1 once a second one does
+    for b, chunk in enumerate(chunks):
+        used: Dict[str, None] = {}
+        for item in chunk:
+            _used_strings(item, used)
+        for s in used:
+            if seen.setdefault(s, b) != b:
+                seen[s] = -1
+    shared = {s: i for i, s in enumerate(s for s, b in seen.items() if b < 0)}
+    table = bytearray()
+    _put_strings(table, list(shared))
+
+    blocks = []
+    for chunk in chunks:
+        writer = _Writer(shared)
+        records = []
+        for item in chunk:
+            rec = bytearray()
+            writer.value(rec, item)
+            records.append(rec)
+        block = bytearray()
+        _put_strings(block, list(writer.ids))
+        for rec in records:
+            _put_varint(block, len(rec))
+        for rec in records:
+            block += rec
+        blocks.append(_compress(codec, bytes(block), level))
+    table = _compress(codec, bytes(table), level)
+
+    head = bytearray()
+    for n in (len(items), block_items, len(table)):
+        _put_varint(head, n)
+    for block in blocks:
+        _put_varint(head, len(block))
+    code = next(c for c, name in CODECS.items() if name == codec)
+    return b"".join([MAGIC, bytes([VERSION, code]), head, table, *blocks])
+
+
+class PackedReader:
+    """
+    Items of a packed file, decoded on demand: reading an item decompresses and decodes only its
+    block (kept for the next items of the block); strings are shared between items.
+    """
+
+    def __init__(self, data: bytes):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("not a packed annotation file")
+        version, code = data[len(MAGIC)], data[len(MAGIC) + 1]
+        if version != VERSION:
+            raise ValueError(f"packed annotation version {version}, expected {VERSION}")
+        self._decompress = _decompressor(code)
+        pos = len(MAGIC) + 2
+        self.n_items, pos = _varint(data, pos)
+        self.block_items, pos = _varint(data, pos)
+        table_size, pos = _varint(data, pos)
+        sizes = []
+        for _ in range(-(-self.n_items // self.block_items)):
+            size, pos = _varint(data, pos)
+            sizes.append(size)
+        self.shared = _strings(self._decompress(data[pos:pos + table_size]), 0)[0]
+        pos += table_size
+        self.spans: List[Tuple[int, int]] = []     # (offset, size) of every compressed block
+        for size in sizes:
+            self.spans.append((pos, size))
+            pos += size
+        self.data = data
+        self._block: Tuple[int, bytes, List[int], List[str]] = (-1, b"", [], [])
+
+    def __len__(self) -> int:
+        return self.n_items
+
+    def _load(self, b: int) -> Tuple[bytes, List[int], List[str]]:
+        """Decompressed block b, the offset of each of its records, and the strings its ids refer to."""
+        if self._block[0] != b:
+            offset, size = self.spans[b]
+            body = self._decompress(self.data[offset:offset + size])
+            strings, pos = _strings(body, 0)
+            lengths = []
+            for _ in range(min(self.block_items, self.n_items - b * self.block_items)):
+                length, pos = _varint(body, pos)
+                lengths.append(length)
+            offsets = []
+            for length in lengths:
+                offsets.append(pos)
+                pos += length
+            self._block = (b, body, offsets, self.shared + strings)
+        return self._block[1:]
+
+    def _value(self, body: bytes, pos: int, strings: List[str]):
+        tag = body[pos]
+        pos += 1
+        if tag == STR:
+            sid, pos = _varint(body, pos)
+            return strings[sid], pos
+        if tag == DICT:
+            n, pos = _varint(body, pos)
+            out = {}
+            for _ in range(n):
+                sid, pos = _varint(body, pos)
+                out[strings[sid]], pos = self._value(body, pos, strings)
+            return out, pos
+        if tag == LIST:
+            n, pos = _varint(body, pos)
+            out = []
+            for _ in range(n):
+                v, pos = self._value(body, pos, strings)
+                out.append(v)
+            return out, pos
+        if tag == INT:
+            z, pos = _varint(body, pos)
+            return (z >> 1) if not z & 1 else -((z + 1) >> 1), pos
+        if tag == FLOAT:
+            return _DOUBLE.unpack_from(body, pos)[0], pos + 8
+        if tag == NULL:
+            return None, pos
+        if tag in (TRUE, FALSE):
+            return tag == TRUE, pos
+        raise ValueError(f"bad tag {tag} at {pos - 1}")
+
+    def item(self, idx: int) -> dict:
+        if not 0 <= idx < self.n_items:
+            raise IndexError(f"item {idx} of {self.n_items}")
+        b, i = divmod(idx, self.block_items)
+        body, offsets, strings = self._load(b)
+        return self._value(body, offsets[i], strings)[0]
+
+    def __iter__(self) -> Iterator[dict]:
+        for idx in range(len(self)):
+            yield self.item(idx)
+
+
+def read_packed(path: str, indices: Optional[Iterable[int]] = None) -> List[dict]:
+    """
+    Items of a packed file, all or those of indices: only the blocks holding them are read and
+    decompressed (a worker of a parallel run reads only its own items).
+    """
+    with open(path, "rb") as f:
+        reader = PackedReader(f.read())
+    return list(reader) if indices is None else [reader.item(i) for i in indices]
+
+
+def write_packed(path: str, items: Sequence[dict], codec: Optional[str] = None):
+    with open(path, "wb") as f:
+        f.write(pack(items, codec))
+
+
+def pack_file(src: str, dst: str, codec: Optional[str] = None) -> int:
+    """Pack an annotation JSON file ({"annotation": [...]} or a list); returns the item count."""
+    with open(src, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    items = data["annotation"] if isinstance(data, dict) else data
+    write_packed(dst, items, codec)
+    return len(items)
@@ -0,0 +1,264 @@
+import asyncio
+import json
+import os
+import random
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .backends import Backend
+from .cache import ResponseCache
+from .jobs import (Job, build_item, build_results, clip_batches, dedup, flatten, load_annotation, prefix_groups,
+                   prefix_hit_ratio)
+from .live import LiveScorer
+from .shards import ShardWriter
+
+
+class Progress:
+    """
+    Answered jobs of a run, one JSON line {"key", "response"} each, appended as they finish; a
+    rerun loads them and only sends the rest. A line cut short by a crash is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.done[rec["key"]] = rec["response"]
+        self._f = open(path, "a", encoding="utf-8")
+
+    def add(self, job: Job, response: str):
+        self.done[job.key] = response
+        self._f.write(json.dumps({"key": job.key, "response": response}, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+def batches(jobs: Sequence[Job], batch_size: int) -> List[List[Job]]:
+    return [list(jobs[i:i + batch_size]) for i in range(0, len(jobs), batch_size)]
+
+
+async def run_jobs(jobs: Sequence[Job], backend: Backend, record: Callable[[List[Tuple[Job, str]]], None],
+                   concurrency: int = 8, batch_size: int = 1, retries: int = 3,
+                   audio_major: bool = True, prefix_sharing: bool = False,
+                   stop: Optional[Callable[[], bool]] = None,
+                   skip: Optional[Callable[[Job], bool]] = None,
+                   hold: Optional[Callable[[], bool]] = None) -> List[Tuple[Job, str]]:
+    """
+    Answer jobs with at most `concurrency` batches of `batch_size` in flight, retrying a failed batch
+    with exponential backoff; record gets the (job, response) pairs of every answered batch. Returns
+    the jobs that still failed, with the error.
+
+    audio_major: batches hold whole clips (every variation of an audio file, see clip_batches), so a
+    backend decodes each file once and can share the audio encoder over the variations.
+    prefix_sharing: the jobs of a batch go to backend.generate_grouped by shared instruction prefix.
+    stop: checked before each batch; once it returns true no further batch is sent.
+    skip: jobs of a batch it returns true for are not sent; record gets them with response None.
+    hold: checked before each batch; while it returns true the batch waits.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for batch in (clip_batches(jobs, batch_size) if audio_major else batches(jobs, batch_size)):
+        queue.put_nowait(batch)
+    failed: List[Tuple[Job, str]] = []
+    total, answered = len(jobs), 0
+    report_every = max(100, total // 10)
+
+    async def worker():
+        nonlocal answered
+        while not (stop and stop()):
+            if hold and hold():
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                batch = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if skip:
+                skipped = [job for job in batch if skip(job)]
+                if skipped:
+                    record([(job, None) for job in skipped])
+                    batch = [job for job in batch if job not in skipped]
+                if not batch:
+                    continue
+            if prefix_sharing:
+                groups = prefix_groups(batch)
+                batch = [job for g in groups for job in g.jobs]
+            for attempt in range(retries + 1):
+                try:
+                    if prefix_sharing:
+                        responses = [r for rs in await backend.generate_grouped(groups) for r in rs]
+                    else:
+                        responses = await backend.generate(batch)
+                    break
+                except Exception as e:  # the backend's own error types are unknown here
+                    if attempt == retries:
+                        failed.extend((job, repr(e)) for job in batch)
+                        responses = None
+                    else:
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+            if responses is not None:
+                record(list(zip(batch, responses)))
+                answered += len(batch)
+                if answered % report_every < len(batch) or answered == total:
+                    print(f"{answered}/{total} jobs answered", file=sys.stderr)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return failed
+
+
+def run(annotation: str, dim: str, backend: Backend, output: str, progress_path: Optional[str] = None,
+        concurrency: int = 8, batch_size: int = 1, retries: int = 3, limit: Optional[int] = None,
+        audio_major: bool = True, cache: Optional[ResponseCache] = None, shard_items: int = 0,
+        fsync_every: int = 50, prefix_sharing: bool = False, live: Optional[LiveScorer] = None,
+        shuffle_seed: Optional[int] = None, start: int = 0) -> dict:
+    """
+    Answer every instruction variation of an annotation file and write the result file of `dim`
+    (see build_results). Progress is kept in progress_path (default: <output>.progress.jsonl), so an
+    interrupted or partly failed run can simply be started again; the result file is only written
+    once every job has a response. start and limit restrict the run to a range of the items (one
+    worker's share of a file); of a packed annotation file only that range is decoded.
+
+    Jobs found in the response cache are not sent, and of identical jobs (same audio and
+    instruction) only one is; the cache gets every new response.
+
+    With shard_items > 0, output is a directory of NDJSON shards instead (see ShardWriter): every
+    item is appended as soon as all its variations are answered, checkpointed every fsync_every
+    items, and the scorers read the directory as it is.
+
+    With prefix_sharing, the jobs of a clip are ordered and grouped by shared instruction prefix
+    (see prefix_groups) and sent through backend.generate_grouped; the summary reports the share of
+    instruction characters a prefix cache can reuse.
+
+    live gets every item as soon as all its variations are answered (see LiveScorer); when it
+    aborts, no further jobs are sent and no result file is written.
+
+    Adaptive sampling: with shuffle_seed, items are answered in a random (seeded) order, and with a
+    live scorer that has a stop_width, the jobs of variations it has stopped are not sent; their
+    items are written without them, and the result file (or shard manifest) carries the stopping
+    summary (LiveScorer.adaptive) that the scorers copy into their output. So that a backend faster
+    than the scorer does not send every job before a variation can stop, no batch is sent while
+    more than one chunk (live.every items) of answered items waits to be scored (LiveScorer.lagging).
+    """
+    items = load_annotation(annotation, start, limit)
+    jobs = flatten(items)
+    sharded = shard_items > 0
+    writer = ShardWriter(output, annotation, dim, len(items), shard_items, fsync_every) if sharded else None
+    progress = Progress(progress_path or (os.path.join(output, "progress.jsonl") if sharded
+                                          else output + ".progress.jsonl"))
+    todo = [job for job in jobs if job.key not in progress.done]
+    print(f"{len(items)} items, {len(jobs)} jobs, {len(jobs) - len(todo)} already answered", file=sys.stderr)
+
+    jobs_of: Dict[int, List[Job]] = {}
+    for job in jobs:
+        jobs_of.setdefault(job.item, []).append(job)
+    left = Counter(job.item for job in todo)
+    adaptive = live is not None and live.stop_width is not None
+    skipped = set()
+
+    def emit(idx: int):
+        if not (live or writer and idx not in writer.written):
+            return
+        item = build_item(items[idx], {j.variation: progress.done.get(j.key) for j in jobs_of[idx]}, dim, adaptive)
+        if writer:
+            writer.write(idx, item)
+        if live and any(j.key in progress.done for j in jobs_of[idx]):
+            live.put(item)
+
+    def answer(job: Job, response: Optional[str]):
+        if response is None:
+            skipped.add(job.key)
+        else:
+            progress.add(job, response)
+        left[job.item] -= 1
+        if left[job.item] == 0:
+            emit(job.item)
+
+    for idx in jobs_of:
+        if left[idx] == 0:
+            emit(idx)   # answered in an earlier run, but not in a shard yet
+    cached = cache.get_many(todo) if cache else []
+    for job, response in cached:
+        answer(job, response)
+    todo = [job for job in todo if job.key not in progress.done]
+    send, copies = dedup(todo)
+    if shuffle_seed is not None:
+        order = list(range(len(items)))
+        random.Random(shuffle_seed).shuffle(order)
+        rank = {idx: r for r, idx in enumerate(order)}
+        send.sort(key=lambda job: rank[job.item])
+    print(f"{len(cached)} from the response cache, {len(todo) - len(send)} identical to another job, "
+          f"{len(send)} to send", file=sys.stderr)
+
+    def record(answered: List[Tuple[Job, str]]):
+        for job, response in answered:
+            answer(job, response)
+            for copy in copies.get(job, ()):
+                answer(copy, response)
+        if cache:
+            cache.put_many([(job, response) for job, response in answered if response is not None])
+
+    def stopped(job: Job) -> bool:
+        # identical jobs share the response: send it unless every variation it answers is stopped
+        return all(not live.stopped.isdisjoint(j.variation) for j in [job] + copies.get(job, []))
+
+    async def main():
+        # blocking backends (HTTP, plain callables) run in threads: one per request in flight
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=max(1, concurrency) * max(1, batch_size)))
+        try:
+            return await run_jobs(send, backend, record, concurrency, batch_size, retries, audio_major,
+                                  prefix_sharing, (lambda: live.aborted) if live else None,
+                                  stopped if adaptive else None, live.lagging if adaptive else None)
+        finally:
+            await backend.aclose()
+
+    try:
+        failed = asyncio.run(main())
+    finally:
+        progress.close()
+        if live:
+            live.close()
+        if writer:
+            writer.close(adaptive=live.adaptive() if adaptive else None)
+
+    # jobs passed to the backend in this run: answered or failed (not those left unsent by an abort or a stop)
+    answered = sum(job.key in progress.done for job in send)
+    summary = {"items": len(items), "jobs": len(jobs), "cached": len(cached), "deduplicated": len(todo) - len(send),
+               "sent": answered + len(failed), "answered": answered, "failed": len(failed), **backend.stats()}
+    if prefix_sharing:
+        groups = prefix_groups(send)
+        summary.update(prefix_groups=sum(len(g.jobs) > 1 for g in groups),
+                       prefix_hit_ratio=round(prefix_hit_ratio(groups), 4))
+    if live:
+        summary.update(live_items=live.scored, aborted=live.aborted)
+    if adaptive:
+        summary.update(skipped=len(skipped), stopped=sorted(live.stopped))
+    if live and live.aborted:
+        print(f"Aborted: IFR of {live.abort_variation} is {live.ifr(live.abort_variation):.2f} after "
+              f"{live.scored} items, see {live.path}; answered jobs are kept in the progress file", file=sys.stderr)
+        return summary
+    if failed:
+        for job, err in failed[:10]:
+            print(f"Failed: item {job.item} {'/'.join(map(str, job.variation))}: {err}", file=sys.stderr)
+        print(f"{len(failed)} jobs failed; run again to retry them", file=sys.stderr)
+        return summary
+    if writer:
+        print(f"Wrote {len(writer.written)} items to {output}", file=sys.stderr)
+        return summary
+
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(build_results(items, progress.done, dim, adaptive, live.adaptive() if adaptive else None), f,
+                  indent=2, ensure_ascii=False)
+    print(f"Wrote {output}", file=sys.stderr)
+    return summary
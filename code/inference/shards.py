@@ -0,0 +1,109 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+# same layout as metric/scoring/results_io.py reads
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _fsync_dir(directory: str):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_manifest(directory: str, manifest: dict):
+    """Replace the manifest atomically: a crash leaves either the old or the new one."""
+    path = os.path.join(directory, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(directory)
+
+
+class ShardWriter:
+    """
+    Result items as append-only NDJSON shards (part-00000.ndjson, ...) of shard_items lines each,
+    plus manifest.json with the annotation index of every line and the byte length of every shard
+    as of the last checkpoint. A checkpoint (every fsync_every items and on close) fsyncs the open
+    shard and then replaces the manifest, so the manifest only ever covers data on disk.
+
+    Opening an existing directory of the same annotation resumes it: every shard is cut back to its
+    checkpointed length and `written` holds the items already there.
+    """
+
+    def __init__(self, directory: str, annotation: str, dim: str, n_items: int,
+                 shard_items: int = 1000, fsync_every: int = 50):
+        self.directory = directory
+        self.shard_items = max(1, shard_items)
+        self.fsync_every = max(1, fsync_every)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, MANIFEST)
+        self.manifest: Dict = {"version": MANIFEST_VERSION, "annotation": os.path.abspath(annotation), "dim": dim,
+                               "n_items": n_items, "complete": False, "shards": []}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                old = json.load(f)
+            mismatch = [k for k in ("annotation", "dim", "n_items") if old.get(k) != self.manifest[k]]
+            if mismatch:
+                raise ValueError(f"{directory} holds results of another run ({', '.join(mismatch)} differ)")
+            self.manifest["shards"] = old["shards"]
+        for shard in self.manifest["shards"]:
+            with open(os.path.join(directory, shard["file"]), "ab") as f:
+                f.truncate(shard["bytes"])
+        self.written = {idx for shard in self.manifest["shards"] for idx in shard["items"]}
+        self._f = None
+        self._pending: List[int] = []
+
+    def _open_shard(self):
+        shards = self.manifest["shards"]
+        if not shards or len(shards[-1]["items"]) + len(self._pending) >= self.shard_items:
+            if self._pending:
+                self.checkpoint()
+            if self._f:
+                self._f.close()
+                self._f = None
+            shards.append({"file": f"part-{len(shards):05d}.ndjson", "items": [], "bytes": 0})
+        if self._f is None:
+            self._f = open(os.path.join(self.directory, shards[-1]["file"]), "ab")
+
+    def write(self, idx: int, item: dict):
+        if idx in self.written:
+            return
+        self._open_shard()
+        self._f.write(json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._pending.append(idx)
+        self.written.add(idx)
+        if len(self._pending) >= self.fsync_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self._f is None:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        shard = self.manifest["shards"][-1]
+        shard["items"].extend(self._pending)
+        shard["bytes"] = self._f.tell()
+        self._pending = []
+        write_manifest(self.directory, self.manifest)
+
+    def close(self, complete: Optional[bool] = None, adaptive: Optional[dict] = None):
+        """Checkpoint and mark the directory complete; adaptive: the adaptive-sampling summary, for the scorers."""
+        self.checkpoint()
+        if self._f:
+            self._f.close()
+            self._f = None
+        self.manifest["complete"] = len(self.written) == self.manifest["n_items"] if complete is None else complete
+        if adaptive:
+            self.manifest["adaptive"] = adaptive
+        write_manifest(self.directory, self.manifest)
@@ -2,17 +2,27 @@
 """Merge selected metric JSON files into a single consolidated JSON.
 
 Reads the files listed by the user from the `code/output` tree and writes
-the merged result to `data/collect_all_metrics.json`. If that file exists
-it will be backed up with a .bak timestamp.
+the merged result to `data/collect_all_metrics.json`.
+
+Merging is incremental: a manifest next to the merged file records the
+mtime, size and sha256 of every source, and sources that did not change
+are taken from the previous merge instead of being parsed again. If the
+merged file changes, its previous version is kept under `.backups/`,
+named by its content hash; only the newest --keep_backups are kept.
+
+The merged metrics are also added to the results store (results_db.py)
+as a new run of the model, unless --no_db.
 
 Usage: python code/merge_outputs.py
 """
 import argparse
+import hashlib
 import json
 import os
-import shutil
-from datetime import datetime
 
+from results_db import DEFAULT_DB, ResultsDB
+
+MANIFEST_VERSION = 1
 
 
 def find_single_json_in_dir(dirpath):
@@ -35,10 +45,12 @@ def find_single_json_in_dir(dirpath):
     return None
 
 
-def read_json(path):
+def read_json(path, raw=None):
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        if raw is None:
+            with open(path, 'rb') as f:
+                raw = f.read()
+        return json.loads(raw)
     except FileNotFoundError:
         print(f'Warning: file not found: {path}')
         return None
@@ -47,14 +59,78 @@ def read_json(path):
         return None
 
 
-def merge(output_path):
+def sha256_bytes(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+class IncrementalReader:
+    """read_json() for merge() that reuses the previous merge for unchanged sources.
+
+    A source is unchanged if its mtime and size match the manifest, or else if its
+    sha256 does; only the other sources are parsed. `sources` is the manifest of
+    this merge, `reread` lists the sources that were parsed and `reused` counts
+    those taken from the previous merge.
+    """
+
+    def __init__(self, base, manifest=None, previous=None):
+        self.base = base
+        self.old = (manifest or {}).get('sources', {})
+        self.previous = previous or {}
+        self.sources = {}
+        self.reread = []
+        self.reused = 0
+
+    def _previous(self, key):
+        node = self.previous
+        for k in key:
+            if not isinstance(node, dict) or k not in node:
+                return None
+            node = node[k]
+        return node
+
+    def __call__(self, path, key):
+        rel = os.path.relpath(path, self.base)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            print(f'Warning: file not found: {path}')
+            return None
+        entry = self.old.get(rel)
+        prev = self._previous(key)
+        usable = entry is not None and prev is not None and entry['key'] == list(key)
+        if usable and (entry['mtime_ns'], entry['size']) == (st.st_mtime_ns, st.st_size):
+            self.sources[rel] = entry
+            self.reused += 1
+            return prev
+
+        with open(path, 'rb') as f:
+            raw = f.read()
+        digest = sha256_bytes(raw)
+        record = {'key': list(key), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'sha256': digest}
+        if usable and entry['sha256'] == digest:
+            # touched but not changed
+            self.sources[rel] = record
+            self.reused += 1
+            return prev
+        data = read_json(path, raw)
+        self.reread.append(rel)
+        if data is not None:
+            self.sources[rel] = record
+        return data
+
+
+def merge(output_path, read=None):
     """Build merged dict using a fixed directory hierarchy at the given path.
 
     output_path should be a filesystem path. Expected content under that path:
       - d/{asr,gr,ser,aac,s2tt} each contain exactly one json
       - f/{asr,gr,ser,aac,s2tt} each contain exactly one json
       - n/None contains exactly one json
+
+    read(path, key) loads one source, key being where it goes in the merged
+    dict (default: read_json, see IncrementalReader).
     """
+    read = read or (lambda path, key: read_json(path))
     base = output_path
     merged = {}
 
@@ -74,7 +150,7 @@ def merge(output_path):
                 dirpath = os.path.join(split_base, t)
                 jp = find_single_json_in_dir(dirpath)
                 if jp:
-                    data = read_json(jp)
+                    data = read(jp, (split, t))
                     if data is not None:
                         merged[split][t] = data
 
@@ -86,7 +162,7 @@ def merge(output_path):
             subpath = os.path.join(n_base, sub)
             jp = find_single_json_in_dir(subpath)
             if jp:
-                data = read_json(jp)
+                data = read(jp, ('n', sub))
                 if data is not None:
                     merged['n'][sub] = data
     else:
@@ -95,7 +171,7 @@ def merge(output_path):
             dirpath = os.path.join(base, t)
             jp = find_single_json_in_dir(dirpath)
             if jp:
-                data = read_json(jp)
+                data = read(jp, (t,))
                 if data is not None:
                     merged[t] = data
 
@@ -107,38 +183,104 @@ def merge(output_path):
             subpath = os.path.join(n_dir, sub)
             jp = find_single_json_in_dir(subpath)
             if jp:
-                data = read_json(jp)
+                data = read(jp, ('n', sub))
                 if data is not None:
                     merged['n'][sub] = data
 
     return merged
 
 
-def write_output(obj, OUT_FILE):
-    if os.path.exists(OUT_FILE):
-        bak = OUT_FILE + '.bak.' + datetime.now().strftime('%Y%m%d%H%M%S')
-        shutil.copy2(OUT_FILE, bak)
-        print(f'Backed up existing {OUT_FILE} to {bak}')
-    with open(OUT_FILE, 'w', encoding='utf-8') as f:
+def backup(path, backup_dir, keep):
+    """Keep the current content of path as backup_dir/<name>.<sha16>.json and prune to the newest `keep`."""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    os.makedirs(backup_dir, exist_ok=True)
+    bak = os.path.join(backup_dir, f'{stem}.{sha256_bytes(raw)[:16]}.json')
+    if os.path.exists(bak):
+        os.utime(bak)   # same content backed up before: just mark it as the newest
+    else:
+        with open(bak, 'wb') as f:
+            f.write(raw)
+    print(f'Backed up existing {path} to {bak}')
+
+    baks = [os.path.join(backup_dir, f) for f in os.listdir(backup_dir) if f.startswith(stem + '.') and f.endswith('.json')]
+    for old in sorted(baks, key=os.path.getmtime, reverse=True)[max(keep, 0):]:
+        os.remove(old)
+
+
+def write_json_atomic(obj, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
         json.dump(obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def write_output(obj, OUT_FILE, backup_dir=None, keep_backups=5):
+    if os.path.exists(OUT_FILE):
+        backup(OUT_FILE, backup_dir or os.path.join(os.path.dirname(OUT_FILE), '.backups'), keep_backups)
+    write_json_atomic(obj, OUT_FILE)
     print(f'Wrote merged metrics to {OUT_FILE}')
 
 
+def load_previous(manifest_file, OUT_FILE, model_key):
+    """(manifest, previous merged body) if the manifest belongs to the current OUT_FILE, else ({}, None)."""
+    try:
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        with open(OUT_FILE, 'rb') as f:
+            raw = f.read()
+    except (OSError, json.JSONDecodeError):
+        return {}, None
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('model') != model_key \
+            or manifest.get('output_sha256') != sha256_bytes(raw):
+        return {}, None   # the merged file was edited or written by an older version
+    previous = read_json(OUT_FILE, raw)
+    return manifest, (previous or {}).get(model_key)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Merge metric JSONs from a provided output PATH into data/collect_all_metrics.json')
     parser.add_argument('--model_output', required=True, help='path to the output folder containing fixed d,f,n hierarchy (e.g. /path/to/output). The basename of this path will be used as the top-level model key in the result.')
     parser.add_argument('--model_name', required=True, help='your model name')
+    parser.add_argument('--keep_backups', type=int, default=5, help='how many previous merged files to keep under .backups/')
+    parser.add_argument('--full', action='store_true', help='re-read every source, ignoring the manifest')
+    parser.add_argument('--db', default=DEFAULT_DB, help='results store to add the merged metrics to')
+    parser.add_argument('--no_db', action='store_true', help='do not write to the results store')
     args = parser.parse_args()
     out_path = args.model_output
     # resolve to absolute path
     out_path = os.path.abspath(out_path)
 
-    merged_body = merge(out_path)
     model_key = args.model_name
-    wrapped = {model_key: merged_body}
     # os.path.join(DATA_DIR, 'collect_all_metrics.json')
     OUT_FILE = os.path.join(args.model_output, f"{model_key}_collect_all_metrics.json")
-    write_output(wrapped, OUT_FILE)
+    manifest_file = os.path.join(args.model_output, f".{model_key}_merge_manifest.json")
+
+    manifest, previous = ({}, None) if args.full else load_previous(manifest_file, OUT_FILE, model_key)
+    reader = IncrementalReader(out_path, manifest, previous)
+    merged_body = merge(out_path, reader)
+    print(f'Read {len(reader.reread)} changed source(s), reused {reader.reused}')
+
+    wrapped = {model_key: merged_body}
+    if previous is not None and merged_body == previous and os.path.exists(OUT_FILE):
+        print(f'{OUT_FILE} is up to date')
+    else:
+        write_output(wrapped, OUT_FILE, keep_backups=args.keep_backups)
+
+    with open(OUT_FILE, 'rb') as f:
+        output_sha256 = sha256_bytes(f.read())
+    write_json_atomic({
+        'version': MANIFEST_VERSION,
+        'model': model_key,
+        'output_sha256': output_sha256,
+        'sources': reader.sources,
+    }, manifest_file)
+
+    if not args.no_db:
+        with ResultsDB(args.db) as db:
+            run_id = db.add_model(model_key, merged_body, source=OUT_FILE)
+        print(f'Results store {args.db}: ' + (f'added run {run_id}' if run_id else 'unchanged'))
 
 
 if __name__ == '__main__':
@@ -1,44 +1,62 @@
 import argparse
+import json
 import os
 
-def process_metrics(dim, task, input_file, output_file):
+from results_db import DEFAULT_DB, ResultsDB
+
+# scorer of each d/f task; the n dimension has a single scorer
+TASK_SCORERS = {
+    'asr': 'compute_if_wer.py',
+    'aac': 'compute_if_aac.py',
+    's2tt': 'compute_if_bleu.py',
+    'gr': 'compute_if_acc.py',
+    'ser': 'compute_if_acc.py',
+}
+
+def scorer_script(dim, task=None):
+    if dim == 'n':
+        return "metric/n/compute_ifr_metrics.py"
+    return f"metric/{dim}/{TASK_SCORERS[task]}"
+
+def process_metrics(dim, task, input_file, output_file, bootstrap=0, seed=0):
     # Placeholder for the actual metric processing logic
     print(f"Processing metrics for dim={dim}, task={task}, input={input_file}, output={output_file}")
     # Here you would add the code to read the input file, compute metrics, and write to the output file
-    if dim == 'd' :
-        if task == 'asr':
-            os.system(f"python metric/d/compute_if_wer.py {input_file} > {output_file}")
-        elif task == 'aac':
-            os.system(f"python metric/d/compute_if_aac.py {input_file} > {output_file}")
-        elif task == 's2tt':
-            os.system(f"python metric/d/compute_if_bleu.py {input_file} > {output_file}")
-        elif task == 'gr' or task == 'ser':
-            os.system(f"python metric/d/compute_if_acc.py {input_file} > {output_file}")
-    elif dim == 'f' :
-        if task == 'asr':
-            os.system(f"python metric/f/compute_if_wer.py {input_file} > {output_file}")
-        elif task == 'aac':
-            os.system(f"python metric/f/compute_if_aac.py {input_file} > {output_file}")
-        elif task == 's2tt':
-            os.system(f"python metric/f/compute_if_bleu.py {input_file} > {output_file}")
-        elif task == 'gr' or task == 'ser':
-            os.system(f"python metric/f/compute_if_acc.py {input_file} > {output_file}")
-    elif dim == 'n' :
-        os.system(f"python metric/n/compute_ifr_metrics.py {input_file} > {output_file}")
-        
+    # the resampled values go next to the output, for calc_area.py --bootstrap
+    samples = os.path.splitext(output_file)[0] + ".bootstrap.npz"
+    opts = f" --bootstrap {bootstrap} --seed {seed} --bootstrap_samples {samples}" if bootstrap else ""
+    os.system(f"python {scorer_script(dim, task)} {input_file}{opts} > {output_file}")
+
+
+def store_metrics(db_path, model, dim, task, input_file, output_file):
+    """Add a scorer output to the results store as a run of model (see results_db.py)."""
+    try:
+        with open(output_file, "r", encoding="utf-8") as f:
+            res = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Not adding {output_file} to the results store: {e}")
+        return
+    with ResultsDB(db_path) as db:
+        run_id = db.add_scorer_output(model, dim, task, res, source=input_file)
+    print(f"Results store {db_path}: " + (f"added run {run_id}" if run_id else "unchanged"))
+
 
 def main():
     parser = argparse.ArgumentParser(description="Process metrics based on dimension and task.")
     parser.add_argument("--dim", required=True, choices=["d", "f", "n"], help="Dimension: d, f, or n")
     parser.add_argument("--task", choices=["asr", "aac", "s2tt", "gr", "ser"], help="Task type")
     parser.add_argument("--test_model", required=True, help="The tested model name")
-    parser.add_argument("--input", required=True, help="Input JSON file")
+    parser.add_argument("--input", required=True, help="Input JSON file, or a shard directory of run_inference.py --shards")
+    parser.add_argument("--bootstrap", type=int, default=0, help="Item resamples for 95%% confidence intervals, 0 = off")
+    parser.add_argument("--seed", type=int, default=0, help="Bootstrap seed")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Results store the metrics are added to")
+    parser.add_argument("--no_db", action="store_true", help="Do not write to the results store")
     parser.add_argument("--output", help="Output JSON file, default will be output/{dim}/{task}/input_base_{dim}_{task}_metric.json")
 
     args = parser.parse_args()
 
     # Validate input file
-    if not os.path.isfile(args.input):
+    if not os.path.exists(args.input):
         raise FileNotFoundError(f"Input file {args.input} does not exist.")
 
     # Validate task argument based on dim
@@ -56,7 +74,9 @@ def main():
         args.output = f"{output_base}/output/{args.dim}/{args.task}/{args.test_model}_{args.dim}_{args.task}_metric.json"
         os.makedirs(os.path.dirname(args.output), exist_ok=True)
 
-    process_metrics(args.dim, args.task, args.input, args.output)
+    process_metrics(args.dim, args.task, args.input, args.output, args.bootstrap, args.seed)
+    if not args.no_db:
+        store_metrics(args.db, args.test_model, args.dim, args.task, args.input, args.output)
 
 
 if __name__ == "__main__":
@@ -9,6 +9,11 @@ import sys
 from aac_metrics.functional import meteor, cider_d, rouge_l
 from aac_metrics.utils.tokenization import preprocess_mono_sents, preprocess_mult_sents
 
+from scoring.bootstrap import ItemStats, ResampleOptions, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.results_io import load_results, run_diagnostics
+
 
 #  "The audio caption is: ..." / "the audio caption is ..." / "  THE AUDIO CAPTION IS :   ..."
 PREFIX_RE = re.compile(r"^\s*The audio caption is:\s*", re.IGNORECASE)
@@ -16,26 +21,8 @@ STRIP_PREFIX_FOR_EVAL = True
 
 
 def load_json_either_array_or_ndjson(path: str) -> List[Dict[str, Any]]:
-    """既兼容单个 JSON 数组文件，也兼容 NDJSON（一行一个 JSON）。"""
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-    try:
-        data = json.loads(content)
-        if isinstance(data, list):
-            return data
-        elif isinstance(data, dict):
-            return [data]
-        else:
-            raise ValueError("Top-level JSON must be array or object.")
-    except json.JSONDecodeError:
-        out = []
-        with open(path, "r", encoding="utf-8") as f:
-            for ln in f:
-                ln = ln.strip()
-                if not ln:
-                    continue
-                out.append(json.loads(ln))
-        return out
+    # JSON array / object, NDJSON, or a shard directory of run_inference.py --shards
+    return load_results(path)
 
 
 def flatten_variation_values(v: Union[str, List, Dict]) -> List[str]:
@@ -60,12 +47,14 @@ def strip_surrounding_quotes(s: str) -> str:
     return s
 
 
-def prepare_dataset(samples: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]], Dict[str, Tuple[int, int]]]:
+def prepare_dataset(samples: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]], Dict[str, List[Tuple[int, bool]]], VariationCounts, FailureLog]:
     var2cands: Dict[str, List[str]] = defaultdict(list)
     var2refs:  Dict[str, List[List[str]]] = defaultdict(list)
-    var2ifr_cnt: Dict[str, List[int]] = defaultdict(lambda: [0, 0])  # [follow_cnt, total_cnt]
+    var2rows:  Dict[str, List[Tuple[int, bool]]] = defaultdict(list)   # (item index, followed)
+    counts = VariationCounts()
+    failures = FailureLog()
 
-    for ex in samples:
+    for idx, ex in enumerate(samples):
         raw_refs = ex.get("text", "")
         refs = [r.strip() for r in str(raw_refs).split("|") if r.strip()]
         if not refs:
@@ -78,41 +67,49 @@ def prepare_dataset(samples: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]]
         for var_name, var_value in vr.items():
             if isinstance(var_value, dict):
                 for var_name, var_value in var_value.items():
+                    vid = counts.intern(var_name)
                     cand_list = flatten_variation_values(var_value)
 
                     for cand in cand_list:
-                        var2ifr_cnt[var_name][1] += 1  # total++
                         cand = str(cand).replace("\r\n", " ").replace("\n", " ").replace("\r", " ").strip()
 
-                        if PREFIX_RE.match(cand):
-                            var2ifr_cnt[var_name][0] += 1
+                        followed = bool(PREFIX_RE.match(cand))
+                        counts.add(vid, followed)
+                        if followed:
+                            failures.add(var_name, Fail.FOLLOWED)
                             if STRIP_PREFIX_FOR_EVAL:
                                 cand = PREFIX_RE.sub("", cand, count=1).strip()
                             cand_eval = strip_surrounding_quotes(cand)
                         else:
                             cand_eval = ""
+                            failures.add(var_name, Fail.PREFIX_MISSING)
 
                         var2cands[var_name].append(cand_eval)
                         var2refs[var_name].append(refs)
+                        var2rows[var_name].append((idx, followed))
             else:
+                vid = counts.intern(var_name)
                 cand_list = flatten_variation_values(var_value)
 
                 for cand in cand_list:
-                    var2ifr_cnt[var_name][1] += 1  # total++
                     cand = str(cand).replace("\r\n", " ").replace("\n", " ").replace("\r", " ").strip()
 
-                    if PREFIX_RE.match(cand):
-                        var2ifr_cnt[var_name][0] += 1
+                    followed = bool(PREFIX_RE.match(cand))
+                    counts.add(vid, followed)
+                    if followed:
+                        failures.add(var_name, Fail.FOLLOWED)
                         if STRIP_PREFIX_FOR_EVAL:
                             cand = PREFIX_RE.sub("", cand, count=1).strip()
                         cand_eval = strip_surrounding_quotes(cand)
                     else:
                         cand_eval = ""
+                        failures.add(var_name, Fail.PREFIX_MISSING)
 
                     var2cands[var_name].append(cand_eval)
                     var2refs[var_name].append(refs)
+                    var2rows[var_name].append((idx, followed))
 
-    return var2cands, var2refs, {k: (v[0], v[1]) for k, v in var2ifr_cnt.items()}
+    return var2cands, var2refs, var2rows, counts, failures
 
 
 def score_variation(cands: List[str], mult_refs: List[List[str]]) -> Dict[str, float]:
@@ -130,9 +127,25 @@ def score_variation(cands: List[str], mult_refs: List[List[str]]) -> Dict[str, f
     }
 
 
-def main(json_path: str):
+def bootstrap_stats(var2cands, var2refs, var2rows) -> ItemStats:
+    # corpus METEOR does not decompose over items; resamples use the mean sentence-level METEOR,
+    # shifted to be centred on the corpus METEOR (report_resampling centers)
+    order = sorted(var2cands)
+    cands = [c for var in order for c in var2cands[var]]
+    refs = [r for var in order for r in var2refs[var]]
+    _, m_sents = meteor(preprocess_mono_sents(cands), preprocess_mult_sents(refs))
+    sent_scores = iter(m_sents["meteor"].tolist())
+
+    item_stats = ItemStats(("total", "follow", "meteor"))
+    for var in order:
+        for idx, followed in var2rows[var]:
+            item_stats.add(var, idx, total=1, follow=followed, meteor=next(sent_scores))
+    return item_stats
+
+
+def main(json_path: str, opts: ResampleOptions = ResampleOptions()):
     data = load_json_either_array_or_ndjson(json_path)
-    var2cands, var2refs, var2ifr_cnt = prepare_dataset(data)
+    var2cands, var2refs, var2rows, counts, failures = prepare_dataset(data)
     res = {}
 
     # print("== ACC Variation Evaluation ==")
@@ -146,11 +159,11 @@ def main(json_path: str):
     for var in sorted(var2cands.keys()):
         cands = var2cands[var]
         refs  = var2refs[var]
-        follow, total = var2ifr_cnt.get(var, (0, 0))
-        if total == 0:
+        vid = counts.ids.get(var)
+        if vid is None or counts.total[vid] == 0:
             continue
         scores = score_variation(cands, refs)
-        ifr_pct = 100.0 * follow / total
+        ifr_pct = counts.ifr(vid)
         # print(row.format(
         #     var[:28], total, follow, ifr_pct,
         #     scores["METEOR"], scores["CIDEr-D"], scores["ROUGE-L"]
@@ -162,13 +175,11 @@ def main(json_path: str):
             "ROUGE-L": round(scores["ROUGE-L"], 4)
         }
 
-    all_cands, all_refs, all_follow, all_total = [], [], 0, 0
+    all_cands, all_refs = [], []
     for var in var2cands:
         all_cands.extend(var2cands[var])
         all_refs.extend(var2refs[var])
-        f, t = var2ifr_cnt[var]
-        all_follow += f
-        all_total  += t
+    all_follow, all_total = counts.all_follow(), counts.all_total()
     if all_total > 0:
         scores = score_variation(all_cands, all_refs)
         ifr_pct = 100.0 * all_follow / all_total
@@ -184,13 +195,20 @@ def main(json_path: str):
             "ROUGE-L": round(scores["ROUGE-L"], 4)
         }
 
+    res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+    if opts.enabled and counts.all_total() > 0:
+        item_stats = bootstrap_stats(var2cands, var2refs, var2rows)
+        report_resampling(res, item_stats, ("ifr", "METEOR"), [ex.get("path") for ex in data], opts,
+                          variations=sorted(var2cands),
+                          centers={var: {"METEOR": r["METEOR"]} for var, r in res.items() if "METEOR" in r})
+
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python compute_if_aac.py <json_path>")
+        print("Usage: python compute_if_aac.py <json_path> [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
     json_path = sys.argv[1]
-    main(json_path)
+    main(json_path, resample_args(sys.argv[2:]))
@@ -1,6 +1,12 @@
 import sys
 import json
-from collections import defaultdict
+import numpy as np
+
+from scoring.bootstrap import ItemStats, report_resampling, resample_args
+from scoring.counters import KeyIndex
+from scoring.failures import Fail, FailureLog
+from scoring.labels import LabelEngine
+from scoring.results_io import load_results, run_diagnostics
 
 def task_of(item):
     t = (item.get("task") or "").lower()
@@ -12,6 +18,7 @@ def task_of(item):
     return "SER"
 
 file = sys.argv[1]
+opts = resample_args(sys.argv[2:])
 
 # file name format: /path/to/file_prefix_taskname.json
 # task = file.split("/")[-1].split('.')[1].split('_')[-1]
@@ -19,15 +26,10 @@ file = sys.argv[1]
 SER_VALID = ["happy", "sad", "angry", "neutral"]
 GR_VALID = ["male", "female"]
 
-with open(file, "r", encoding="utf-8") as f:
-        data = json.load(f)
+data = load_results(file)
 
 task = task_of(data[0]).lower()
 
-if_cnt = defaultdict(int)
-correct = defaultdict(int)
-total = defaultdict(int)
-
 if task == "ser":
     valid = SER_VALID
 elif task == "gr":
@@ -36,6 +38,8 @@ else:
     print(f"Unknown task: {task}")
     raise NotImplementedError
 
+engine = LabelEngine(valid, mode="exact")
+
 def iter_preds_by_topkey(value):
     if isinstance(value, str):
         yield value
@@ -48,49 +52,63 @@ def iter_preds_by_topkey(value):
             if isinstance(x, str):
                 yield x
 
-def extract_label(s: str):
-    s = s.strip("'").strip('"').strip(".").lower()
-    return s
-
-key_order = []
-for item in data:
-    label = item["text"].lower()
+# one row per response: item index, variation id, gold label code, raw response
+key_index = KeyIndex()
+item_col, var_col, gold_col, preds = [], [], [], []
+for idx, item in enumerate(data):
+    gold = engine.label_code(item["text"])
     vr = item.get("variation_responses", {}) or {}
     
     for top_key, value in vr.items():
-        if top_key not in key_order:
-            key_order.append(top_key)
+        vid = key_index.intern(top_key)
 
         for pred in iter_preds_by_topkey(value):
-            # print(f"pred: {pred}")
-            pred_norm = extract_label(pred)
-            # print(f"pred_norm: {pred_norm}")
-            if pred_norm in valid:
-                if_cnt[top_key] += 1
-                total[top_key] += 1
-                if pred_norm == label:
-                    correct[top_key] += 1
-            else:
-                total[top_key] += 1
+            item_col.append(idx)
+            var_col.append(vid)
+            gold_col.append(gold)
+            preds.append(pred)
+
+codes = engine.encode(preds)
+var_col = np.asarray(var_col, dtype=np.int64)
+followed = codes >= 0
+correct = followed & (codes == np.asarray(gold_col, dtype=np.int8))
+
+n_keys = len(key_index)
+total = np.bincount(var_col, minlength=n_keys)
+if_cnt = np.bincount(var_col, weights=followed, minlength=n_keys)
+n_correct = np.bincount(var_col, weights=correct, minlength=n_keys)
+
+failures = FailureLog()
+fail_col = np.where(followed, Fail.FOLLOWED, Fail.LABEL_INVALID)
+for vid, k in enumerate(key_index):
+    failures.extend(k, fail_col[var_col == vid])
 
 res = {}
-total_cnt = sum(total.values())
-total_follow = sum(if_cnt.values())
-total_correct = sum(correct.values())
+total_cnt = int(total.sum())
 res['all'] = {
-    "ifr": round(100.0 * total_follow / total_cnt, 2),
-    "acc": round(100.0 * total_correct / total_cnt, 2)
+    "ifr": round(100.0 * if_cnt.sum() / total_cnt, 2),
+    "acc": round(100.0 * n_correct.sum() / total_cnt, 2)
 }
 
-for k in key_order:
-    assert total[k] != 0, f"No response in {k}!"
-    ifr = 100.0 * if_cnt[k] / total[k]
-    acc = 100.0 * correct[k] / total[k]
+for vid, k in enumerate(key_index):
+    assert total[vid] != 0, f"No response in {k}!"
+    ifr = 100.0 * if_cnt[vid] / total[vid]
+    acc = 100.0 * n_correct[vid] / total[vid]
     res[k] = {
-        "ifr": round(ifr, 2),
-        "acc": round(acc, 2)
+        "ifr": round(float(ifr), 2),
+        "acc": round(float(acc), 2)
     }
     # print(f"[{k}]: IFR / ACC : {ifr:.2f} / {acc:.2f}")
 
+res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+
+if opts.enabled:
+    item_stats = ItemStats(("total", "follow", "correct"))
+    for vid, k in enumerate(key_index):
+        rows = var_col == vid
+        item_stats.extend(k, np.asarray(item_col)[rows], total=np.ones(rows.sum()),
+                          follow=followed[rows], correct=correct[rows])
+    report_resampling(res, item_stats, ("ifr", "acc"), [item.get("path") for item in data], opts)
+
 output = json.dumps(res, indent=2, ensure_ascii=False)
 print(output)
@@ -9,6 +9,11 @@ from typing import Any, Dict, List, Tuple, Union
 
 import sacrebleu 
 
+from scoring.bootstrap import BLEU_STATS, ItemStats, ResampleOptions, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.results_io import load_results, run_diagnostics
+
 
 PREFIX_RE = re.compile(r"^\s*the translation is:\s*", re.IGNORECASE)
 STRIP_PREFIX_FOR_EVAL = True    
@@ -16,25 +21,9 @@ SACREBLEU_TOKENIZE = "zh"
 
 
 def load_json_either_array_or_ndjson(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-    try:
-        data = json.loads(content)
-        if isinstance(data, list):
-            return data
-        elif isinstance(data, dict):
-            return [data]
-        else:
-            raise ValueError("Top-level JSON must be array or object.")
-    except json.JSONDecodeError:
-        out = []
-        with open(path, "r", encoding="utf-8") as f:
-            for ln in f:
-                ln = ln.strip()
-                if not ln:
-                    continue
-                out.append(json.loads(ln))
-        return out
+    # JSON array / object, NDJSON, or a shard directory of run_inference.py --shards
+    return load_results(path)
+
 
 def flatten_variation_values(v: Union[str, List, Dict]) -> List[str]:
     results: List[str] = []
@@ -60,13 +49,15 @@ def sanitize_text(s: str) -> str:
 
 def prepare_dataset(
     samples: List[Dict[str, Any]]
-) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]], Dict[str, Tuple[int, int]]]:
+) -> Tuple[Dict[str, List[str]], Dict[str, List[List[str]]], Dict[str, List[Tuple[int, bool]]], VariationCounts, FailureLog]:
 
     var2cands: Dict[str, List[str]] = defaultdict(list)
     var2refs:  Dict[str, List[List[str]]] = defaultdict(list)
-    var2ifr_cnt: Dict[str, List[int]] = defaultdict(lambda: [0, 0])  # [follow_cnt, total_cnt]
+    var2rows:  Dict[str, List[Tuple[int, bool]]] = defaultdict(list)   # (item index, followed)
+    counts = VariationCounts()
+    failures = FailureLog()
 
-    for ex in samples:
+    for idx, ex in enumerate(samples):
         raw_refs = ex.get("text", "")
         refs = [sanitize_text(r) for r in str(raw_refs).split("|") if r.strip()]
         if not refs:
@@ -79,39 +70,47 @@ def prepare_dataset(
         for var_name, var_value in vr.items():
             if isinstance(var_value, dict):
                 for var_name, var_value in var_value.items():
+                    vid = counts.intern(var_name)
                     cand_list = flatten_variation_values(var_value)
                     for cand in cand_list:
-                        var2ifr_cnt[var_name][1] += 1  # total++
                         cand = sanitize_text(str(cand))
 
-                        if PREFIX_RE.match(cand):
-                            var2ifr_cnt[var_name][0] += 1
+                        followed = bool(PREFIX_RE.match(cand))
+                        counts.add(vid, followed)
+                        if followed:
+                            failures.add(var_name, Fail.FOLLOWED)
                             if STRIP_PREFIX_FOR_EVAL:
                                 cand = PREFIX_RE.sub("", cand).strip()
                             cand = strip_surrounding_quotes(cand)
                         else:
                             cand = ""
+                            failures.add(var_name, Fail.PREFIX_MISSING)
 
                         var2cands[var_name].append(cand)
                         var2refs[var_name].append(refs)
+                        var2rows[var_name].append((idx, followed))
             else:
+                vid = counts.intern(var_name)
                 cand_list = flatten_variation_values(var_value)
                 for cand in cand_list:
-                    var2ifr_cnt[var_name][1] += 1  # total++
                     cand = sanitize_text(str(cand))
 
-                    if PREFIX_RE.match(cand):
-                        var2ifr_cnt[var_name][0] += 1
+                    followed = bool(PREFIX_RE.match(cand))
+                    counts.add(vid, followed)
+                    if followed:
+                        failures.add(var_name, Fail.FOLLOWED)
                         if STRIP_PREFIX_FOR_EVAL:
                             cand = PREFIX_RE.sub("", cand).strip()
                         cand = strip_surrounding_quotes(cand)
                     else:
                         cand = ""
+                        failures.add(var_name, Fail.PREFIX_MISSING)
 
                     var2cands[var_name].append(cand)
                     var2refs[var_name].append(refs)
+                    var2rows[var_name].append((idx, followed))
 
-    return var2cands, var2refs, {k: (v[0], v[1]) for k, v in var2ifr_cnt.items()}
+    return var2cands, var2refs, var2rows, counts, failures
 
 def to_sacrebleu_refs(mult_refs: List[List[str]]) -> List[List[str]]:
     if not mult_refs:
@@ -127,10 +126,25 @@ def score_bleu(cands: List[str], mult_refs: List[List[str]]) -> sacrebleu.metric
     ref_sets = to_sacrebleu_refs(mult_refs)
     return sacrebleu.corpus_bleu(cands, ref_sets, tokenize=SACREBLEU_TOKENIZE) 
 
-def main(json_path: str):
+# sentence-level n-gram counts add up to the corpus counts (see bootstrap_stats)
+BLEU_SCORER = sacrebleu.metrics.BLEU(tokenize=SACREBLEU_TOKENIZE, effective_order=True)
+
+def bleu_counts(hyp: str, refs: List[str]) -> List[int]:
+    st = BLEU_SCORER.sentence_score(hyp, refs)
+    return [st.sys_len, st.ref_len, *st.counts, *st.totals]
+
+def bootstrap_stats(var2cands, var2refs, var2rows) -> ItemStats:
+    item_stats = ItemStats(("total", "follow") + BLEU_STATS)
+    for var, cands in var2cands.items():
+        for cand, refs, (idx, followed) in zip(cands, var2refs[var], var2rows[var]):
+            # the refs[0] padding of to_sacrebleu_refs does not change the closest ref length or the counts
+            item_stats.add(var, idx, total=1, follow=followed, **dict(zip(BLEU_STATS, bleu_counts(cand, refs))))
+    return item_stats
+
+def main(json_path: str, opts: ResampleOptions = ResampleOptions()):
     res = {}
     data = load_json_either_array_or_ndjson(json_path)
-    var2cands, var2refs, var2ifr_cnt = prepare_dataset(data)
+    var2cands, var2refs, var2rows, counts, failures = prepare_dataset(data)
 
     # print("== Translation Variation Evaluation (BLEU) ==")
     # print(f"Prefix requirement: /^{PREFIX_RE.pattern}$/  strip_prefix_for_eval={STRIP_PREFIX_FOR_EVAL}  tokenize={SACREBLEU_TOKENIZE}")
@@ -142,14 +156,14 @@ def main(json_path: str):
     for var in sorted(var2cands.keys()):
         hyps = var2cands[var]
         mrefs = var2refs[var]
-        follow, total = var2ifr_cnt.get(var, (0, 0))
-        if total == 0:
+        vid = counts.ids.get(var)
+        if vid is None or counts.total[vid] == 0:
             continue
         score = score_bleu(hyps, mrefs)
         p1, p2, p3, p4 = score.precisions
         bp = score.bp
         len_ratio = (score.sys_len / score.ref_len) if score.ref_len > 0 else 0.0
-        ifr_pct = 100.0 * follow / total
+        ifr_pct = counts.ifr(vid)
         # print(row.format(
         #     var[:28], total, follow, ifr_pct,
         #     score.score,  # BLEU
@@ -168,13 +182,11 @@ def main(json_path: str):
             "len_ratio": round(len_ratio, 4)
         }
 
-    all_hyps, all_mrefs, all_follow, all_total = [], [], 0, 0
+    all_hyps, all_mrefs = [], []
     for var in var2cands:
         all_hyps.extend(var2cands[var])
         all_mrefs.extend(var2refs[var])
-        f, t = var2ifr_cnt[var]
-        all_follow += f
-        all_total  += t
+    all_follow, all_total = counts.all_follow(), counts.all_total()
     if all_total > 0:
         score = score_bleu(all_hyps, all_mrefs)
         p1, p2, p3, p4 = score.precisions
@@ -197,11 +209,17 @@ def main(json_path: str):
             "len_ratio": round(len_ratio, 4)
         }
 
+    res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+    if opts.enabled:
+        item_stats = bootstrap_stats(var2cands, var2refs, var2rows)
+        report_resampling(res, item_stats, ("ifr", "bleu"), [ex.get("path") for ex in data], opts,
+                          variations=sorted(var2cands))
+
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output) 
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python compute_if_bleu.py <json_path>")
+        print("Usage: python compute_if_bleu.py <json_path> [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
-    main(sys.argv[1])
+    main(sys.argv[1], resample_args(sys.argv[2:]))
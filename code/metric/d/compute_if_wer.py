@@ -7,19 +7,27 @@ import re
 from collections import defaultdict
 import jiwer
 from normalizers.english import EnglishTextNormalizer
+from scoring.bootstrap import ItemStats, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.results_io import load_results, run_diagnostics
 
 PREFIX_RE = re.compile(r'^\s*the transcript is\s*:\s*', flags=re.IGNORECASE)
 file = sys.argv[1]
+opts = resample_args(sys.argv[2:])
 
-with open(file, "r", encoding="utf-8") as f:
-    data = json.load(f)
+data = load_results(file)
 
 # 统计容器
-key_order = []
-total_preds = defaultdict(int) 
-if_follow = defaultdict(int)
+counts = VariationCounts()
 gts_by_key = defaultdict(list)
 hyps_by_key = defaultdict(list) 
+failures = FailureLog()
+item_stats = ItemStats(("total", "follow", "edits", "words")) if opts.enabled else None
+
+def word_edits(ref: str, hyp: str):
+    out = jiwer.process_words(ref, hyp)
+    return out.substitutions + out.deletions + out.insertions, out.hits + out.substitutions + out.deletions
 
 def iter_preds_by_topkey(value):
     if isinstance(value, str):
@@ -41,22 +49,23 @@ def strip_transcript_prefix(s: str) -> str:
 
 normalizer = EnglishTextNormalizer()
 
-for item in data:
+for idx, item in enumerate(data):
     ref_text = normalizer(item.get("text", ""))
 
     vr = item.get("variation_responses", {}) or {}
     for top_key, value in vr.items():
-        if top_key not in key_order:
-            key_order.append(top_key)
+        vid = counts.intern(top_key)
 
         for pred in iter_preds_by_topkey(value):
-            total_preds[top_key] += 1
-            if has_transcript_prefix(pred):
-                if_follow[top_key] += 1
+            followed = has_transcript_prefix(pred)
+            counts.add(vid, followed)
+            if followed:
+                failures.add(top_key, Fail.FOLLOWED)
                 hyp_text = normalizer(strip_transcript_prefix(pred))
                 # print(hyp_text)
             else:
                 hyp_text = ""
+                failures.add(top_key, Fail.PREFIX_MISSING)
                 # hyp_text = normalizer(strip_transcript_prefix(pred))
                 # if top_key == "default":
                 #     print(f"[Base instruction]: {item["base"][0]}")
@@ -66,13 +75,17 @@ for item in data:
             gts_by_key[top_key].append(ref_text)
             hyps_by_key[top_key].append(hyp_text)
 
+            if item_stats is not None:
+                edits, words = word_edits(ref_text, hyp_text)
+                item_stats.add(top_key, idx, total=1, follow=followed, edits=edits, words=words)
+
 res = {}
 
-for k in key_order:
-    assert total_preds[k] != 0, f"No response in {k}!"
+for vid, k in enumerate(counts):
+    assert counts.total[vid] != 0, f"No response in {k}!"
 
     # IFR
-    ifr = 100.0 * if_follow[k] / total_preds[k]
+    ifr = counts.ifr(vid)
 
     # WER
     gts = gts_by_key[k]
@@ -94,7 +107,7 @@ for k in key_order:
     # print(f"[{k}]: IFR -- {ifr:.2f}%; WER -- {wer_str}")
 
 all_gts, all_hyps = [], []
-for k in key_order:
+for k in counts:
     all_gts.extend(gts_by_key[k])
     all_hyps.extend(hyps_by_key[k])
 
@@ -102,12 +115,16 @@ if len(all_gts) == 0:
     print("[ALL]: WER -- N/A")
 else:
     all_wer = jiwer.wer(all_gts, all_hyps) * 100.0 
-    all_ifr = 100.0 * sum(if_follow.values()) / sum(total_preds.values())
+    all_ifr = 100.0 * counts.all_follow() / counts.all_total()
     res['all'] = {
         "ifr": round(all_ifr, 2),
         "wer": round(all_wer, 2)
     }
     # print(f"[ALL]: WER -- {all_wer:.2f}%")
 
+res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+if item_stats is not None:
+    report_resampling(res, item_stats, ("ifr", "wer"), [item.get("path") for item in data], opts)
+
 output = json.dumps(res, indent=2, ensure_ascii=False)
 print(output)
\ No newline at end of file
@@ -10,6 +10,12 @@ from typing import Any, Dict, List, Tuple, Union
 from aac_metrics.functional import meteor, cider_d, rouge_l
 from aac_metrics.utils.tokenization import preprocess_mono_sents, preprocess_mult_sents
 
+from scoring.bootstrap import ItemStats, ResampleOptions, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.gates import PhraseMatcher, is_repeated_sentence
+from scoring.results_io import load_results, run_diagnostics
+
 LABEL_RE = re.compile(
     r'^\s*(the\s+audio\s+caption\s+is|caption|result|description)\s*:\s*',
     flags=re.IGNORECASE,
@@ -19,100 +25,87 @@ BAD_MARKER_RE = re.compile(r'[\{\}\[\]\<\>]|`{3}|\*\*')  # { } [ ] < >  ```  **
 UPPER_RE = re.compile(r"[A-Z]")
 LOWER_RE = re.compile(r"[a-z]")
 
-def is_repeated_sentence(sentence: str) -> bool:
-    normalized = re.sub(r"[^\w\s]", " ", sentence).lower()
-    words = normalized.split()
-    n = len(words)
-    if n < 2:
-        return False
-    
-    for size in range(1, n // 2 + 1):
-        if n % size == 0:
-            unit = words[:size]
-            if unit * (n // size) == words:
-                return True
-    return False
-
-def ifr_constrain(resp: str) -> Tuple[bool, str]:
-
-    candidates = [
-        'there is',
-        'the clip',
-        'the audio',
-        'the recording',
-        'no audio',
-        'there are',
-        'sorry',
-        'can\'t',
-        'caption',
-        'label',
-        ':',
-        'the scene',
-        'this is',
-        'element',
-        'the soundscape',
-        'the text',
-        'the speaker',
-        'capture',
-        '?',
-    ]
-
-    def judge(item):
-        flag = True
-        for cand in candidates:
-            if (cand.lower() in item.lower()) or is_repeated_sentence(item):
-                flag = False
-                break
-        return flag
-    follow = judge(resp)
-    return follow, (resp.strip() if follow else "")
-
-def ifr_upper(resp: str) -> Tuple[bool, str]:
+candidates = [
+    'there is',
+    'the clip',
+    'the audio',
+    'the recording',
+    'no audio',
+    'there are',
+    'sorry',
+    'can\'t',
+    'caption',
+    'label',
+    ':',
+    'the scene',
+    'this is',
+    'element',
+    'the soundscape',
+    'the text',
+    'the speaker',
+    'capture',
+    '?',
+]
+CONSTRAIN_MATCHER = PhraseMatcher(candidates)
+
+def judge(item: str) -> Fail:
+    if CONSTRAIN_MATCHER.scan(item):
+        return Fail.CANDIDATE_PHRASE
+    if is_repeated_sentence(item):
+        return Fail.REPEATED
+    return Fail.FOLLOWED
+
+def ifr_constrain(resp: str) -> Tuple[bool, str, Fail]:
+    why = judge(resp)
+    follow = why == Fail.FOLLOWED
+    return follow, (resp.strip() if follow else ""), why
+
+def ifr_upper(resp: str) -> Tuple[bool, str, Fail]:
     s = resp or ""
     has_lower = bool(LOWER_RE.search(s))
     has_upper = bool(UPPER_RE.search(s))
     follow = (not has_lower) and has_upper
-    return follow, (s.strip() if follow else "")
+    return follow, (s.strip() if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
-def ifr_lower(resp: str) -> Tuple[bool, str]:
+def ifr_lower(resp: str) -> Tuple[bool, str, Fail]:
     s = resp or ""
     has_upper = bool(UPPER_RE.search(s))
     has_lower = bool(LOWER_RE.search(s))
     follow = (not has_upper) and has_lower
-    return follow, (s.strip() if follow else "")
+    return follow, (s.strip() if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
-def ifr_prefix(prefix: str, resp: str) -> Tuple[bool, str]:
+def ifr_prefix(prefix: str, resp: str) -> Tuple[bool, str, Fail]:
     s = (resp or "")
     p = prefix or ""
     t = s.lstrip()
     if t.startswith(p):
-        return True, t[len(p):].lstrip()
-    return False, ""
+        return True, t[len(p):].lstrip(), Fail.FOLLOWED
+    return False, "", Fail.PREFIX_MISSING
 
-def ifr_suffix(suffix: str, resp: str) -> Tuple[bool, str]:
+def ifr_suffix(suffix: str, resp: str) -> Tuple[bool, str, Fail]:
     s = (resp or "")
     su = suffix or ""
     t = s.rstrip()
     if t.endswith(su):
-        return True, t[:len(t)-len(su)].rstrip()
-    return False, ""
+        return True, t[:len(t)-len(su)].rstrip(), Fail.FOLLOWED
+    return False, "", Fail.SUFFIX_MISSING
 
-def ifr_wrap(lrt: str, resp: str) -> Tuple[bool, str]:
+def ifr_wrap(lrt: str, resp: str) -> Tuple[bool, str, Fail]:
     s = (resp or "")
     spec = lrt or ""
     if "|" not in spec:
-        return False, ""
+        return False, "", Fail.WRAP_SPEC
     left, right = spec.split("|", 1)
     t = s.strip()
     if t.startswith(left) and t.endswith(right):
-        return True, t[len(left):len(t)-len(right)].strip()
-    return False, ""
+        return True, t[len(left):len(t)-len(right)].strip(), Fail.FOLLOWED
+    return False, "", Fail.WRAP_MISSING
 
-def ifr_json(resp: str, expected_key: str | None = None) -> Tuple[bool, str]:
+def ifr_json(resp: str, expected_key: str | None = None) -> Tuple[bool, str, Fail]:
     try:
         obj = json.loads(resp)
     except Exception:
-        return False, ""
+        return False, "", Fail.JSON_INVALID
 
     def from_obj(d: Dict[str, Any]) -> Union[str, None]:
         if expected_key and isinstance(d.get(expected_key), str):
@@ -121,7 +114,7 @@ def ifr_json(resp: str, expected_key: str | None = None) -> Tuple[bool, str]:
 
     if isinstance(obj, dict):
         v = from_obj(obj)
-        return (True, v) if v else (False, "")
+        return (True, v, Fail.FOLLOWED) if v else (False, "", Fail.JSON_KEY_MISSING)
     if isinstance(obj, list):
         parts = []
         for x in obj:
@@ -130,28 +123,14 @@ def ifr_json(resp: str, expected_key: str | None = None) -> Tuple[bool, str]:
                 if v:
                     parts.append(v)
         if parts:
-            return True, " ".join(parts)
-    return False, ""
+            return True, " ".join(parts), Fail.FOLLOWED
+        return False, "", Fail.JSON_KEY_MISSING
+    return False, "", Fail.JSON_NOT_OBJECT
 
 def load_json_either_array_or_ndjson(path: str) -> List[Dict[str, Any]]:
-    with open(path, "r", encoding="utf-8") as f:
-        content = f.read().strip()
-    try:
-        data = json.loads(content)
-        if isinstance(data, list):
-            return data
-        elif isinstance(data, dict):
-            return [data]
-        else:
-            raise ValueError("Top-level JSON must be array or object.")
-    except json.JSONDecodeError:
-        out = []
-        with open(path, "r", encoding="utf-8") as f:
-            for ln in f:
-                ln = ln.strip()
-                if ln:
-                    out.append(json.loads(ln))
-        return out
+    # JSON array / object, NDJSON, or a shard directory of run_inference.py --shards
+    return load_results(path)
+
 
 def iter_preds_with_meta(value):
     if isinstance(value, str):
@@ -192,23 +171,28 @@ def score_variation(cands: List[str], mult_refs: List[List[str]]) -> Dict[str, U
     out["ROUGE-L"] = float(r_corpus["rouge_l"].item())
     return out
 
-def main(infer_path: str):
+def sentence_meteor(cands: List[str], mult_refs: List[List[str]]) -> List[float]:
+    c_proc = preprocess_mono_sents([sanitize(c) for c in cands])
+    r_proc = preprocess_mult_sents([[sanitize(r) for r in rs] for rs in mult_refs])
+    _, m_sents = meteor(c_proc, r_proc)
+    return m_sents["meteor"].tolist()
+
+def main(infer_path: str, opts: ResampleOptions = ResampleOptions()):
     data = load_json_either_array_or_ndjson(infer_path)
 
     res = {}
 
-    key_order = []
-    total_preds = defaultdict(int)   
-    if_follow = defaultdict(int)    
+    counts = VariationCounts()
 
     var2cands: Dict[str, List[str]] = defaultdict(list)
     var2refs:  Dict[str, List[List[str]]] = defaultdict(list)
 
     # overall
     all_cands, all_refs = [], []
-    all_total = all_follow_cnt = 0
+    all_rows = []   # (variation, item index, followed), parallel to all_cands
+    failures = FailureLog()
 
-    for item in data:
+    for idx, item in enumerate(data):
         refs_raw = item.get("text", "")
         refs = [r.strip() for r in str(refs_raw).split("|") if r.strip()]
         if not refs:
@@ -216,32 +200,28 @@ def main(infer_path: str):
 
         vr = item.get("variation_responses", {}) or {}
         for top_key, value in vr.items():
-            if top_key not in key_order:
-                key_order.append(top_key)
+            vid = counts.intern(top_key)
 
             for resp, meta in iter_preds_with_meta(value):
-                total_preds[top_key] += 1
-                all_total += 1
-
                 if top_key == "constrain":
-                    follow, body = ifr_constrain(resp)
+                    follow, body, why = ifr_constrain(resp)
                 elif top_key == "upper_case":
-                    follow, body = ifr_upper(resp)
+                    follow, body, why = ifr_upper(resp)
                 elif top_key == "lower_case":
-                    follow, body = ifr_lower(resp)
+                    follow, body, why = ifr_lower(resp)
                 elif top_key == "prefix":
-                    follow, body = ifr_prefix(meta.get("prefix", ""), resp)
+                    follow, body, why = ifr_prefix(meta.get("prefix", ""), resp)
                 elif top_key == "suffix":
-                    follow, body = ifr_suffix(meta.get("suffix", ""), resp)
+                    follow, body, why = ifr_suffix(meta.get("suffix", ""), resp)
                 elif top_key == "wrap":
-                    follow, body = ifr_wrap(meta.get("lrt", ""), resp)
+                    follow, body, why = ifr_wrap(meta.get("lrt", ""), resp)
                 elif top_key == "json":
-                    follow, body = ifr_json(resp, expected_key=meta.get("key"))
+                    follow, body, why = ifr_json(resp, expected_key=meta.get("key"))
                 else:
-                    follow, body = False, ""
+                    follow, body, why = False, "", Fail.UNKNOWN_VARIATION
 
-                if_follow[top_key] += int(follow)
-                all_follow_cnt += int(follow)
+                failures.add(top_key, why)
+                counts.add(vid, follow)
 
                 cand_eval = body if follow else ""
                 var2cands[top_key].append(cand_eval)
@@ -249,18 +229,19 @@ def main(infer_path: str):
 
                 all_cands.append(cand_eval)
                 all_refs.append(refs)
+                all_rows.append((top_key, idx, follow))
 
     # print("== Audio Caption Metrics by Variation ==")
     header = "{:<28} {:>8} {:>8} {:>9} {:>12} {:>12} {:>12}"
     row    = "{:<28} {:>8} {:>8} {:>8.1f}% {:>12} {:>12} {:>12}"
     # print(header.format("variation", "samples", "follow", "IFR", "METEOR", "CIDEr-D", "ROUGE-L"))
 
-    for k in key_order:
-        tot = total_preds[k]
+    for vid, k in enumerate(counts):
+        tot = counts.total[vid]
         if tot == 0:
             continue
-        follow = if_follow[k]
-        ifr = 100.0 * follow / tot
+        follow = counts.follow[vid]
+        ifr = counts.ifr(vid)
         scores = score_variation(var2cands[k], var2refs[k])
         m = scores["METEOR"]
         m_str = f"{m:.4f}" if isinstance(m, float) else "N/A"
@@ -277,6 +258,7 @@ def main(infer_path: str):
 
     if all_cands:
         scores = score_variation(all_cands, all_refs)
+        all_total, all_follow_cnt = counts.all_total(), counts.all_follow()
         all_ifr = 100.0 * all_follow_cnt / all_total if all_total else 0.0
         m = scores["METEOR"]
         m_str = f"{m:.4f}" if isinstance(m, float) else "N/A"
@@ -291,11 +273,21 @@ def main(infer_path: str):
             "CIDEr-D": round(scores["CIDEr-D"], 4),
             "ROUGE-L": round(scores["ROUGE-L"], 4)
         }
+    res['diagnostics'] = {'failures': failures.histograms(), 'phrase_hits': CONSTRAIN_MATCHER.hit_counts(),
+                          **run_diagnostics(data)}
+    if opts.enabled and all_cands:
+        # corpus METEOR does not decompose over items; resamples use the mean sentence-level METEOR,
+        # shifted to be centred on the corpus METEOR (report_resampling centers)
+        item_stats = ItemStats(("total", "follow", "meteor"))
+        for (var, idx, follow), m in zip(all_rows, sentence_meteor(all_cands, all_refs)):
+            item_stats.add(var, idx, total=1, follow=follow, meteor=m)
+        report_resampling(res, item_stats, ("ifr", "METEOR"), [item.get("path") for item in data], opts,
+                          centers={var: {"METEOR": r["METEOR"]} for var, r in res.items() if "METEOR" in r})
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python eval_aac_ifr_variations.py infer.json")
+        print("Usage: python eval_aac_ifr_variations.py infer.json [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
-    main(sys.argv[1])
+    main(sys.argv[1], resample_args(sys.argv[2:]))
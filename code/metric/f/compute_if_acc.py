@@ -4,10 +4,13 @@
 import sys
 import json
 import re
-from collections import defaultdict
+import numpy as np
 
-SER_SET = {"HAPPY", "SAD", "NEUTRAL", "ANGRY"}
-GR_SET  = {"MALE", "FEMALE"}
+from scoring.bootstrap import ItemStats, report_resampling, resample_args
+from scoring.counters import KeyIndex
+from scoring.failures import Fail, FailureLog
+from scoring.labels import LabelEngine
+from scoring.results_io import load_results, run_diagnostics
 
 SER_PAT = re.compile(r"\b(happy|sad|neutral|angry)\b", re.IGNORECASE)
 GR_PAT  = re.compile(r"\b(male|female)\b", re.IGNORECASE)
@@ -25,25 +28,17 @@ def task_of(item):
         return "GR"
     return "SER"
 
+ENGINES = {
+    "SER": LabelEngine(["happy", "sad", "neutral", "angry"]),
+    "GR": LabelEngine(["male", "female"]),
+}
+
 def canon(label: str, task: str):
     if not label:
         return None
-    s = label.strip().strip("'\"").strip()
-    m = (SER_PAT if task=="SER" else GR_PAT).search(s)
-    if not m:
-        return None
-    val = m.group(1).upper()
-    if task == "SER":
-        if val in SER_SET:
-            return val
-    else:
-        if val in GR_SET:
-            return val
-    return None
-
-def gt_label(item, task: str):
-    txt = str(item.get("text", ""))
-    return canon(txt, task)
+    engine = ENGINES[task]
+    code = engine.encode_one(label)
+    return engine.labels[code].upper() if code >= 0 else None
 
 UPPER_RE = re.compile(r"[A-Z]")
 LOWER_RE = re.compile(r"[a-z]")
@@ -57,66 +52,66 @@ def strip_quotes(s: str) -> str:
 def ifr_constrain(resp: str, task: str):
     s = strip_quotes(resp or "")
     if " " in s.strip():
-        return False, ""
+        return False, "", Fail.EXTRA_WORDS
     lab = canon(s, task)
     follow = lab is not None and s.strip().upper() == lab
-    return (True, s) if follow else (False, "")
+    return (True, s, Fail.FOLLOWED) if follow else (False, "", Fail.LABEL_INVALID)
 
 def ifr_upper(resp: str):
     s = resp or ""
     has_lower = bool(LOWER_RE.search(s))
     has_upper = bool(UPPER_RE.search(s))
     follow = (not has_lower) and has_upper
-    return (follow, s.strip() if follow else "")
+    return (follow, s.strip() if follow else "", Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_lower(resp: str):
     s = resp or ""
     has_upper = bool(UPPER_RE.search(s))
     has_lower = bool(LOWER_RE.search(s))
     follow = (not has_upper) and has_lower
-    return (follow, s.strip() if follow else "")
+    return (follow, s.strip() if follow else "", Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_prefix(prefix: str, resp: str):
     s = (resp or "")
     p = prefix or ""
     t = s.lstrip()
     if t.startswith(p):
-        return True, t[len(p):].lstrip()
-    return False, ""
+        return True, t[len(p):].lstrip(), Fail.FOLLOWED
+    return False, "", Fail.PREFIX_MISSING
 
 def ifr_suffix(suffix: str, resp: str):
     s = (resp or "")
     su = suffix or ""
     t = s.rstrip()
     if t.endswith(su):
-        return True, t[:len(t)-len(su)].rstrip()
-    return False, ""
+        return True, t[:len(t)-len(su)].rstrip(), Fail.FOLLOWED
+    return False, "", Fail.SUFFIX_MISSING
 
 def ifr_wrap(lrt: str, resp: str):
     s = (resp or "")
     spec = lrt or ""
     if "|" not in spec:
-        return False, ""
+        return False, "", Fail.WRAP_SPEC
     left, right = spec.split("|", 1)
     t = s.strip()
     if t.startswith(left) and t.endswith(right):
-        return True, t[len(left):len(t)-len(right)].strip()
-    return False, ""
+        return True, t[len(left):len(t)-len(right)].strip(), Fail.FOLLOWED
+    return False, "", Fail.WRAP_MISSING
 
 def ifr_json(resp: str, expected_key: str | None = None):
     try:
         obj = json.loads(resp)
     except Exception:
-        return False, ""
+        return False, "", Fail.JSON_INVALID
     if not isinstance(obj, dict):
-        return False, ""
+        return False, "", Fail.JSON_NOT_OBJECT
     if expected_key:
         v = obj.get(expected_key)
-        return (True, str(v).strip()) if isinstance(v, str) else (False, "")
+        return (True, str(v).strip(), Fail.FOLLOWED) if isinstance(v, str) else (False, "", Fail.JSON_KEY_MISSING)
     parts = [str(v).strip() for v in obj.values() if isinstance(v, str)]
     if parts:
-        return True, " ".join(parts)
-    return False, ""
+        return True, " ".join(parts), Fail.FOLLOWED
+    return False, "", Fail.JSON_KEY_MISSING
 
 def iter_preds_by_topkey(value):
     if isinstance(value, str):
@@ -134,81 +129,93 @@ def iter_preds_by_topkey(value):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python eval_ifr_acc_ser_gr.py infer.json")
+        print("Usage: python eval_ifr_acc_ser_gr.py infer.json [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
     path = sys.argv[1]
-    data = json.load(open(path, "r", encoding="utf-8"))
+    opts = resample_args(sys.argv[2:])
+    data = load_results(path)
 
-    key_order = []
-    total_preds = defaultdict(int)      
-    if_follow = defaultdict(int)       
+    # one row per response; labels are resolved column-wise afterwards
+    key_index = KeyIndex()
+    item_col, var_col, task_col, gold_col, follow_col, bodies = [], [], [], [], [], []
+    failures = FailureLog()
 
-    acc_total = defaultdict(int)       
-    acc_correct = defaultdict(int)     
-
-    all_ifr_total = 0
-    all_ifr_follow = 0
-    all_acc_total = 0
-    all_acc_correct = 0
-
-    for item in data:
+    for idx, item in enumerate(data):
         task = task_of(item) 
-        gold = gt_label(item, task)
+        gold = ENGINES[task].encode_one(str(item.get("text", "")))
         vr = item.get("variation_responses", {}) or {}
 
         for top_key, value in vr.items():
-            if top_key not in key_order:
-                key_order.append(top_key)
+            vid = key_index.intern(top_key)
 
             for resp, meta in iter_preds_by_topkey(value):
-                total_preds[top_key] += 1
-                all_ifr_total += 1
-
                 if top_key == "constrain":
-                    follow, body = ifr_constrain(resp, task)
+                    follow, body, why = ifr_constrain(resp, task)
                 elif top_key == "upper_case":
-                    follow, body = ifr_upper(resp)
+                    follow, body, why = ifr_upper(resp)
                 elif top_key == "lower_case":
-                    follow, body = ifr_lower(resp)
+                    follow, body, why = ifr_lower(resp)
                 elif top_key == "prefix":
-                    follow, body = ifr_prefix(meta.get("prefix", ""), resp)
+                    follow, body, why = ifr_prefix(meta.get("prefix", ""), resp)
                 elif top_key == "suffix":
-                    follow, body = ifr_suffix(meta.get("suffix", ""), resp)
+                    follow, body, why = ifr_suffix(meta.get("suffix", ""), resp)
                 elif top_key == "wrap":
-                    follow, body = ifr_wrap(meta.get("lrt", ""), resp)
+                    follow, body, why = ifr_wrap(meta.get("lrt", ""), resp)
                 elif top_key == "json":
-                    follow, body = ifr_json(resp, expected_key=meta.get("key"))
+                    follow, body, why = ifr_json(resp, expected_key=meta.get("key"))
                 else:
-                    follow, body = False, ""
-
-                if_follow[top_key] += int(follow)
-                all_ifr_follow += int(follow)
-
-                pred = canon(body, task) if follow else None
-
-                if gold is not None:
-                    acc_total[top_key] += 1
-                    all_acc_total += 1
-                    if pred is not None and pred == gold:
-                        acc_correct[top_key] += 1
-                        all_acc_correct += 1
-
+                    follow, body, why = False, "", Fail.UNKNOWN_VARIATION
+
+                failures.add(top_key, why)
+                item_col.append(idx)
+                var_col.append(vid)
+                task_col.append(task)
+                gold_col.append(gold)
+                follow_col.append(follow)
+                bodies.append(body)
+
+    var_col = np.asarray(var_col, dtype=np.int64)
+    task_col = np.asarray(task_col)
+    gold_col = np.asarray(gold_col, dtype=np.int8)
+    follow_col = np.asarray(follow_col, dtype=bool)
+
+    # -1 = not followed; otherwise the label code within the item's task
+    pred_col = np.full(len(bodies), -1, dtype=np.int8)
+    for task, engine in ENGINES.items():
+        rows = np.flatnonzero(task_col == task)
+        if rows.size:
+            pred_col[rows] = engine.encode(bodies[i] for i in rows)
+    pred_col[~follow_col] = -1
+
+    has_gold = gold_col >= 0
+    correct = has_gold & (pred_col >= 0) & (pred_col == gold_col)
+
+    n_keys = len(key_index)
+    total_preds = np.bincount(var_col, minlength=n_keys)
+    if_follow = np.bincount(var_col, weights=follow_col, minlength=n_keys)
+    acc_total = np.bincount(var_col, weights=has_gold, minlength=n_keys)
+    acc_correct = np.bincount(var_col, weights=correct, minlength=n_keys)
 
     res = {}
 
-    for k in key_order:
-        assert total_preds[k] != 0, f"No response in {k}!"
-        ifr = 100.0 * if_follow[k] / total_preds[k]
-        if acc_total[k] > 0:
-            acc = 100.0 * acc_correct[k] / acc_total[k]
+    for vid, k in enumerate(key_index):
+        assert total_preds[vid] != 0, f"No response in {k}!"
+        ifr = 100.0 * if_follow[vid] / total_preds[vid]
+        if acc_total[vid] > 0:
+            acc = 100.0 * acc_correct[vid] / acc_total[vid]
         else:
             acc = 0.0
         # print(f"[{k}]: IFR -- {ifr:.2f}%; ACC -- {acc:.2f}%")
         res[k] = {
-            "ifr": round(ifr, 2),
-            "acc": round(acc, 2)
+            "ifr": round(float(ifr), 2),
+            "acc": round(float(acc), 2)
         }
 
+    all_ifr_total = int(total_preds.sum())
+    all_ifr_follow = int(if_follow.sum())
+    all_acc_total = int(acc_total.sum())
+    all_acc_correct = int(acc_correct.sum())
+
     # Overall（micro）
     all_ifr = 100.0 * all_ifr_follow / all_ifr_total if all_ifr_total else 0.0
     all_acc = 100.0 * all_acc_correct / all_acc_total if all_acc_total else 0.0
@@ -218,6 +225,17 @@ def main():
         "ifr": round(all_ifr, 2),
         "acc": round(all_acc, 2)
     }
+    res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+
+    if opts.enabled:
+        # ACC is over responses with a gold label, as acc_total above
+        item_stats = ItemStats(("total", "follow", "gold", "correct"))
+        item_col = np.asarray(item_col, dtype=np.int64)
+        for vid, k in enumerate(key_index):
+            rows = var_col == vid
+            item_stats.extend(k, item_col[rows], total=np.ones(rows.sum()), follow=follow_col[rows],
+                              gold=has_gold[rows], correct=correct[rows])
+        report_resampling(res, item_stats, ("ifr", "acc"), [item.get("path") for item in data], opts)
 
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
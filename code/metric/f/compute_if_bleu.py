@@ -7,6 +7,10 @@ import re
 from collections import defaultdict
 import sacrebleu
 from format import judge
+from scoring.bootstrap import BLEU_STATS, ItemStats, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.results_io import load_results, run_diagnostics
 
 
 TOKENIZE = "zh"             
@@ -28,21 +32,21 @@ BAD_MARKER_RE = re.compile(r'[\{\}\[\]\<\>]|`{3}|\*\*')
 
 def ifr_constrain(resp: str, ref: str):
     follow = True if judge(ref, resp) == 'positive' else False
-    return follow, (resp.strip() if follow else "")
+    return follow, (resp.strip() if follow else ""), (Fail.FOLLOWED if follow else Fail.CONSTRAIN)
 
 def ifr_upper(resp: str):
     s = resp or ""
     has_lower = bool(LOWER_RE.search(s))
     has_upper = bool(UPPER_RE.search(s))
     follow = (not has_lower) and has_upper
-    return follow, (s.strip() if follow else "")
+    return follow, (s.strip() if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_lower(resp: str):
     s = resp or ""
     has_upper = bool(UPPER_RE.search(s))
     has_lower = bool(LOWER_RE.search(s))
     follow = (not has_upper) and has_lower
-    return follow, (s.strip() if follow else "")
+    return follow, (s.strip() if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_prefix(prefix: str, resp: str):
     s = (resp or "")
@@ -50,8 +54,8 @@ def ifr_prefix(prefix: str, resp: str):
     t = s.lstrip()
     follow = t.startswith(p)
     if follow:
-        return True, t[len(p):].lstrip()
-    return False, ""
+        return True, t[len(p):].lstrip(), Fail.FOLLOWED
+    return False, "", Fail.PREFIX_MISSING
 
 def ifr_suffix(suffix: str, resp: str):
     s = (resp or "")
@@ -59,37 +63,37 @@ def ifr_suffix(suffix: str, resp: str):
     t = s.rstrip()
     follow = t.endswith(su)
     if follow:
-        return True, t[:len(t)-len(su)].rstrip()
-    return False, ""
+        return True, t[:len(t)-len(su)].rstrip(), Fail.FOLLOWED
+    return False, "", Fail.SUFFIX_MISSING
 
 def ifr_wrap(lrt: str, resp: str):
     s = (resp or "")
     spec = lrt or ""
     if "|" not in spec:
-        return False, ""
+        return False, "", Fail.WRAP_SPEC
     left, right = spec.split("|", 1)
     t = s.strip()
     follow = t.startswith(left) and t.endswith(right)
     if follow:
-        return True, t[len(left):len(t)-len(right)].strip()
-    return False, ""
+        return True, t[len(left):len(t)-len(right)].strip(), Fail.FOLLOWED
+    return False, "", Fail.WRAP_MISSING
 
 def ifr_json(resp: str, expected_key: str | None = None):
     try:
         obj = json.loads(resp)
     except Exception:
-        return False, ""
+        return False, "", Fail.JSON_INVALID
     if not isinstance(obj, dict):
-        return False, ""
+        return False, "", Fail.JSON_NOT_OBJECT
     if expected_key:
         v = obj.get(expected_key)
-        return (True, str(v).strip()) if isinstance(v, str) else (False, "")
+        return (True, str(v).strip(), Fail.FOLLOWED) if isinstance(v, str) else (False, "", Fail.JSON_KEY_MISSING)
     for k in ["voice_to_text", "transcript", "transcription", "text", "asr"]:
         v = obj.get(k)
         if isinstance(v, str):
-            return True, v.strip()
+            return True, v.strip(), Fail.FOLLOWED
     parts = [str(v).strip() for v in obj.values() if isinstance(v, str)]
-    return (True, " ".join(parts)) if parts else (False, "")
+    return (True, " ".join(parts), Fail.FOLLOWED) if parts else (False, "", Fail.JSON_KEY_MISSING)
 
 def iter_preds_by_topkey(value):
     if isinstance(value, str):
@@ -105,67 +109,75 @@ def iter_preds_by_topkey(value):
             if isinstance(x, str):
                 yield x, {}
 
+# sentence-level n-gram counts add up to the corpus counts, so resamples need no re-scoring
+BLEU_SCORER = sacrebleu.metrics.BLEU(tokenize=TOKENIZE, effective_order=True)
+
+def bleu_counts(hyp: str, ref: str):
+    st = BLEU_SCORER.sentence_score(hyp, [ref])
+    return st.sys_len, st.ref_len, *st.counts, *st.totals
+
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python compute_if_bleu.py infer.json")
+        print("Usage: python compute_if_bleu.py infer.json [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
     path = sys.argv[1]
-    data = json.load(open(path, "r", encoding="utf-8"))
+    opts = resample_args(sys.argv[2:])
+    item_stats = ItemStats(("total", "follow") + BLEU_STATS) if opts.enabled else None
+    data = load_results(path)
 
     res = {}
 
-    key_order = []
-    total_preds = defaultdict(int)
-    if_follow = defaultdict(int)
+    counts = VariationCounts()
     gts_by_key = defaultdict(list)
     hyps_by_key = defaultdict(list)
 
     all_gts, all_hyps = [], []
-    all_total = all_follow_cnt = 0
+    failures = FailureLog()
 
-    for item in data:
+    for idx, item in enumerate(data):
         ref_text = (item.get("text", "") or "")
         vr = item.get("variation_responses", {}) or {}
 
         for top_key, value in vr.items():
-            if top_key not in key_order:
-                key_order.append(top_key)
+            vid = counts.intern(top_key)
 
             for resp, meta in iter_preds_by_topkey(value):
-                total_preds[top_key] += 1
-                all_total += 1
-
                 if top_key == "constrain":
-                    follow, hyp = ifr_constrain(resp, ref_text)
+                    follow, hyp, why = ifr_constrain(resp, ref_text)
                 elif top_key == "upper_case":
-                    follow, hyp = ifr_upper(resp)
+                    follow, hyp, why = ifr_upper(resp)
                 elif top_key == "lower_case":
-                    follow, hyp = ifr_lower(resp)
+                    follow, hyp, why = ifr_lower(resp)
                 elif top_key == "prefix":
-                    follow, hyp = ifr_prefix(meta.get("prefix", ""), resp)
+                    follow, hyp, why = ifr_prefix(meta.get("prefix", ""), resp)
                 elif top_key == "suffix":
-                    follow, hyp = ifr_suffix(meta.get("suffix", ""), resp)
+                    follow, hyp, why = ifr_suffix(meta.get("suffix", ""), resp)
                 elif top_key == "wrap":
-                    follow, hyp = ifr_wrap(meta.get("lrt", ""), resp)
+                    follow, hyp, why = ifr_wrap(meta.get("lrt", ""), resp)
                 elif top_key == "json":
-                    follow, hyp = ifr_json(resp, expected_key=meta.get("key"))
+                    follow, hyp, why = ifr_json(resp, expected_key=meta.get("key"))
                 else:
-                    follow, hyp = False, "" 
+                    follow, hyp, why = False, "", Fail.UNKNOWN_VARIATION
 
                 if follow and not has_chinese(hyp):
-                    follow, hyp = False, ""
+                    follow, hyp, why = False, "", Fail.NOT_CHINESE
 
-                if_follow[top_key] += int(follow)
-                all_follow_cnt += int(follow)
+                failures.add(top_key, why)
+
+                counts.add(vid, follow)
 
                 gts_by_key[top_key].append(ref_text.strip())
                 hyps_by_key[top_key].append((hyp or "").strip())
                 all_gts.append(ref_text.strip())
                 all_hyps.append((hyp or "").strip())
 
-    for k in key_order:
-        assert total_preds[k] != 0, f"No response in {k}!"
-        ifr = 100.0 * if_follow[k] / total_preds[k]
+                if item_stats is not None:
+                    counts_row = bleu_counts((hyp or "").strip(), ref_text.strip())
+                    item_stats.add(top_key, idx, total=1, follow=follow, **dict(zip(BLEU_STATS, counts_row)))
+
+    for vid, k in enumerate(counts):
+        assert counts.total[vid] != 0, f"No response in {k}!"
+        ifr = counts.ifr(vid)
         refs = gts_by_key[k]
         hyps = hyps_by_key[k]
         bleu = sacrebleu.corpus_bleu(
@@ -177,7 +189,8 @@ def main():
             "bleu": round(bleu, 2)
         }
 
-    all_ifr = 100.0 * all_follow_cnt / all_total if all_total else 0.0
+    all_total = counts.all_total()
+    all_ifr = 100.0 * counts.all_follow() / all_total if all_total else 0.0
     all_bleu = sacrebleu.corpus_bleu(
         all_hyps, [all_gts], tokenize=TOKENIZE, use_effective_order=USE_EFFECTIVE_ORDER
     ).score if all_gts else 0.0
@@ -187,6 +200,9 @@ def main():
         "ifr": round(all_ifr, 2),
         "bleu": round(all_bleu, 2)
     }
+    res['diagnostics'] = {'failures': failures.histograms(), **run_diagnostics(data)}
+    if item_stats is not None:
+        report_resampling(res, item_stats, ("ifr", "bleu"), [item.get("path") for item in data], opts)
 
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
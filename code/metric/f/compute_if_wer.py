@@ -7,6 +7,11 @@ import re
 from collections import defaultdict
 import jiwer
 from normalizers.english import EnglishTextNormalizer
+from scoring.bootstrap import ItemStats, report_resampling, resample_args
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.gates import PhraseMatcher, is_repeated_sentence
+from scoring.results_io import load_results, run_diagnostics
 
 normalizer = EnglishTextNormalizer()
 
@@ -28,6 +33,7 @@ candidates = [
     'summary:',
     'the sentence'
 ]
+CONSTRAIN_MATCHER = PhraseMatcher(candidates)
 
 import re
 
@@ -95,119 +101,110 @@ def wer_with_ops(ref: str, hyp: str):
     return wer_value, S, D, I, n
 
 
-def is_repeated_sentence(sentence: str) -> bool:
-    normalized = re.sub(r"[^\w\s]", " ", sentence).lower()
-    words = normalized.split()
-    n = len(words)
-    if n < 2:
-        return False
-    
-    for size in range(1, n // 2 + 1):
-        if n % size == 0:
-            unit = words[:size]
-            if unit * (n // size) == words:
-                return True
-    return False
+def judge(resp: str, ref: str) -> Fail:
+    # scan every response so phrase_hits covers the WER rejects as well
+    has_cand = CONSTRAIN_MATCHER.scan(resp)
+    wer_value, S, D, I, n = wer_with_ops(ref, resp)
+    if wer_value >= 1:
+        return Fail.WER_TOO_HIGH
+    if I >= 3:
+        return Fail.INSERTIONS
+    if has_cand:
+        return Fail.CANDIDATE_PHRASE
+    if is_repeated_sentence(resp):
+        return Fail.REPEATED
+    return Fail.FOLLOWED
 
 def ifr_constrain(resp: str, ref: str):
-    def judge():
-        wer_value, S, D, I, n = wer_with_ops(ref, resp)
-        if wer_value >= 1:
-            return False
-        if I >= 3:
-            return False
-        flag = True
-        for cand in candidates:
-            if (cand.lower() in resp.lower()) or is_repeated_sentence(resp):
-                flag = False
-                break
-        return flag
-
-    follow = judge()
-    return follow, (norm(resp) if follow else "")
+    why = judge(resp, ref)
+    follow = why == Fail.FOLLOWED
+    return follow, (norm(resp) if follow else ""), why
 
 def ifr_upper(resp: str):
     has_lower = bool(LOWER_RE.search(resp))
     has_upper = bool(UPPER_RE.search(resp))
     follow = (not has_lower) and has_upper
-    return follow, (norm(resp) if follow else "")
+    return follow, (norm(resp) if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_lower(resp: str):
     has_upper = bool(UPPER_RE.search(resp))
     has_lower = bool(LOWER_RE.search(resp))
     follow = (not has_upper) and has_lower
-    return follow, (norm(resp) if follow else "")
+    return follow, (norm(resp) if follow else ""), (Fail.FOLLOWED if follow else Fail.CASE)
 
 def ifr_prefix(prefix: str, resp: str):
     s = resp.lstrip()
     follow = s.startswith(prefix)
     if follow:
         body = s[len(prefix):].lstrip()
-        return True, norm(body)
-    return False, ""
+        return True, norm(body), Fail.FOLLOWED
+    return False, "", Fail.PREFIX_MISSING
 
 def ifr_suffix(suffix: str, resp: str):
     s = resp.rstrip()
     follow = s.endswith(suffix)
     if follow:
         body = s[:len(s) - len(suffix)].rstrip()
-        return True, norm(body)
-    return False, ""
+        return True, norm(body), Fail.FOLLOWED
+    return False, "", Fail.SUFFIX_MISSING
 
 def ifr_wrap(lrt: str, resp: str):
     if "|" not in lrt:
-        return False, ""
+        return False, "", Fail.WRAP_SPEC
     left, right = lrt.split("|", 1)
     s = resp.strip()
     follow = s.startswith(left) and s.endswith(right)
     if follow:
         body = s[len(left):len(s) - len(right)].strip()
-        return True, norm(body)
-    return False, ""
+        return True, norm(body), Fail.FOLLOWED
+    return False, "", Fail.WRAP_MISSING
 
 def ifr_json(resp: str, expected_key: str | None = None):
     try:
         obj = json.loads(resp)
     except Exception:
-        return False, "" 
+        return False, "", Fail.JSON_INVALID
 
     if not isinstance(obj, dict):
-        return False, ""
+        return False, "", Fail.JSON_NOT_OBJECT
 
     if expected_key:
         v = obj.get(expected_key, None)
         if isinstance(v, str):
-            return True, norm(v)
+            return True, norm(v), Fail.FOLLOWED
         else:
-            return False, ""
+            return False, "", Fail.JSON_KEY_MISSING
 
     parts = [str(v) for v in obj.values() if isinstance(v, str)]
-    return (True, norm(" ".join(parts))) if parts else (False, "")
+    return (True, norm(" ".join(parts)), Fail.FOLLOWED) if parts else (False, "", Fail.JSON_KEY_MISSING)
+
+def word_edits(ref: str, hyp: str):
+    out = jiwer.process_words(ref, hyp)
+    return out.substitutions + out.deletions + out.insertions, out.hits + out.substitutions + out.deletions
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python compute_if_wer.py <model_name>_asr_results.json")
+        print("Usage: python compute_if_wer.py <model_name>_asr_results.json [--bootstrap N] [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]")
         sys.exit(1)
     path = sys.argv[1]
-    data = json.load(open(path, "r", encoding="utf-8"))
+    opts = resample_args(sys.argv[2:])
+    item_stats = ItemStats(("total", "follow", "edits", "words")) if opts.enabled else None
+    data = load_results(path)
     res = {}
 
-    key_order = []
-    total_preds = defaultdict(int)
-    if_follow = defaultdict(int)
+    counts = VariationCounts()
     gts_by_key = defaultdict(list)
     hyps_by_key = defaultdict(list)
 
     all_gts, all_hyps = [], []
-    all_total, all_follow = 0, 0
+    failures = FailureLog()
 
-    for item in data:
+    for idx, item in enumerate(data):
         ref_text = item.get("text", "")
         vr = item.get("variation_responses", {}) or {}
 
         for top_key, value in vr.items():
-            if top_key not in key_order:
-                key_order.append(top_key)
+            vid = counts.intern(top_key)
 
             if top_key in ("constrain", "upper_case", "lower_case"):
                 preds = [value] if isinstance(value, str) else []
@@ -224,28 +221,25 @@ def main():
                 metas = [{}] * len(preds)
 
             for resp, meta in zip(preds, metas):
-                total_preds[top_key] += 1
-                all_total += 1
-
                 if top_key == "constrain":
-                    follow, hyp_n = ifr_constrain(resp, ref_text)
+                    follow, hyp_n, why = ifr_constrain(resp, ref_text)
                 elif top_key == "upper_case":
-                    follow, hyp_n = ifr_upper(resp)
+                    follow, hyp_n, why = ifr_upper(resp)
                 elif top_key == "lower_case":
-                    follow, hyp_n = ifr_lower(resp)
+                    follow, hyp_n, why = ifr_lower(resp)
                 elif top_key == "prefix":
-                    follow, hyp_n = ifr_prefix(meta.get("prefix", ""), resp)
+                    follow, hyp_n, why = ifr_prefix(meta.get("prefix", ""), resp)
                 elif top_key == "suffix":
-                    follow, hyp_n = ifr_suffix(meta.get("suffix", ""), resp)
+                    follow, hyp_n, why = ifr_suffix(meta.get("suffix", ""), resp)
                 elif top_key == "wrap":
-                    follow, hyp_n = ifr_wrap(meta.get("lrt", ""), resp)
+                    follow, hyp_n, why = ifr_wrap(meta.get("lrt", ""), resp)
                 elif top_key == "json":
-                    follow, hyp_n = ifr_json(resp)
+                    follow, hyp_n, why = ifr_json(resp)
                 else:
-                    follow, hyp_n = False, ""
+                    follow, hyp_n, why = False, "", Fail.UNKNOWN_VARIATION
 
-                if_follow[top_key] += int(follow)
-                all_follow += int(follow)
+                failures.add(top_key, why)
+                counts.add(vid, follow)
 
                 gts_by_key[top_key].append(norm(ref_text))
                 hyps_by_key[top_key].append(hyp_n)
@@ -253,9 +247,13 @@ def main():
                 all_gts.append(norm(ref_text))
                 all_hyps.append(hyp_n)
 
-    for k in key_order:
-        assert total_preds[k] != 0, f"No response in {k}!"
-        ifr = 100.0 * if_follow[k] / total_preds[k]
+                if item_stats is not None:
+                    edits, words = word_edits(norm(ref_text), hyp_n)
+                    item_stats.add(top_key, idx, total=1, follow=follow, edits=edits, words=words)
+
+    for vid, k in enumerate(counts):
+        assert counts.total[vid] != 0, f"No response in {k}!"
+        ifr = counts.ifr(vid)
 
         gts = gts_by_key[k]
         hyps = hyps_by_key[k]
@@ -267,7 +265,8 @@ def main():
             "wer": round(wer_pct, 2) if not (wer_pct != wer_pct) else "N/A"  # NaN check
         }
 
-    all_ifr = 100.0 * all_follow / all_total if all_total else 0.0
+    all_total = counts.all_total()
+    all_ifr = 100.0 * counts.all_follow() / all_total if all_total else 0.0
     all_wer = jiwer.wer(all_gts, all_hyps) * 100.0 if all_gts else float("nan")
     # print("-" * 64)
     # print(f"[ALL]: IFR -- {all_ifr:.2f}%; WER -- {all_wer:.2f}%")
@@ -275,6 +274,10 @@ def main():
         "ifr": round(all_ifr, 2),
         "wer": round(all_wer, 2) if not (all_wer != all_wer) else "N/A"  # NaN check
     }
+    res['diagnostics'] = {'failures': failures.histograms(), 'phrase_hits': CONSTRAIN_MATCHER.hit_counts(),
+                          **run_diagnostics(data)}
+    if item_stats is not None:
+        report_resampling(res, item_stats, ("ifr", "wer"), [item.get("path") for item in data], opts)
 
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
@@ -1,26 +1,40 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
 import sys
 import json
 import re
-from collections import defaultdict
-from typing import Dict, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 import jiwer
+from sacrebleu.metrics import BLEU
 from normalizers.english import EnglishTextNormalizer
+from scoring.bootstrap import (BLEU_STATS, RESAMPLE_METRICS, ItemStats, bootstrap_ci, item_series,
+                               save_item_stats, split_samples)
+from scoring.counters import VariationCounts
+from scoring.failures import Fail, FailureLog
+from scoring.gates import PhraseMatcher, is_repeated_sentence
+from scoring.labels import LabelEngine
+from scoring.results_io import load_results, run_diagnostics
 
 # ---------- 规范化（仅用于 ASR->WER） ----------
 normalizer = EnglishTextNormalizer()
+@lru_cache(maxsize=65536)
 def norm_asr(s: str) -> str:
     return normalizer(s or "")
 
 # ---------- 任务集合与正则 ----------
-TASKS = ("ASR", "SER", "GR")
 ALLOWED_SER = {"happy", "sad", "angry", "neutral"}
 ALLOWED_GR  = {"male", "female"}
-SER_RE = re.compile(r"\b(happy|sad|angry|neutral)\b", re.IGNORECASE)
-GR_RE  = re.compile(r"\b(male|female)\b", re.IGNORECASE)
+LABEL_ENGINES = {
+    "SER": LabelEngine(sorted(ALLOWED_SER)),
+    "GR": LabelEngine(sorted(ALLOWED_GR)),
+}
+CH_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
 
 res = {}
 
@@ -33,12 +47,14 @@ candidates = [
     'summary:',
     'the sentence'
 ]
+ASR_MATCHER = PhraseMatcher(candidates)
 
 import re
 
 def normed_in(resp: str, list_of_str: List[str]) -> bool:
     return resp.lower().strip() in (s.lower() for s in list_of_str)
 
+@lru_cache(maxsize=65536)
 def preprocess(text: str) -> str:
     # 全部转小写
     text = text.lower()
@@ -48,6 +64,8 @@ def preprocess(text: str) -> str:
     text = re.sub(r"\s+", " ", text).strip()
     return text
 
+# 同一参考在各任务排列中反复出现，对齐结果按 (ref, hyp) 缓存
+@lru_cache(maxsize=65536)
 def wer_with_ops(ref: str, hyp: str):
     # 预处理
     ref = preprocess(ref)
@@ -111,87 +129,172 @@ def wer_with_ops(ref: str, hyp: str):
     return wer_value, S, D, I, n
 
 
-def is_repeated_sentence(sentence: str) -> bool:
-    # 正则化：标点转空格 + 小写
-    normalized = re.sub(r"[^\w\s]", " ", sentence).lower()
-    words = normalized.split()
-    n = len(words)
-    if n < 2:
-        return False
-    
-    # 检查是否由某个片段重复组成
-    for size in range(1, n // 2 + 1):
-        if n % size == 0:
-            unit = words[:size]
-            if unit * (n // size) == words:
-                return True
-    return False
-
-def judge(resp, ref):
+def judge(resp, ref, hits) -> Fail:
+    # 先扫描候选短语，使 phrase_hits 也覆盖 WER 不合格的回复
+    has_cand = ASR_MATCHER.scan(resp, hits)
     wer_value, S, D, I, n = wer_with_ops(ref, resp)
     if wer_value >= 1:
-        return False
+        return Fail.WER_TOO_HIGH
     if I >= 3:
-        return False
-    flag = True
-    for cand in candidates:
-        if (cand.lower() in resp.lower()) or is_repeated_sentence(resp):
-            flag = False
-            break
-    return flag
-
-# ---------- 小工具 ----------
-def canon_ser(s: str) -> str:
-    if not s: return ""
-    m = SER_RE.search(s)
-    return (m.group(1).lower() if m else "")
-
-def canon_gr(s: str) -> str:
-    if not s: return ""
-    m = GR_RE.search(s)
-    return (m.group(1).lower() if m else "")
-
-def asr_wer(refs: List[str], hyps: List[str]) -> float:
-    """返回 WER（百分数）。"""
-    r = [norm_asr(x) for x in refs]
-    h = [norm_asr(x) for x in hyps]
-    return jiwer.wer(r, h) * 100.0 if r else 0.0
-
-# 结构化统计器
+        return Fail.INSERTIONS
+    if has_cand:
+        return Fail.CANDIDATE_PHRASE
+    if is_repeated_sentence(resp):
+        return Fail.REPEATED
+    return Fail.FOLLOWED
+
+# ---------- 指标：单条 -> 可逐元素相加的充分统计量（元组），最后一次性算分 ----------
+def add_suff(a: tuple, b: tuple) -> tuple:
+    return tuple(x + y for x, y in zip(a, b))
+
+class Metric(NamedTuple):
+    label: str                                 # 打印名，如 "WER(%)"
+    key: str                                   # 输出键，如 "wer"（与 d/f 评测脚本一致）
+    zero: Callable[[], tuple]                  # 空统计量（每个 Stat 新建一份）
+    observe: Callable[[str, str], tuple]       # (ref, hyp) -> 统计量
+    score: Callable[[tuple, int], float]       # (统计量之和, 条数) -> 分数
+    stats: Tuple[str, ...] = ()                # 统计量各列名（bootstrap 用）；空 = 不可分解，只给 IFR 区间
+    add: Callable[[tuple, tuple], tuple] = add_suff   # 累加两份统计量（可原地修改第一份）
+    digits: int = 2                            # 输出保留的小数位
+
+@lru_cache(maxsize=65536)
+def asr_edits(ref: str, hyp: str) -> Tuple[int, int]:
+    """单条的 (S+D+I, 参考词数)；语料级 WER = 两者分别求和后相除，与 jiwer.wer(列表) 相同。"""
+    out = jiwer.process_words(norm_asr(ref), norm_asr(hyp))
+    return (out.substitutions + out.deletions + out.insertions,
+            out.hits + out.substitutions + out.deletions)
+
+def label_hits(task: str) -> Callable[[str, str], tuple]:
+    engine = LABEL_ENGINES[task]
+    return lambda ref, hyp: (int(engine.encode_one(hyp) == engine.label_code(ref)),)
+
+# 句级 n-gram 计数可加，求和后 compute_bleu 与 corpus_bleu 结果一致
+BLEU_SCORER = BLEU(tokenize="zh", effective_order=True)
+
+@lru_cache(maxsize=65536)
+def bleu_counts(ref: str, hyp: str) -> tuple:
+    st = BLEU_SCORER.sentence_score(hyp, [ref])
+    return (st.sys_len, st.ref_len, *st.counts, *st.totals)
+
+def bleu_score(suff: tuple, n: int) -> float:
+    if not n:
+        return 0.0
+    sys_len, ref_len, counts, totals = suff[0], suff[1], suff[2:6], suff[6:10]
+    return BLEU.compute_bleu(list(counts), list(totals), sys_len, ref_len,
+                             smooth_method="exp", effective_order=False).score
+
+def extend_suff(a: tuple, b: tuple) -> tuple:
+    # 列表原地扩展：元组拼接每次都复制，累加是平方复杂度
+    for x, y in zip(a, b):
+        x.extend(y)
+    return a
+
+def meteor_score(suff: tuple, n: int) -> float:
+    # METEOR 不可分解，只能保留 (候选, 参考) 列表；aac_metrics 依赖 Java，按需导入。0-1 分制，与 d/f 相同
+    if not n:
+        return 0.0
+    from aac_metrics.functional import meteor
+    from aac_metrics.utils.tokenization import preprocess_mono_sents, preprocess_mult_sents
+    cands, refs = suff
+    corpus, _ = meteor(preprocess_mono_sents(cands), preprocess_mult_sents(refs))
+    return float(corpus["meteor"].item())
+
+WER_METRIC = Metric("WER(%)", "wer", lambda: (0, 0), asr_edits,
+                    lambda s, n: (100.0 * s[0] / s[1]) if n else 0.0, ("edits", "words"))
+BLEU_METRIC = Metric("BLEU", "bleu", lambda: (0,) * 10, bleu_counts, bleu_score, BLEU_STATS)
+METEOR_METRIC = Metric("METEOR", "METEOR", lambda: ([], []),
+                       lambda ref, hyp: ([hyp], [[r.strip() for r in ref.split("|") if r.strip()]]),
+                       meteor_score, add=extend_suff, digits=4)
+
+def acc_metric(task: str) -> Metric:
+    return Metric("ACC(%)", "acc", lambda: (0,), label_hits(task),
+                  lambda s, n: (100.0 * s[0] / n) if n else 0.0, ("correct",))
+
+# ---------- 门限：(片段, 参考, 本分片的候选短语计数) -> Fail ----------
+def label_gate(allowed):
+    return lambda part, ref, hits: Fail.FOLLOWED if normed_in(part, allowed) else Fail.LABEL_INVALID
+
+def s2tt_gate(part: str, ref: str, hits: List[int]) -> Fail:
+    if not part:
+        return Fail.EMPTY
+    return Fail.FOLLOWED if CH_RE.search(part) else Fail.NOT_CHINESE
+
+def aac_gate(part: str, ref: str, hits: List[int]) -> Fail:
+    if not part:
+        return Fail.EMPTY
+    return Fail.REPEATED if is_repeated_sentence(part) else Fail.FOLLOWED
+
+def strip_quotes(s: str) -> str:
+    s = s.strip()
+    if len(s) >= 2 and s[0] == s[-1] and s[0] in ("'", '"'):
+        s = s[1:-1].strip()
+    return s
+
+# ---------- 任务规格表 ----------
+# ref：从样本取参考；parse：分支取出的片段 -> 假设；gate：有效性门限；metric：指标。
+# 门限按表中顺序检查（ASR 最先，使 phrase_hits 覆盖所有含 ASR 的回复）。
+# 新任务（4/5 任务组合中的 S2TT、AAC 等）只需在此加一行；统计按 (stage, 任务数, 任务) 聚合，
+# 与排列数无关，重复出现的 (ref, 片段) 由各处 lru_cache 复用。
+class TaskSpec(NamedTuple):
+    ref: Callable[[dict], str]
+    parse: Callable[[str], str]
+    gate: Callable[[str, str, List[int]], Fail]
+    metric: Metric
+
+TASK_SPECS: Dict[str, TaskSpec] = {
+    "ASR":  TaskSpec(lambda samp: (samp.get("text") or "").strip(),
+                     lambda x: x, judge, WER_METRIC),
+    "SER":  TaskSpec(lambda samp: (samp.get("emotion") or "").strip().lower(),
+                     lambda x: x, label_gate(ALLOWED_SER), acc_metric("SER")),
+    "GR":   TaskSpec(lambda samp: (samp.get("gender") or "").strip().lower(),
+                     lambda x: x, label_gate(ALLOWED_GR), acc_metric("GR")),
+    "S2TT": TaskSpec(lambda samp: (samp.get("translation") or "").strip(),
+                     strip_quotes, s2tt_gate, BLEU_METRIC),
+    "AAC":  TaskSpec(lambda samp: (samp.get("caption") or "").strip(),
+                     lambda x: x.strip(), aac_gate, METEOR_METRIC),
+}
+TASKS = tuple(TASK_SPECS)
+
+def check_tasks(tasks: List[str], parts: List[str], refs_by_task: Dict[str, str], hits: List[int]) -> Fail:
+    """parts 与 tasks 一一对应；按规格表顺序逐个过门限，返回第一个不通过的原因。"""
+    for t, spec in TASK_SPECS.items():
+        if t in tasks:
+            why = spec.gate(parts[tasks.index(t)].strip(), refs_by_task[t], hits)
+            if why != Fail.FOLLOWED:
+                return why
+    return Fail.FOLLOWED
+
+# 结构化统计器：只保存充分统计量，可直接相加/合并
 class Stat:
     def __init__(self, task: str):
         self.task = task
         self.total = 0        # 条目数（按条累计）
         self.follow = 0       # IFR 通过条数
-        self.refs: List[str] = []   # ASR 引用/ SER/GR 标签
-        self.hyps: List[str] = []   # 预测
+        self.suff = TASK_SPECS[task].metric.zero()   # 指标的充分统计量
 
     def add(self, follow: bool, ref: str, hyp: str):
         self.total += 1
         self.follow += int(bool(follow))
-        self.refs.append(ref or "")
-        self.hyps.append(hyp or "")
+        m = TASK_SPECS[self.task].metric
+        self.suff = m.add(self.suff, m.observe(ref or "", hyp or ""))
 
     def metric(self) -> Tuple[str, float]:
-        """ASR->WER(%，越小越好)，SER/GR->ACC(%，越大越好)"""
-        if self.task == "ASR":
-            return "WER(%)", asr_wer(self.refs, self.hyps)
-        elif self.task in ("SER", "GR"):
-            hit = 0
-            if self.task == "SER":
-                for r, h in zip(self.refs, self.hyps):
-                    hit += int(canon_ser(h) == (r or "").strip().lower())
-            else:
-                for r, h in zip(self.refs, self.hyps):
-                    hit += int(canon_gr(h) == (r or "").strip().lower())
-            acc = (100.0 * hit / len(self.refs)) if self.refs else 0.0
-            return "ACC(%)", acc
-        else:
-            return "N/A", 0.0
+        """ASR->WER(%，越小越好)，SER/GR->ACC(%，越大越好)，S2TT->BLEU，AAC->METEOR"""
+        m = TASK_SPECS[self.task].metric
+        return m.label, m.score(self.suff, self.total)
 
     def ifr_pct(self) -> float:
         return 100.0 * self.follow / self.total if self.total else 0.0
 
+    def merge(self, other: "Stat") -> "Stat":
+        self.total += other.total
+        self.follow += other.follow
+        self.suff = TASK_SPECS[self.task].metric.add(self.suff, other.suff)
+        return self
+
+    def __add__(self, other: "Stat") -> "Stat":
+        return Stat(self.task).merge(self).merge(other)
+
 # 嵌套容器：stage -> taskcount -> task -> Stat
 def ensure_stat(box, stage: str, n_task: int, task: str) -> Stat:
     if stage not in box: box[stage] = {}
@@ -207,23 +310,58 @@ def ensure_overall_stat(box, n_task: int, task: str) -> Stat:
         box[n_task][task] = Stat(task)
     return box[n_task][task]
 
-# ---------- 核心评测 ----------
-def eval_file(path: str):
-    data = json.load(open(path, "r", encoding="utf-8"))
-    items = data["annotation"] if isinstance(data, dict) and "annotation" in data else data
-
-    # 主聚合：Stage × TaskCount（2/3 为主；1 也支持，以便 single-task）
-    stage_tasknum_stats: Dict[str, Dict[int, Dict[str, Stat]]] = {}
-    # overall（跨 stage）的 taskcount 聚合
-    overall_tasknum_stats: Dict[int, Dict[str, Stat]] = {}
+# 一个分片的部分统计；分片按输入顺序合并，结果与串行一致
+class Partial:
+    def __init__(self):
+        # 主聚合：Stage × TaskCount（2/3 为主；1 也支持，以便 single-task）
+        self.stage_tasknum_stats: Dict[str, Dict[int, Dict[str, Stat]]] = {}
+        # overall（跨 stage）的 taskcount 聚合
+        self.overall_tasknum_stats: Dict[int, Dict[str, Stat]] = {}
+        # 便于打印：按 stage 保存分支细项
+        self.branch_counts = VariationCounts()  # "stage/branch" -> 通过数 / 总数
+        # 未遵循原因：按 "stage/branch" 记录每条回复的 Fail 码
+        self.failures = FailureLog()
+        self.phrase_hits = [0] * len(ASR_MATCHER.phrases)
+        # bootstrap：任务 -> 逐条目统计量，变体名 "stage/n-TASK"
+        self.item_stats: Dict[str, ItemStats] = {}
+
+    def observe_item(self, stage: str, n_task: int, idx: int, one: Stat):
+        metric = TASK_SPECS[one.task].metric
+        if one.task not in self.item_stats:
+            self.item_stats[one.task] = ItemStats(("total", "follow") + metric.stats)
+        values = dict(zip(metric.stats, one.suff)) if metric.stats else {}
+        self.item_stats[one.task].add(f"{stage}/{n_task}-TASK", idx,
+                                      total=one.total, follow=one.follow, **values)
+
+    def merge(self, other: "Partial") -> "Partial":
+        for stage, bucket in other.stage_tasknum_stats.items():
+            for n_task, by_task in bucket.items():
+                for t, st in by_task.items():
+                    ensure_stat(self.stage_tasknum_stats, stage, n_task, t).merge(st)
+        for n_task, by_task in other.overall_tasknum_stats.items():
+            for t, st in by_task.items():
+                ensure_overall_stat(self.overall_tasknum_stats, n_task, t).merge(st)
+        self.branch_counts.merge(other.branch_counts)
+        self.failures.merge(other.failures)
+        self.phrase_hits = [a + b for a, b in zip(self.phrase_hits, other.phrase_hits)]
+        for t, st in other.item_stats.items():
+            if t in self.item_stats:
+                self.item_stats[t].merge(st)
+            else:
+                self.item_stats[t] = st
+        return self
 
-    # 便于打印：按 stage 保存分支细项
-    detail_collect = defaultdict(lambda: defaultdict(list))  # stage -> {"separation": [...], "json":[...]}
+# ---------- 核心评测 ----------
+# map：评测一个分片（可在子进程中运行）；offset 为分片首条在全文件中的下标
+def score_shard(items, offset: int = 0, bootstrap: bool = False) -> Partial:
+    part = Partial()
+    stage_tasknum_stats = part.stage_tasknum_stats
+    overall_tasknum_stats = part.overall_tasknum_stats
+    branch_counts = part.branch_counts
+    failures = part.failures
 
-    for samp in items:
-        ref_asr = (samp.get("text") or "").strip()
-        ref_ser = (samp.get("emotion") or "").strip().lower()
-        ref_gr  = (samp.get("gender") or "").strip().lower()
+    for idx, samp in enumerate(items, start=offset):
+        refs_by_task = {t: spec.ref(samp) for t, spec in TASK_SPECS.items()}
 
         variations = (((samp.get("instructions") or {}).get("variations")) or {})
         for stage in ("single-stage", "multi-stage"):
@@ -247,21 +385,13 @@ def eval_file(path: str):
 
                     parts = resp.split(sep)
                     follow = (len(parts) == n_task)
+                    why = Fail.FOLLOWED if follow else Fail.SEPARATOR_COUNT
 
                     if follow:
-                        if 'ASR' in tasks:
-                            # 进一步检查 ASR 部分的合理性
-                            asr_index = tasks.index('ASR')
-                            asr_part = parts[asr_index].strip()
-                            follow = judge(asr_part, ref_asr)
-                        if 'SER' in tasks and follow:
-                            ser_index = tasks.index('SER')
-                            ser_part = parts[ser_index].strip()
-                            follow = follow and normed_in(ser_part, ALLOWED_SER)
-                        if 'GR' in tasks and follow:
-                            gr_index = tasks.index('GR')
-                            gr_part = parts[gr_index].strip()
-                            follow = follow and normed_in(gr_part, ALLOWED_GR)
+                        # 进一步检查各任务片段的合理性（ASR 对齐、标签合法等）
+                        why = check_tasks(tasks, parts, refs_by_task, part.phrase_hits)
+                        follow = why == Fail.FOLLOWED
+                    failures.add(f"{stage}/separation", why)
 
                     # 若不遵循，将各任务预测置空串
                     hyps_by_task = {t: "" for t in tasks}
@@ -275,25 +405,21 @@ def eval_file(path: str):
                                 x = x[1:-1].strip()
                             clean.append(x)
                         for t, p in zip(tasks, clean):
-                            hyps_by_task[t] = p
+                            hyps_by_task[t] = TASK_SPECS[t].parse(p)
                     # else:
                     #     print(f"Task: {task_str}; Response: {resp}")
 
                     # 累积到 Stage × TaskCount 的每个子任务 & overall
                     for t in tasks:
-                        st = ensure_stat(stage_tasknum_stats, stage, n_task, t)
-                        ost = ensure_overall_stat(overall_tasknum_stats, n_task, t)
-                        if t == "ASR":
-                            st.add(follow, ref_asr, hyps_by_task[t])
-                            ost.add(follow, ref_asr, hyps_by_task[t])
-                        elif t == "SER":
-                            st.add(follow, ref_ser, hyps_by_task[t])
-                            ost.add(follow, ref_ser, hyps_by_task[t])
-                        elif t == "GR":
-                            st.add(follow, ref_gr,  hyps_by_task[t])
-                            ost.add(follow, ref_gr,  hyps_by_task[t])
-
-                    detail_collect[stage]["separation"].append((tasks, follow))
+                        # 单条统计只算一次，再并入 stage 级与 overall
+                        one = Stat(t)
+                        one.add(follow, refs_by_task[t], hyps_by_task[t])
+                        ensure_stat(stage_tasknum_stats, stage, n_task, t).merge(one)
+                        ensure_overall_stat(overall_tasknum_stats, n_task, t).merge(one)
+                        if bootstrap:
+                            part.observe_item(stage, n_task, idx, one)
+
+                    branch_counts.add(branch_counts.intern(f"{stage}/separation"), follow)
 
             # -------- json --------
             json_blocks = stage_obj.get("json", [])
@@ -316,56 +442,95 @@ def eval_file(path: str):
                     try:
                         obj = json.loads(resp)
                         is_json = isinstance(obj, dict)
+                        why = Fail.FOLLOWED if is_json else Fail.JSON_NOT_OBJECT
                     except Exception:
                         obj, is_json = None, False
+                        why = Fail.JSON_INVALID
 
                     # IFR 条件：json 解析成功 + 任务数与 key 数一致 + 所有 key 存在
                     follow = bool(is_json and (len(keys) == n_task) and all(k in obj for k in keys))
+                    if is_json and not follow:
+                        why = Fail.KEY_COUNT if len(keys) != n_task else Fail.JSON_KEY_MISSING
 
                     if follow:
-                        if 'ASR' in tasks:
-                            # 进一步检查 ASR 部分的合理性
-                            asr_index = tasks.index('ASR')
-                            asr_key = keys[asr_index]
-                            asr_part = str(obj.get(asr_key, "")).strip()
-                            follow = judge(asr_part, ref_asr)
-                        if 'SER' in tasks and follow:
-                            ser_index = tasks.index('SER')
-                            ser_key = keys[ser_index]
-                            ser_part = str(obj.get(ser_key, "")).strip()
-                            follow = follow and normed_in(ser_part, ALLOWED_SER)
-                        if 'GR' in tasks and follow:
-                            gr_index = tasks.index('GR')
-                            gr_key = keys[gr_index]
-                            gr_part = str(obj.get(gr_key, "")).strip()
-                            follow = follow and normed_in(gr_part, ALLOWED_GR)
+                        # 进一步检查各任务片段的合理性（ASR 对齐、标签合法等）
+                        why = check_tasks(tasks, [str(obj.get(k, "")) for k in keys], refs_by_task, part.phrase_hits)
+                        follow = why == Fail.FOLLOWED
+                    failures.add(f"{stage}/json", why)
 
                     # 将 key 的值按顺序映射到相同位置上的任务
                     hyps_by_task = {t: "" for t in tasks}
                     if follow:
                         for t, k in zip(tasks, keys):
                             v = obj.get(k, "")
-                            hyps_by_task[t] = str(v)
+                            hyps_by_task[t] = TASK_SPECS[t].parse(str(v))
                     # else:
                         # print(f"Task: {task_str}; Response: {resp}; Keys: {keys}")
 
                     # 累积
                     for t in tasks:
-                        st = ensure_stat(stage_tasknum_stats, stage, n_task, t)
-                        ost = ensure_overall_stat(overall_tasknum_stats, n_task, t)
-                        if t == "ASR":
-                            st.add(follow, ref_asr, hyps_by_task[t])
-                            ost.add(follow, ref_asr, hyps_by_task[t])
-                        elif t == "SER":
-                            st.add(follow, ref_ser, hyps_by_task[t])
-                            ost.add(follow, ref_ser, hyps_by_task[t])
-                        elif t == "GR":
-                            st.add(follow, ref_gr,  hyps_by_task[t])
-                            ost.add(follow, ref_gr,  hyps_by_task[t])
-
-                    detail_collect[stage]["json"].append((tasks, follow))
-
-    # ---------- 打印：主汇总 = Stage × TaskCount(2/3) ----------
+                        # 单条统计只算一次，再并入 stage 级与 overall
+                        one = Stat(t)
+                        one.add(follow, refs_by_task[t], hyps_by_task[t])
+                        ensure_stat(stage_tasknum_stats, stage, n_task, t).merge(one)
+                        ensure_overall_stat(overall_tasknum_stats, n_task, t).merge(one)
+                        if bootstrap:
+                            part.observe_item(stage, n_task, idx, one)
+
+                    branch_counts.add(branch_counts.intern(f"{stage}/json"), follow)
+
+    return part
+
+def shards_of(items, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def resampled_series(item_stats: Dict[str, ItemStats], n_items: int):
+    """(任务, 统计, 指标, 变体) ；变体为汇总中的 "stage/n-TASK"（n >= 2）"""
+    for t in TASKS:
+        if t not in item_stats:
+            continue
+        st = item_stats[t]
+        st.n_items = n_items
+        metric = TASK_SPECS[t].metric
+        metrics = ("ifr", metric.key) if metric.stats and metric.key in RESAMPLE_METRICS else ("ifr",)
+        variations = sorted(v for v in st.items if int(v.split("/")[1].split("-")[0]) >= 2)
+        yield t, st, metrics, variations
+
+def bootstrap_summary(item_stats: Dict[str, ItemStats], n_items: int, n_boot: int, seed: int) -> dict:
+    """各任务用同一组重采样（同 seed、同条目数），键为 "stage/n-TASK/任务"，与打印的汇总一致。"""
+    out = {"resamples": n_boot, "seed": seed, "ci": {}, "samples": {}}
+    for t, st, metrics, variations in resampled_series(item_stats, n_items):
+        boot = bootstrap_ci(st, metrics, n_boot, seed, variations=variations, all_key=None)
+        out["level"] = boot["level"]
+        for v in variations:
+            out["ci"][f"{v}/{t}"] = boot["ci"][v]
+            out["samples"][f"{v}/{t}"] = boot["samples"][v]
+    return out
+
+def eval_file(path: str, jobs: int = 1, shard_size: int = 64, n_boot: int = 0, seed: int = 0,
+              stats_path: Optional[str] = None, samples_path: Optional[str] = None):
+    items = load_results(path)
+
+    # reduce：按分片顺序合并部分统计
+    total = Partial()
+    resampling = bool(n_boot or stats_path)
+    if jobs > 1 and len(items) > shard_size:
+        offsets = range(0, len(items), shard_size)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for part in pool.map(score_shard, shards_of(items, shard_size), offsets, repeat(resampling)):
+                total.merge(part)
+    else:
+        total.merge(score_shard(items, bootstrap=resampling))
+
+    stage_tasknum_stats = total.stage_tasknum_stats
+    overall_tasknum_stats = total.overall_tasknum_stats
+    branch_counts = total.branch_counts
+    failures = total.failures
+    item_stats = total.item_stats
+    phrase_hits = total.phrase_hits
+
+    # ---------- 打印：主汇总 = Stage × TaskCount(≥2) ----------
     def print_stat_block(title: str, bucket: Dict[int, Dict[str, Stat]], only_nums=(2, 3)):
         # print("=" * 68)
         # print(title)
@@ -383,13 +548,14 @@ def eval_file(path: str):
                 # print(f"{t:>3} | IFR {st.ifr_pct():6.2f}% | {mname} {mval:8.2f} | N={st.total}")
                 res[title][f"{n}-TASK"][t] = {
                     "ifr": round(st.ifr_pct(), 2),
-                    mname.lower()[:3]: round(mval, 2),
+                    TASK_SPECS[t].metric.key: round(mval, TASK_SPECS[t].metric.digits),
                     "n": st.total
                 }
 
     for stage in ("single-stage", "multi-stage"):
         if stage in stage_tasknum_stats:
-            print_stat_block(stage, stage_tasknum_stats[stage], only_nums=(2, 3))
+            nums = sorted(n for n in stage_tasknum_stats[stage] if n >= 2)
+            print_stat_block(stage, stage_tasknum_stats[stage], only_nums=nums)
 
     # ---------- 打印：Single-Task（跨 stage 汇总，若存在 n=1） ----------
     if 1 in overall_tasknum_stats and any(overall_tasknum_stats[1].get(t, None) for t in TASKS):
@@ -400,36 +566,54 @@ def eval_file(path: str):
             if not st or st.total == 0: 
                 continue
             mname, mval = st.metric()
-            print(f"{t:>3} | IFR {st.ifr_pct():6.2f}% | {mname} {mval:8.2f} | N={st.total}")
+            print(f"{t:>4} | IFR {st.ifr_pct():6.2f}% | {mname} {mval:8.2f} | N={st.total}")
 
     # ----------（可选）细节：每个 stage 下分支通过率 ----------
     for stage in ("single-stage", "multi-stage"):
-        if stage not in detail_collect: 
-            continue
         # print("=" * 68)
         # print(f"[Details] {stage}")
         for branch in ("separation", "json"):
-            if branch not in detail_collect[stage]: 
-                continue
-            L = detail_collect[stage][branch]
-            if not L: 
+            vid = branch_counts.ids.get(f"{stage}/{branch}")
+            if vid is None: 
                 continue
-            total = len(L)
-            follow = sum(int(f) for _tasks, f in L)
+            total = branch_counts.total[vid]
+            follow = branch_counts.follow[vid]
             # print(f"{branch:>11}: IFR {100.0*follow/total:6.2f}% | N={total}")
             res[stage][branch] = {
                 "ifr": round(100.0 * follow / total, 2),
                 "n": total
             }
 
+    res["diagnostics"] = {"failures": failures.histograms(), "phrase_hits": ASR_MATCHER.hit_counts(phrase_hits),
+                          **run_diagnostics(items)}
+    if n_boot:
+        res["diagnostics"]["bootstrap"] = split_samples(bootstrap_summary(item_stats, len(items), n_boot, seed),
+                                                        samples_path)
+    if stats_path:
+        series = {}
+        for t, st, metrics, variations in resampled_series(item_stats, len(items)):
+            series.update(item_series(st, metrics, variations, all_key=None, suffix=f"/{t}"))
+        save_item_stats(stats_path, [samp.get("path") for samp in items], series)
+
     output = json.dumps(res, indent=2, ensure_ascii=False)
     print(output)
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python eval_ifr_stage_tasknum.py infer_result.json")
-        sys.exit(1)
-    eval_file(sys.argv[1])
+    parser = argparse.ArgumentParser(description="IFR / metrics of multi-task (n) results.")
+    parser.add_argument("infer_result", help="infer_result.json")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes for the map phase (1 = serial)")
+    parser.add_argument("--shard_size", type=int, default=64, help="items per shard")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="item resamples for 95%% confidence intervals (0 = off)")
+    parser.add_argument("--seed", type=int, default=0, help="bootstrap seed")
+    parser.add_argument("--item_stats", default=None, help="dump the per-item statistics here (for compare.py)")
+    parser.add_argument("--bootstrap_samples", default=None,
+                        help="write the resampled values here, .npz (for calc_area.py --bootstrap)")
+    args = parser.parse_args()
+    eval_file(args.infer_result, jobs=args.jobs, shard_size=args.shard_size,
+              n_boot=args.bootstrap, seed=args.seed, stats_path=args.item_stats,
+              samples_path=args.bootstrap_samples)
 
 if __name__ == "__main__":
     main()
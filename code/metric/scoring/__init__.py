@@ -0,0 +1,12 @@
+from .failures import Fail as Fail
+from .failures import FailureLog as FailureLog
+from .gates import is_repeated_sentence as is_repeated_sentence
+from .gates import PhraseMatcher as PhraseMatcher
+from .labels import LabelEngine as LabelEngine
+from .counters import KeyIndex as KeyIndex
+from .counters import VariationCounts as VariationCounts
+from .bootstrap import ItemStats as ItemStats
+from .bootstrap import resample_args as resample_args
+from .bootstrap import bootstrap_ci as bootstrap_ci
+from .bootstrap import ResampleOptions as ResampleOptions
+from .bootstrap import load_item_stats as load_item_stats
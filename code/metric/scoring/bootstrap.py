@@ -0,0 +1,286 @@
+import argparse
+import json
+from array import array
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_SEED = 0
+CI_LEVEL = 95.0
+
+
+class ResampleOptions(NamedTuple):
+    bootstrap: int = 0                  # resamples for the CIs, 0 = off
+    seed: int = DEFAULT_SEED
+    item_stats: Optional[str] = None    # where to dump the per-item statistics (compare.py)
+    samples: Optional[str] = None       # where to write the resampled values (calc_area.py --bootstrap)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.bootstrap or self.item_stats)
+
+
+def resample_args(argv: Sequence[str]) -> ResampleOptions:
+    """
+    `--bootstrap N [--seed S] [--item_stats PATH] [--bootstrap_samples PATH]` anywhere in argv. Lets
+    the positional-argument scorers take the options without changing their usage.
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument("--bootstrap", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--item_stats", default=None)
+    parser.add_argument("--bootstrap_samples", default=None)
+    args, _ = parser.parse_known_args(list(argv))
+    return ResampleOptions(args.bootstrap, args.seed, args.item_stats, args.bootstrap_samples)
+
+
+def resample_weights(n_items: int, n_resamples: int, seed: int = DEFAULT_SEED) -> np.ndarray:
+    """
+    Bootstrap weight matrix (n_resamples x n_items): entry (b, i) is how often item i is drawn in
+    resample b. Summed statistics of every resample are then one matrix product.
+    """
+    rng = np.random.default_rng(seed)
+    if n_items == 0:
+        return np.zeros((n_resamples, 0))
+    return rng.multinomial(n_items, np.full(n_items, 1.0 / n_items), size=n_resamples).astype(float)
+
+
+class ItemStats:
+    """
+    Per-item sufficient statistics of a scorer, per variation.
+
+    Each response adds one row (item index + one value per statistic); rows of the same item are
+    summed when the (n_items x n_stats) matrix is built, so resampling items keeps all responses to
+    an item together.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names: List[str] = list(names)
+        self.items: Dict[str, array] = {}
+        self.values: Dict[str, List[array]] = {}
+        self.n_items = 0
+
+    def _rows(self, variation: str):
+        if variation not in self.items:
+            self.items[variation] = array("q")
+            self.values[variation] = [array("d") for _ in self.names]
+        return self.items[variation], self.values[variation]
+
+    def add(self, variation: str, item: int, **values):
+        items, cols = self._rows(variation)
+        items.append(item)
+        for name, col in zip(self.names, cols):
+            col.append(values.get(name, 0))
+        self.n_items = max(self.n_items, item + 1)
+
+    def extend(self, variation: str, items, **columns):
+        """Bulk version of add(): items and every column are equally long sequences."""
+        items = np.asarray(items, dtype=np.int64)
+        rows, cols = self._rows(variation)
+        rows.extend(items.tolist())
+        for name, col in zip(self.names, cols):
+            values = columns.get(name)
+            col.extend(np.zeros(len(items)).tolist() if values is None else np.asarray(values, dtype=float).tolist())
+        if len(items):
+            self.n_items = max(self.n_items, int(items.max()) + 1)
+
+    def merge(self, other: "ItemStats") -> "ItemStats":
+        for variation, items in other.items.items():
+            rows, cols = self._rows(variation)
+            rows.extend(items)
+            for col, values in zip(cols, other.values[variation]):
+                col.extend(values)
+        self.n_items = max(self.n_items, other.n_items)
+        return self
+
+    def matrix(self, variation: str, n_items: Optional[int] = None) -> np.ndarray:
+        n_items = self.n_items if n_items is None else n_items
+        out = np.zeros((n_items, len(self.names)))
+        if variation in self.items:
+            idx = np.frombuffer(self.items[variation], dtype=np.int64)
+            for j, col in enumerate(self.values[variation]):
+                out[:, j] = np.bincount(idx, weights=np.frombuffer(col, dtype=float), minlength=n_items)
+        return out
+
+
+# metric name -> f(summed statistics by name, each of shape (n_resamples,)) -> (n_resamples,) values
+ResampleMetrics = Dict[str, Callable[[Dict[str, np.ndarray]], np.ndarray]]
+
+
+def ratio(num: np.ndarray, den: np.ndarray, scale: float = 100.0) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, scale * num / np.where(den > 0, den, 1), np.nan)
+
+
+def follow_rate(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    return ratio(stats["follow"], stats["total"])
+
+
+BLEU_STATS = ("sys_len", "ref_len", "c1", "c2", "c3", "c4", "t1", "t2", "t3", "t4")
+
+
+def bleu_from_counts(stats: np.ndarray) -> np.ndarray:
+    """
+    Corpus BLEU (sacrebleu's compute_bleu, exp smoothing, 4-grams, no effective order) of many
+    count vectors at once; stats[..., :] = sys_len, ref_len, correct_1..4, total_1..4.
+    """
+    stats = np.asarray(stats, dtype=float)
+    sys_len, ref_len = stats[..., 0], stats[..., 1]
+    correct, total = stats[..., 2:6], stats[..., 6:10]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        bp = np.where(sys_len < ref_len,
+                      np.where(sys_len > 0, np.exp(1 - ref_len / np.where(sys_len > 0, sys_len, 1)), 0.0),
+                      1.0)
+        zero = correct == 0
+        smooth = 2.0 ** np.cumsum(zero, axis=-1)
+        prec = np.where(zero, 100.0 / (smooth * total), 100.0 * correct / total)
+        # orders after the first one without any n-gram stay at precision 0
+        prec = np.where(np.cumprod(total > 0, axis=-1).astype(bool), prec, 0.0)
+        log_prec = np.where(prec > 0, np.log(np.where(prec > 0, prec, 1)), -9999999999)
+        score = bp * np.exp(log_prec.sum(axis=-1) / 4)
+    return np.where(correct.any(axis=-1), score, 0.0)
+
+
+def bleu_of_stats(stats: Dict[str, np.ndarray]) -> np.ndarray:
+    return bleu_from_counts(np.stack([stats[name] for name in BLEU_STATS], axis=-1))
+
+
+# metric id, as in the scorer outputs -> score of summed statistics; ACC is over the responses with a
+# gold label where the scorer keeps that count, else over all responses
+RESAMPLE_METRICS: ResampleMetrics = {
+    "ifr": follow_rate,
+    "wer": lambda s: ratio(s["edits"], s["words"]),
+    "acc": lambda s: ratio(s["correct"], s["gold"] if "gold" in s else s["total"]),
+    "bleu": bleu_of_stats,
+    "METEOR": lambda s: ratio(s["meteor"], s["total"], scale=1.0),
+}
+
+
+def score_stats(metric: str, names: Sequence[str], summed: np.ndarray) -> np.ndarray:
+    """RESAMPLE_METRICS[metric] of summed statistics (..., len(names))."""
+    return np.asarray(RESAMPLE_METRICS[metric]({name: summed[..., j] for j, name in enumerate(names)}),
+                      dtype=float)
+
+
+def item_matrices(stats: ItemStats, variations: Optional[Sequence[str]] = None,
+                  all_key: Optional[str] = "all") -> Dict[str, np.ndarray]:
+    variations = list(stats.items) if variations is None else list(variations)
+    mats = {v: stats.matrix(v) for v in variations}
+    if all_key is not None and mats:
+        mats[all_key] = sum(mats.values())
+    return mats
+
+
+def bootstrap_ci(stats: ItemStats, metrics: Sequence[str], n_resamples: int,
+                 seed: int = DEFAULT_SEED, variations: Optional[Sequence[str]] = None,
+                 all_key: Optional[str] = "all", digits: int = 4,
+                 centers: Optional[Dict[str, Dict[str, float]]] = None) -> dict:
+    """
+    Resample items n_resamples times and return percentile CI_LEVEL% intervals of every metric
+    (ids of RESAMPLE_METRICS).
+
+    The same resampled items are used for every variation (and for all_key, the sum over the
+    variations), so intervals of different variations are comparable. The replicate values are
+    returned as well, to propagate the uncertainty further (calc_area.py --bootstrap).
+
+    centers ({variation: {metric: reported value}}) is for metrics resampled through a proxy
+    statistic: their replicates are shifted by the reported value minus the proxy on all items, so
+    that they are centred on what the scorer reports.
+    """
+    weights = resample_weights(stats.n_items, n_resamples, seed)
+    mats = item_matrices(stats, variations, all_key)
+
+    lo_q, hi_q = (100.0 - CI_LEVEL) / 2, 100.0 - (100.0 - CI_LEVEL) / 2
+    ci, samples = {}, {}
+    for v, mat in mats.items():
+        summed = weights @ mat
+        ci[v], samples[v] = {}, {}
+        for metric in metrics:
+            values = score_stats(metric, stats.names, summed)
+            if np.all(np.isnan(values)):
+                continue
+            center = (centers or {}).get(v, {}).get(metric)
+            if isinstance(center, (int, float)):
+                values = values + (center - float(score_stats(metric, stats.names, mat.sum(axis=0))))
+            lo, hi = np.nanpercentile(values, [lo_q, hi_q])
+            ci[v][metric] = [round(float(lo), digits), round(float(hi), digits)]
+            samples[v][metric] = np.round(values, digits).tolist()
+    return {"resamples": n_resamples, "seed": seed, "level": CI_LEVEL, "ci": ci, "samples": samples}
+
+
+def item_series(stats: ItemStats, metrics: Sequence[str], variations: Optional[Sequence[str]] = None,
+                all_key: Optional[str] = "all", suffix: str = "") -> dict:
+    """Per-item summed statistics of every variation, in the layout of save_item_stats."""
+    return {
+        v + suffix: {"metrics": list(metrics),
+                     "stats": {name: mat[:, j].tolist() for j, name in enumerate(stats.names)}}
+        for v, mat in item_matrices(stats, variations, all_key).items()
+    }
+
+
+def save_item_stats(path: str, keys: Sequence[str], series: dict):
+    """
+    keys[i] identifies item i (its audio `path`), series maps a variation to its metric ids and one
+    per-item column per statistic. Read back with load_item_stats.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"keys": list(keys), "series": series}, f, ensure_ascii=False)
+
+
+def load_item_stats(path: str) -> Tuple[List[str], Dict[str, Tuple[List[str], List[str], np.ndarray]]]:
+    """(keys, {variation: (metric ids, statistic names, n_items x n_stats matrix)})"""
+    with open(path, "r", encoding="utf-8") as f:
+        obj = json.load(f)
+    series = {}
+    for v, s in obj["series"].items():
+        names = list(s["stats"])
+        mat = np.array([s["stats"][name] for name in names], dtype=float).T.reshape(len(obj["keys"]), len(names))
+        series[v] = (s["metrics"], names, mat)
+    return obj["keys"], series
+
+
+def save_samples(path: str, samples: Dict[str, Dict[str, Sequence[float]]]):
+    """
+    The resampled values of bootstrap_ci ({variation: {metric: values}}) as a compressed numpy
+    archive (path should end in .npz); read back with load_samples.
+    """
+    rows = [(v, metric, values) for v, by_metric in samples.items() for metric, values in by_metric.items()]
+    values = np.array([r[2] for r in rows], dtype=float) if rows else np.zeros((0, 0))
+    np.savez_compressed(path, variations=np.array([r[0] for r in rows], dtype=str),
+                        metrics=np.array([r[1] for r in rows], dtype=str), values=values)
+
+
+def load_samples(path: str) -> Dict[str, Dict[str, np.ndarray]]:
+    with np.load(path) as archive:
+        out: Dict[str, Dict[str, np.ndarray]] = {}
+        for v, metric, values in zip(archive["variations"], archive["metrics"], archive["values"]):
+            out.setdefault(str(v), {})[str(metric)] = values
+    return out
+
+
+def split_samples(boot: dict, path: Optional[str]) -> dict:
+    """
+    bootstrap entry without its resampled values, which go to path instead (if given; the entry
+    then names the file under `samples_file`). Keeps the scorer outputs small.
+    """
+    boot = dict(boot)
+    samples = boot.pop("samples")
+    if path:
+        save_samples(path, samples)
+        boot["samples_file"] = path
+    return boot
+
+
+def report_resampling(res: dict, stats: ItemStats, metrics: Sequence[str], keys: Sequence[str],
+                      opts: ResampleOptions, variations: Optional[Sequence[str]] = None,
+                      centers: Optional[Dict[str, Dict[str, float]]] = None):
+    """
+    Add the `bootstrap` entry to a scorer's `diagnostics` (the resampled values to opts.samples) and
+    / or dump the per-item statistics, per opts. centers: see bootstrap_ci.
+    """
+    stats.n_items = max(stats.n_items, len(keys))
+    if opts.bootstrap:
+        boot = bootstrap_ci(stats, metrics, opts.bootstrap, opts.seed, variations, centers=centers)
+        res.setdefault("diagnostics", {})["bootstrap"] = split_samples(boot, opts.samples)
+    if opts.item_stats:
+        save_item_stats(opts.item_stats, keys, item_series(stats, metrics, variations))
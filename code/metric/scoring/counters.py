@@ -0,0 +1,74 @@
+from array import array
+from typing import Dict, Iterator, List
+
+
+class KeyIndex:
+    """
+    Ordered interning of variation names to dense integer ids.
+
+    Ids are handed out in first-seen order, so iterating the index gives the
+    same key order the scorers used to build with `key_order.append`.
+    """
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def intern(self, name: str) -> int:
+        vid = self.ids.get(name)
+        if vid is None:
+            vid = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self._grow()
+        return vid
+
+    def _grow(self):
+        pass
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+
+
+class VariationCounts(KeyIndex):
+    """
+    Follow / total counters per interned variation, one int64 slot per id.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.total = array("q")
+        self.follow = array("q")
+
+    def _grow(self):
+        self.total.append(0)
+        self.follow.append(0)
+
+    def add(self, vid: int, follow: bool):
+        self.total[vid] += 1
+        self.follow[vid] += follow
+
+    def merge(self, other: "VariationCounts") -> "VariationCounts":
+        for name, total, follow in zip(other.names, other.total, other.follow):
+            vid = self.intern(name)
+            self.total[vid] += total
+            self.follow[vid] += follow
+        return self
+
+    def count(self, name: str) -> int:
+        vid = self.ids.get(name)
+        return self.total[vid] if vid is not None else 0
+
+    def ifr(self, vid: int) -> float:
+        return 100.0 * self.follow[vid] / self.total[vid] if self.total[vid] else 0.0
+
+    def all_total(self) -> int:
+        return sum(self.total)
+
+    def all_follow(self) -> int:
+        return sum(self.follow)
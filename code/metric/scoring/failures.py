@@ -0,0 +1,68 @@
+from array import array
+from collections import Counter
+from enum import IntEnum
+from typing import Dict
+
+
+class Fail(IntEnum):
+    """
+    Why a response was judged as not following its instruction.
+
+    The values are stored per response in uint8 arrays, so keep them < 256
+    and only ever append new members (existing result files refer to them).
+    """
+
+    FOLLOWED = 0
+    UNKNOWN_VARIATION = 1
+    PREFIX_MISSING = 2
+    SUFFIX_MISSING = 3
+    WRAP_MISSING = 4
+    WRAP_SPEC = 5
+    CASE = 6
+    JSON_INVALID = 7
+    JSON_NOT_OBJECT = 8
+    JSON_KEY_MISSING = 9
+    CANDIDATE_PHRASE = 10
+    REPEATED = 11
+    WER_TOO_HIGH = 12
+    INSERTIONS = 13
+    LABEL_INVALID = 14
+    EXTRA_WORDS = 15
+    CONSTRAIN = 16
+    NOT_CHINESE = 17
+    SEPARATOR_COUNT = 18
+    KEY_COUNT = 19
+    EMPTY = 20
+
+
+class FailureLog:
+    """
+    Per-variation record of one Fail code per response, in response order.
+    """
+
+    def __init__(self):
+        self.codes: Dict[str, array] = {}
+
+    def add(self, variation: str, code: Fail):
+        if variation not in self.codes:
+            self.codes[variation] = array("B")
+        self.codes[variation].append(code)
+
+    def extend(self, variation: str, codes):
+        """Append a whole column of codes (any iterable of ints) at once."""
+        if variation not in self.codes:
+            self.codes[variation] = array("B")
+        self.codes[variation].extend(int(c) for c in codes)
+
+    def merge(self, other: "FailureLog") -> "FailureLog":
+        """Append other's codes after ours (shards are merged in input order)."""
+        for variation, codes in other.codes.items():
+            self.extend(variation, codes)
+        return self
+
+    def histogram(self, variation: str) -> Dict[str, int]:
+        counts = Counter(self.codes.get(variation, ()))
+        return {Fail(c).name.lower(): counts[c] for c in sorted(counts)}
+
+    def histograms(self) -> Dict[str, Dict[str, int]]:
+        return {v: self.histogram(v) for v in self.codes}
@@ -0,0 +1,65 @@
+import re
+from typing import Dict, List, Optional
+
+PUNCT_RE = re.compile(r"[^\w\s]")
+
+
+def is_repeated_sentence(sentence: str) -> bool:
+    """
+    True if the response is one word sequence looped at least twice.
+
+    Each distinct word is mapped to one character, so the word sequence
+    becomes a string t; t is a proper repetition iff it occurs in t + t at
+    some offset 0 < p < len(t), and the first such offset is its period.
+    str.find runs this search in linear time.
+    """
+    words = PUNCT_RE.sub(" ", sentence).lower().split()
+    n = len(words)
+    if n < 2:
+        return False
+    ids = {}
+    t = "".join([chr(ids.setdefault(w, len(ids))) for w in words])
+    return (t + t).find(t, 1) < n
+
+
+class PhraseMatcher:
+    """
+    Case-insensitive substring matcher for a fixed list of boilerplate phrases.
+
+    Built once per task; each response is lowercased once and scanned once by
+    a single compiled pattern. `hits[i]` counts the scanned responses that
+    contain phrases[i].
+    """
+
+    def __init__(self, phrases: List[str]):
+        self.phrases = list(phrases)
+        self.hits = [0] * len(self.phrases)
+        self._index: Dict[str, List[int]] = {}
+        for i, p in enumerate(self.phrases):
+            self._index.setdefault(p.lower(), []).append(i)
+        lowered = sorted(self._index, key=len, reverse=True)
+        # the lookahead reports the longest phrase starting at every position;
+        # shorter phrases hidden inside it are added back through _inner
+        self._re = re.compile("(?=(" + "|".join(re.escape(p) for p in lowered) + "))")
+        self._inner = {p: [q for q in lowered if q != p and q in p] for p in lowered}
+
+    def find(self, text: str) -> List[int]:
+        """Indices of the phrases that occur in text."""
+        found = set()
+        for m in self._re.finditer(text.lower()):
+            p = m.group(1)
+            if p not in found:
+                found.add(p)
+                found.update(self._inner[p])
+        return sorted(i for p in found for i in self._index[p])
+
+    def scan(self, text: str, hits: Optional[List[int]] = None) -> bool:
+        """Count the phrases found in text into hits (default: self.hits); True if there was any."""
+        idx = self.find(text)
+        hits = self.hits if hits is None else hits
+        for i in idx:
+            hits[i] += 1
+        return bool(idx)
+
+    def hit_counts(self, hits: Optional[List[int]] = None) -> Dict[str, int]:
+        return dict(zip(self.phrases, self.hits if hits is None else hits))
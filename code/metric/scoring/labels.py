@@ -0,0 +1,59 @@
+import re
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+
+NOT_FOLLOWED = -1
+UNKNOWN = -2
+
+
+class LabelEngine:
+    """
+    Maps classification responses (SER/GR) to integer label codes.
+
+    Code i means labels[i]; NOT_FOLLOWED (-1) means no valid label.
+    mode="search" takes the first label word found in the response,
+    mode="exact" requires the whole response (minus quotes and a final
+    period) to be a label. Responses repeat a lot ("neutral", "Male."), so
+    every distinct string is resolved once and then served from a dict.
+    """
+
+    def __init__(self, labels: Sequence[str], mode: str = "search"):
+        if mode not in ("search", "exact"):
+            raise ValueError(f"Unknown label mode: {mode}")
+        self.labels: List[str] = [l.lower() for l in labels]
+        self.mode = mode
+        self._code: Dict[str, int] = {l: i for i, l in enumerate(self.labels)}
+        self._re = re.compile(r"\b(" + "|".join(re.escape(l) for l in self.labels) + r")\b", re.IGNORECASE)
+        self._cache: Dict[str, int] = {}
+
+    def _resolve(self, s: str) -> int:
+        if self.mode == "exact":
+            return self._code.get(s.strip("'").strip('"').strip(".").lower(), NOT_FOLLOWED)
+        m = self._re.search(s.strip().strip("'\"").strip())
+        return self._code[m.group(1).lower()] if m else NOT_FOLLOWED
+
+    def encode_one(self, s: str) -> int:
+        code = self._cache.get(s)
+        if code is None:
+            code = self._cache[s] = self._resolve(s or "")
+        return code
+
+    def encode(self, responses: Iterable[str]) -> np.ndarray:
+        """Label codes of a whole column of responses."""
+        cache = self._cache
+        return np.fromiter(
+            (cache[s] if s in cache else self.encode_one(s) for s in responses),
+            dtype=np.int8,
+        )
+
+    def label_code(self, label: str) -> int:
+        """
+        Code of a reference label. An empty reference gives NOT_FOLLOWED, so it
+        compares equal to an unlabeled hypothesis; other unknown labels give
+        UNKNOWN, which matches nothing.
+        """
+        s = (label or "").strip().lower()
+        if not s:
+            return NOT_FOLLOWED
+        return self._code.get(s, UNKNOWN)
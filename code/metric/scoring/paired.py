@@ -0,0 +1,101 @@
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .bootstrap import CI_LEVEL, DEFAULT_SEED, score_stats
+
+CHUNK = 1000   # resamples per matrix product; bounds memory at CHUNK x n_items
+
+
+def merge_keys(keys: Sequence[str], mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum the rows of items sharing a key (the same audio scored twice); returns (unique keys, rows)."""
+    uniq, inverse = np.unique(np.asarray(keys, dtype=str), return_inverse=True)
+    out = np.zeros((len(uniq), mat.shape[1]))
+    np.add.at(out, inverse, mat)
+    return uniq, out
+
+
+def align(keys_a: Sequence[str], mat_a: np.ndarray, keys_b: Sequence[str], mat_b: np.ndarray):
+    """Rows of both systems for the keys present in both, in the same order; plus the unmatched counts."""
+    uniq_a, mat_a = merge_keys(keys_a, mat_a)
+    uniq_b, mat_b = merge_keys(keys_b, mat_b)
+    common, ia, ib = np.intersect1d(uniq_a, uniq_b, assume_unique=True, return_indices=True)
+    return mat_a[ia], mat_b[ib], len(uniq_a) - len(common), len(uniq_b) - len(common)
+
+
+def _chunks(total: int):
+    for start in range(0, total, CHUNK):
+        yield min(CHUNK, total - start)
+
+
+def paired_tests(series: Dict[str, Tuple[Sequence[str], Sequence[str]]], mat_a: np.ndarray, mat_b: np.ndarray,
+                 n_resamples: int = 10000, n_permutations: int = 10000, seed: int = DEFAULT_SEED,
+                 digits: int = 4) -> Dict[str, Dict[str, dict]]:
+    """
+    Paired bootstrap and approximate randomization tests of metric(A) - metric(B) over aligned items.
+
+    series maps a variation to (statistic names, metric ids); mat_a / mat_b hold the per-item
+    statistics of the two systems on the same items, the columns of all variations side by side in
+    the order of series. The bootstrap resamples items for both systems at once (CI of the
+    difference, p-value of the shifted distribution); the randomization test swaps the two systems'
+    statistics of each item with probability 1/2. Both are one matrix product per chunk of
+    resamples, shared by all variations and metrics.
+    """
+    n_items = mat_a.shape[0]
+    cols, start = {}, 0
+    for var, (names, _) in series.items():
+        cols[var] = slice(start, start + len(names))
+        start += len(names)
+
+    def deltas(sum_a, sum_b):
+        return {(var, m): score_stats(m, names, sum_a[..., cols[var]]) - score_stats(m, names, sum_b[..., cols[var]])
+                for var, (names, metrics) in series.items() for m in metrics}
+
+    total_a, total_b = mat_a.sum(axis=0), mat_b.sum(axis=0)
+    observed = {key: float(d) for key, d in deltas(total_a, total_b).items()}
+    out: Dict[str, Dict[str, dict]] = {var: {} for var in series}
+    for (var, m), d_obs in observed.items():
+        names = series[var][0]
+        out[var][m] = {"a": round(float(score_stats(m, names, total_a[cols[var]])), digits),
+                       "b": round(float(score_stats(m, names, total_b[cols[var]])), digits),
+                       "delta": round(d_obs, digits)}
+    if n_items == 0:
+        return out
+
+    boot_seq, perm_seq = np.random.SeedSequence(seed).spawn(2)
+    rng = np.random.default_rng(boot_seq)
+    boot: Dict[tuple, List[np.ndarray]] = {key: [] for key in observed}
+    p = np.full(n_items, 1.0 / n_items)
+    for size in _chunks(n_resamples):
+        weights = rng.multinomial(n_items, p, size=size).astype(float)
+        for key, d in deltas(weights @ mat_a, weights @ mat_b).items():
+            boot[key].append(d)
+
+    rng = np.random.default_rng(perm_seq)
+    diff = mat_b - mat_a
+    perm: Dict[tuple, List[np.ndarray]] = {key: [] for key in observed}
+    for size in _chunks(n_permutations):
+        moved = (rng.random((size, n_items)) < 0.5).astype(float) @ diff
+        for key, d in deltas(total_a + moved, total_b - moved).items():
+            perm[key].append(d)
+
+    lo_q, hi_q = (100.0 - CI_LEVEL) / 2, 100.0 - (100.0 - CI_LEVEL) / 2
+    for (var, m), d_obs in observed.items():
+        if np.isnan(d_obs):
+            continue
+        res = out[var][m]
+        tol = 1e-9 * max(1.0, abs(d_obs))
+        if n_resamples:
+            d = np.concatenate(boot[(var, m)])
+            d = d[~np.isnan(d)]
+            if d.size:
+                lo, hi = np.percentile(d, [lo_q, hi_q])
+                res["ci"] = [round(float(lo), digits), round(float(hi), digits)]
+                res["p_bootstrap"] = round(float(np.mean(np.abs(d - d_obs) >= abs(d_obs) - tol)), digits)
+        if n_permutations:
+            d = np.concatenate(perm[(var, m)])
+            d = d[~np.isnan(d)]
+            if d.size:
+                hits = int(np.sum(np.abs(d) >= abs(d_obs) - tol))
+                res["p_randomization"] = round((hits + 1) / (d.size + 1), digits)
+    return out
@@ -0,0 +1,57 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+# shard directories written by run_inference.py --shards (inference/shards.py): manifest.json lists the
+# NDJSON shard files, the annotation index of every line and the byte length covered by the last fsync
+MANIFEST = "manifest.json"
+
+
+class Results(list):
+    """
+    Items of a result file. `adaptive` is the stopping summary of an adaptive run (run_inference.py
+    --ci_width), whose stopped variations have fewer items than the others; None otherwise.
+    """
+
+    def __init__(self, items=(), adaptive: Optional[Dict[str, Any]] = None):
+        super().__init__(items)
+        self.adaptive = adaptive
+
+
+def run_diagnostics(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """What a scorer adds to its `diagnostics` about the run behind items: {"adaptive": ...} or nothing."""
+    adaptive = getattr(items, "adaptive", None)
+    return {"adaptive": adaptive} if adaptive else {}
+
+
+def read_shards(directory: str) -> List[Dict[str, Any]]:
+    """Items of a shard directory in annotation order; bytes past a shard's last checkpoint are ignored."""
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    indexed = []
+    for shard in manifest["shards"]:
+        with open(os.path.join(directory, shard["file"]), "rb") as f:
+            lines = f.read(shard["bytes"]).splitlines()
+        indexed.extend(zip(shard["items"], (json.loads(ln) for ln in lines if ln.strip())))
+    indexed.sort(key=lambda pair: pair[0])
+    return Results((item for _, item in indexed), manifest.get("adaptive"))
+
+
+def load_results(path: str) -> List[Dict[str, Any]]:
+    """
+    Items of a result file: a JSON array, {"annotation": [...]}, a single item object, NDJSON, or a
+    shard directory.
+    """
+    if os.path.isdir(path):
+        return read_shards(path)
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return [json.loads(ln) for ln in content.splitlines() if ln.strip()]
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return Results(data["annotation"], data.get("adaptive")) if isinstance(data.get("annotation"), list) else [data]
+    raise ValueError("Top-level JSON must be array or object.")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Pack annotation files into the compact binary format of inference/packed.py.
+
+A packed file holds every distinct string (instructions, constraints,
+paths, keys) once, the items as varint-coded records, and compresses them
+in blocks of 64 items with zstd (zlib when zstandard is not installed).
+run_inference.py and inference.load_annotation read packed files like the
+JSON ones and give the same items. Reading all items decodes them in
+Python and is slower than json.load; reading a range (run_inference.py
+--start / --limit) decompresses and decodes only the blocks holding it.
+
+Usage:
+  python pack_annotations.py                      # data/{d,f}/*.json -> *.pack next to them
+  python pack_annotations.py ../data/d/IEMOCAP_Session5_emotion.json --codec zlib
+"""
+import argparse
+import glob
+import os
+import sys
+
+from inference.jobs import load_annotation
+from inference.packed import pack_file, read_packed, zstandard
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack annotation JSON files.')
+    parser.add_argument('annotations', nargs='*', help='annotation files (default: ../data/d/*.json and ../data/f/*.json)')
+    parser.add_argument('--codec', choices=['zstd', 'zlib'], default=None,
+                        help='body compression (default: zstd if zstandard is installed, else zlib)')
+    parser.add_argument('--output_dir', default=None, help='write to <output_dir>/<dim>/ (default: next to each annotation file)')
+    parser.add_argument('--verify', action='store_true', help='read every packed file back and compare the items')
+    args = parser.parse_args()
+    if args.codec == 'zstd' and zstandard is None:
+        parser.error('--codec zstd needs the zstandard package')
+
+    files = args.annotations or sorted(glob.glob('../data/d/*.json') + glob.glob('../data/f/*.json'))
+    for src in files:
+        # <output_dir>/<dim>/, as d and f files share their names
+        out_dir = os.path.join(args.output_dir, os.path.basename(os.path.dirname(os.path.abspath(src)))) if args.output_dir else os.path.dirname(src)
+        os.makedirs(out_dir or '.', exist_ok=True)
+        dst = os.path.join(out_dir, os.path.splitext(os.path.basename(src))[0] + '.pack')
+        n = pack_file(src, dst, args.codec)
+        if args.verify:
+            if read_packed(dst) != load_annotation(src):
+                sys.exit(f'{dst} does not read back as {src}')
+        print(f'{src}: {n} items, {os.path.getsize(src)} -> {os.path.getsize(dst)} bytes in {dst}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Append-only SQLite store of the metrics of every model and run.
+
+One row per (model, run_id, dim, task, variation, metric) with its value and
+the number of responses n it was computed on. d/f rows use the scorer's
+variation and task names; n rows use the stage as variation and
+"K-TASK/TASK" (or "separation", "json") as task. merge_outputs.py and
+metric.py add runs, calc_area.py --db reads the models back.
+
+A (model, dim, task) only gets a new run when its rows changed, and a
+model's current results are the latest run of each of its (dim, task).
+
+Usage:
+  python results_db.py import ../data/collect_all_metrics.json
+  python results_db.py leaderboard --dim d --task asr --metric wer
+  python results_db.py history --model example --dim d --task asr --metric wer
+"""
+import argparse
+import json
+import os
+import sqlite3
+import uuid
+from datetime import datetime
+
+DEFAULT_DB = '../data/results.sqlite'
+
+# the one entry of a scorer output that is not a variation (n: a stage): failures, phrase_hits, bootstrap
+DIAGNOSTICS_KEY = 'diagnostics'
+
+# leaderboards rank these ascending
+LOWER_IS_BETTER = ('wer',)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    model TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    model TEXT NOT NULL,
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    dim TEXT NOT NULL,
+    task TEXT NOT NULL,
+    variation TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    n INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_by_model ON results(model, dim, task, run_id);
+CREATE INDEX IF NOT EXISTS results_by_axis ON results(dim, task, variation, metric);
+CREATE INDEX IF NOT EXISTS results_by_run ON results(run_id);
+"""
+
+
+def new_run_id():
+    return f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def _number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def scorer_rows(dim, task, res):
+    """(dim, task, variation, metric, value, n) rows of one d/f scorer output."""
+    failures = res.get(DIAGNOSTICS_KEY, {}).get('failures', {})
+    counts = {var: sum(hist.values()) for var, hist in failures.items()}
+    if counts:
+        counts['all'] = sum(counts.values())
+    for var, metrics in res.items():
+        if var == DIAGNOSTICS_KEY or not isinstance(metrics, dict):
+            continue
+        for metric, value in metrics.items():
+            if _number(value):
+                yield dim, task, var, metric, float(value), counts.get(var)
+
+
+def n_rows(res):
+    """Rows of the n scorer output: the stage is the variation, the path below it the task."""
+    def walk(path, node):
+        if any(_number(v) for v in node.values()):
+            stage, task = path[0], '/'.join(path[1:])
+            for metric, value in node.items():
+                if metric != 'n' and _number(value):
+                    yield 'n', task, stage, metric, float(value), node.get('n')
+        for key, child in node.items():
+            if isinstance(child, dict):
+                yield from walk(path + [key], child)
+
+    for stage, node in res.items():
+        if stage != DIAGNOSTICS_KEY and isinstance(node, dict):
+            yield from walk([stage], node)
+
+
+def model_rows(entry):
+    """Rows of one collect_all_metrics entry ({d: {task: res}, f: ..., n: {only: res}})."""
+    for dim in ('d', 'f'):
+        for task, res in entry.get(dim, {}).items():
+            yield from scorer_rows(dim, task, res)
+    for res in entry.get('n', {}).values():
+        yield from n_rows(res)
+
+
+def build_entry(rows):
+    """Inverse of model_rows: the collect_all_metrics entry of (dim, task, variation, metric, value, n) rows."""
+    entry = {'d': {}, 'f': {}, 'n': {}}
+    for dim, task, var, metric, value, n in rows:
+        if dim == 'n':
+            node = entry['n'].setdefault('only', {}).setdefault(var, {})
+            for key in task.split('/'):
+                node = node.setdefault(key, {})
+            if n is not None:
+                node['n'] = n
+        else:
+            node = entry[dim].setdefault(task, {}).setdefault(var, {})
+        node[metric] = value
+    return entry
+
+
+class ResultsDB:
+    def __init__(self, path=DEFAULT_DB):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _latest(self, model, dim, task):
+        rows = self.conn.execute(
+            """SELECT variation, metric, value, n FROM results
+               WHERE model = ? AND dim = ? AND task = ? AND run_id = (
+                   SELECT u.run_id FROM results r JOIN runs u ON u.run_id = r.run_id
+                   WHERE r.model = ? AND r.dim = ? AND r.task = ? ORDER BY u.id DESC LIMIT 1)""",
+            (model, dim, task, model, dim, task)).fetchall()
+        return sorted(rows)
+
+    def add_rows(self, model, rows, run_id=None, source=None):
+        """
+        Append rows as one run of model; (dim, task) groups equal to their latest stored run are
+        skipped. Returns the run id, or None if nothing changed.
+        """
+        groups = {}
+        for dim, task, var, metric, value, n in rows:
+            groups.setdefault((dim, task), []).append((var, metric, value, n))
+        changed = [(key, g) for key, g in groups.items() if sorted(g) != self._latest(model, *key)]
+        if not changed:
+            return None
+        run_id = run_id or new_run_id()
+        with self.conn:
+            self.conn.execute('INSERT INTO runs (run_id, model, created_at, source) VALUES (?, ?, ?, ?)',
+                              (run_id, model, datetime.now().isoformat(timespec='seconds'), source))
+            self.conn.executemany(
+                'INSERT INTO results (model, run_id, dim, task, variation, metric, value, n) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(model, run_id, dim, task) + row for (dim, task), g in changed for row in g])
+        return run_id
+
+    def add_model(self, model, entry, run_id=None, source=None):
+        return self.add_rows(model, model_rows(entry), run_id, source)
+
+    def add_scorer_output(self, model, dim, task, res, run_id=None, source=None):
+        rows = n_rows(res) if dim == 'n' else scorer_rows(dim, task, res)
+        return self.add_rows(model, rows, run_id, source)
+
+    def models(self):
+        return [m for (m,) in self.conn.execute('SELECT DISTINCT model FROM runs ORDER BY model')]
+
+    def model_entry(self, model, run_id=None):
+        """
+        The collect_all_metrics entry of model: one run, or by default the latest run of each (dim, task).
+        Keys keep the order of the scorer outputs, which calc_area.py relies on.
+        """
+        if run_id is not None:
+            rows = self.conn.execute(
+                'SELECT dim, task, variation, metric, value, n FROM results WHERE model = ? AND run_id = ? ORDER BY rowid',
+                (model, run_id))
+        else:
+            rows = self.conn.execute(
+                """SELECT r.dim, r.task, r.variation, r.metric, r.value, r.n
+                   FROM results r JOIN runs u ON u.run_id = r.run_id
+                   JOIN (SELECT r2.dim, r2.task, MAX(u2.id) AS id FROM results r2 JOIN runs u2 ON u2.run_id = r2.run_id
+                         WHERE r2.model = ? GROUP BY r2.dim, r2.task) l
+                     ON l.dim = r.dim AND l.task = r.task AND l.id = u.id
+                   WHERE r.model = ? ORDER BY r.rowid""", (model, model))
+        return build_entry(rows)
+
+    def load_models(self, models=None):
+        """{model: model_entry(model)}, like the collect_all_metrics files; models missing in the store are left out."""
+        known = self.models()
+        return {m: self.model_entry(m) for m in (known if models is None else models) if m in known}
+
+    def leaderboard(self, dim, task, metric, variation='all'):
+        """[(model, value, n, run_id)] of every model's latest run of (dim, task), best first."""
+        return self.conn.execute(
+            """SELECT r.model, r.value, r.n, r.run_id FROM results r JOIN runs u ON u.run_id = r.run_id
+               JOIN (SELECT r2.model, MAX(u2.id) AS id FROM results r2 JOIN runs u2 ON u2.run_id = r2.run_id
+                     WHERE r2.dim = ? AND r2.task = ? GROUP BY r2.model) l ON l.model = r.model AND l.id = u.id
+               WHERE r.dim = ? AND r.task = ? AND r.variation = ? AND r.metric = ?
+               ORDER BY r.value """ + ('ASC' if metric in LOWER_IS_BETTER else 'DESC'),
+            (dim, task, dim, task, variation, metric)).fetchall()
+
+    def history(self, model, dim, task, metric, variation='all'):
+        """[(created_at, run_id, value, n)] of every run of model that scored (dim, task), oldest first."""
+        return self.conn.execute(
+            """SELECT u.created_at, r.run_id, r.value, r.n FROM results r JOIN runs u ON u.run_id = r.run_id
+               WHERE r.model = ? AND r.dim = ? AND r.task = ? AND r.variation = ? AND r.metric = ?
+               ORDER BY u.id""", (model, dim, task, variation, metric)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Results store of all models and runs.')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite file')
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('import', help='add every model of a collect_all_metrics JSON file')
+    p.add_argument('json_file')
+    p.add_argument('--run_id', default=None)
+    for name in ('leaderboard', 'history'):
+        p = sub.add_parser(name)
+        p.add_argument('--dim', required=True, choices=['d', 'f', 'n'])
+        p.add_argument('--task', required=True, help="d/f task, or e.g. '2-TASK/ASR' for n")
+        p.add_argument('--metric', required=True)
+        p.add_argument('--variation', default='all', help="variation, or the stage for n (e.g. 'single-stage')")
+        if name == 'history':
+            p.add_argument('--model', required=True)
+    args = parser.parse_args()
+
+    with ResultsDB(args.db) as db:
+        if args.cmd == 'import':
+            with open(args.json_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for model, entry in data.items():
+                run_id = db.add_model(model, entry, args.run_id and f'{args.run_id}-{model}', args.json_file)
+                print(f'{model}: {run_id or "unchanged"}')
+        elif args.cmd == 'leaderboard':
+            for model, value, n, run_id in db.leaderboard(args.dim, args.task, args.metric, args.variation):
+                print(f'{model}\t{value}\t{"" if n is None else n}\t{run_id}')
+        else:
+            for created_at, run_id, value, n in db.history(args.model, args.dim, args.task, args.metric, args.variation):
+                print(f'{created_at}\t{run_id}\t{value}\t{"" if n is None else n}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Run a model over an annotation file and write the result file the scorers read.
+
+Every instruction variation of every item is one job; jobs are sent in
+batches with asyncio, at most --concurrency batches at a time, to either an
+OpenAI-compatible server or a Python function. By default a batch holds
+every variation of one or more clips, so each audio file is decoded once
+(decoded clips stay in a small LRU). Answered jobs are appended
+to a progress file, so an interrupted run continues where it stopped, and
+every response goes to a response cache keyed by (model, audio sha256,
+instruction) that all runs share: jobs answered before, in this or in
+another dimension file, are not sent again, nor are duplicates in a run.
+With --shards N, the output is a directory of append-only NDJSON shards
+that grows item by item, with fsync'd checkpoints in manifest.json.
+With --live_every N, finished items are scored N at a time while the run
+goes on (<output>.live.json), and --abort_ifr stops a run whose IFR on
+the default instruction stays near 0. --ci_width W makes the sampling
+adaptive: items go in random order and a variation is no longer sent once
+its IFR confidence interval is at most W points wide.
+
+Usage:
+  python run_inference.py ../data/d/IEMOCAP_Session5_emotion.json --dim d \\
+      --output egs/my_model/d/my_model_ser_results.json \\
+      --base_url http://localhost:8000/v1 --model my_model
+  python run_inference.py ../data/f/AudioCaps_AAC_test.json --dim f \\
+      --output egs/my_model/f/my_model_aac_results.json --callable my_model.py:answer
+"""
+import argparse
+import json
+import os
+import sys
+
+from inference import CallableBackend, OpenAIBackend, ResponseCache, run
+from inference.backends import load_callable
+from inference.cache import DEFAULT_CACHE
+from inference.live import BOUNDS, LiveScorer
+from metric import TASK_SCORERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Answer every instruction variation of an annotation file with a model.')
+    parser.add_argument('annotation', help='annotation file (data/d/*.json, data/f/*.json, ...)')
+    parser.add_argument('--dim', required=True, choices=['d', 'f', 'n'], help='dimension, decides the result layout')
+    parser.add_argument('--output', required=True, help='result file to write (a directory with --shards)')
+    parser.add_argument('--base_url', help='OpenAI-compatible server, e.g. http://localhost:8000/v1')
+    parser.add_argument('--model', help='model name sent to the server')
+    parser.add_argument('--api_key', default=None, help='default: $OPENAI_API_KEY')
+    parser.add_argument('--max_tokens', type=int, default=512)
+    parser.add_argument('--timeout', type=float, default=300.0, help='seconds per request')
+    parser.add_argument('--callable', help="python function instead of a server: 'module:function' or 'file.py:function', called as fn(audio_path, instruction)")
+    parser.add_argument('--batched', action='store_true', help='the function takes a list of (audio, instruction) and returns a list')
+    parser.add_argument('--multi_prompt', action='store_true', help='the function takes (audio, [instruction, ...]) of one clip and returns a list')
+    parser.add_argument('--prefix_prompt', action='store_true', help='the function takes (audio, shared prefix, [rest of each instruction, ...]) and returns a list; implies --prefix_sharing')
+    parser.add_argument('--decode', help="'module:function' turning an audio path into what the function gets as audio (waveform, features)")
+    parser.add_argument('--audio_cache', type=int, default=32, help='decoded clips kept in memory')
+    parser.add_argument('--no_audio_major', action='store_true', help='do not batch the variations of a clip together')
+    parser.add_argument('--prefix_sharing', action='store_true',
+                        help='group the variations of a clip by shared instruction prefix, for backends with prefix / KV caching')
+    parser.add_argument('--concurrency', type=int, default=8, help='batches in flight (and HTTP requests in flight)')
+    parser.add_argument('--batch_size', type=int, default=1, help='jobs per backend call')
+    parser.add_argument('--retries', type=int, default=3, help='retries of a failed batch')
+    parser.add_argument('--progress', default=None, help='progress file (default: <output>.progress.jsonl)')
+    parser.add_argument('--response_cache', default=DEFAULT_CACHE, help='responses by (model, audio sha256, instruction), shared by all runs')
+    parser.add_argument('--cache_key', default=None, help='model name in the response cache (default: --model, or the --callable spec); change it when the model changes')
+    parser.add_argument('--no_response_cache', action='store_true')
+    parser.add_argument('--shards', type=int, default=0, metavar='N',
+                        help='write --output as a directory of NDJSON shards of N items, appended as items finish (the scorers read it directly)')
+    parser.add_argument('--fsync_every', type=int, default=50, help='items between checkpoints of the shards')
+    parser.add_argument('--live_every', type=int, default=0, metavar='N',
+                        help='score finished items while the run goes on, N at a time, into <output>.live.json (0 = off)')
+    parser.add_argument('--task', choices=list(TASK_SCORERS), help='task of a d/f file, picks the scorer of --live_every')
+    parser.add_argument('--abort_ifr', type=float, default=None,
+                        help='stop sending once the live IFR of --abort_variation is at most this (percent)')
+    parser.add_argument('--abort_variation', default='default')
+    parser.add_argument('--abort_min_items', type=int, default=200, help='items scored before --abort_ifr can stop the run')
+    parser.add_argument('--ci_width', type=float, default=None,
+                        help='adaptive sampling: answer items in random order and stop a variation once its IFR interval is at most this many points wide (needs --live_every)')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence of the --ci_width interval')
+    parser.add_argument('--bound', choices=BOUNDS, default='wilson', help='interval of --ci_width')
+    parser.add_argument('--min_n', type=int, default=30, help='items of a variation before --ci_width can stop it')
+    parser.add_argument('--seed', type=int, default=0, help='item order of --ci_width')
+    parser.add_argument('--start', type=int, default=0, help='skip the first N items (with --limit: one worker\'s range of items)')
+    parser.add_argument('--limit', type=int, default=None, help='only the first N items (from --start)')
+    args = parser.parse_args()
+    if args.start < 0 or (args.limit is not None and args.limit < 0):
+        parser.error('--start and --limit cannot be negative')
+
+    if args.callable:
+        decode = load_callable(args.decode) if args.decode else None
+        backend = CallableBackend(load_callable(args.callable), args.batched, args.multi_prompt, decode, args.audio_cache,
+                                  args.prefix_prompt)
+    elif args.base_url and args.model:
+        backend = OpenAIBackend(args.base_url, args.model, args.api_key, args.timeout, args.max_tokens,
+                                cache_size=args.audio_cache, max_requests=args.concurrency)
+    else:
+        parser.error('give --callable, or --base_url and --model')
+
+    live = None
+    if args.live_every:
+        if args.dim != 'n' and not args.task:
+            parser.error('--live_every needs --task for a d/f file')
+        live_path = os.path.join(args.output, 'live.json') if args.shards else args.output + '.live.json'
+        if os.path.dirname(live_path):
+            os.makedirs(os.path.dirname(live_path), exist_ok=True)
+        live = LiveScorer(live_path, args.dim, args.task if args.dim != 'n' else None, args.live_every,
+                          args.abort_variation, args.abort_ifr, args.abort_min_items,
+                          args.ci_width, args.confidence, args.bound, args.min_n)
+    elif args.abort_ifr is not None or args.ci_width is not None:
+        parser.error('--abort_ifr and --ci_width need --live_every')
+
+    cache = None
+    if not args.no_response_cache:
+        cache = ResponseCache(args.response_cache, args.cache_key or args.model or args.callable)
+    try:
+        summary = run(args.annotation, args.dim, backend, args.output, args.progress, args.concurrency,
+                      args.batch_size, args.retries, args.limit, not args.no_audio_major, cache,
+                      args.shards, args.fsync_every, args.prefix_sharing or args.prefix_prompt,
+                      live, args.seed if args.ci_width is not None else None, args.start)
+    finally:
+        if cache:
+            cache.close()
+    print(json.dumps(summary))
+    sys.exit(1 if summary['failed'] or summary.get('aborted') else 0)
+
+
+if __name__ == '__main__':
+    main()